@@ -0,0 +1,72 @@
+import json
+import math as m
+import platform
+import time
+
+def percentile(sorted_values, q):
+    '''
+    Returns the q-th percentile (0 <= q <= 100) of a sorted list, using the
+    nearest rank.
+    '''
+    if len(sorted_values) == 0:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1,
+        m.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def measure(fn, repeat=50, warmup=3):
+    '''
+    Calls fn repeat times (after warmup calls that aren't timed) and returns
+    a dictionary with its throughput and latency percentiles in seconds.
+    If fn raises, the error is recorded instead.
+    '''
+    try:
+        for i in range(warmup):
+            fn()
+        latencies = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'count': repeat,
+        'total': total,
+        'per_sec': repeat / total if total > 0 else float('inf'),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1],
+    }
+
+def label(name, **params):
+    '''
+    Returns a benchmark name such as gen_linear[types=i,num_lhs_terms=2].
+    '''
+    if len(params) == 0:
+        return name
+    return name + '[' + ','.join('%s=%s' % (k, params[k])
+        for k in sorted(params)) + ']'
+
+def environment():
+    '''
+    Returns a description of the machine and library versions.
+    '''
+    import sympy
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sympy': sympy.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def save(results, fn):
+    with open(fn, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(fn):
+    with open(fn) as f:
+        return json.load(f)
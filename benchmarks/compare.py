@@ -0,0 +1,63 @@
+'''
+Compares two benchmark result files written by benchmarks.run and flags
+regressions. Exits with status 1 if any benchmark regressed.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.15
+'''
+import argparse
+import sys
+
+from benchmarks.common import load
+
+def compare(baseline, current, threshold):
+    '''
+    Returns a list of (name, baseline per_sec, current per_sec, ratio, status)
+    tuples for every benchmark in both result sets. status is 'REGRESSION'
+    when throughput dropped or median latency rose by more than threshold,
+    'improved' when throughput rose by more than threshold, 'error' when
+    the current run failed but the baseline didn't, and '' otherwise.
+    Benchmarks that failed in both runs are skipped.
+    '''
+    rows = []
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        new = current[name]
+        if 'error' in old:
+            # Nothing to compare with, whether the current run failed or not
+            continue
+        if 'error' in new:
+            rows.append((name, old['per_sec'], 0, 0, 'error'))
+            continue
+        ratio = new['per_sec'] / old['per_sec']
+        if ratio < 1 - threshold or new['p50'] > old['p50'] * (1 + threshold):
+            status = 'REGRESSION'
+        elif ratio > 1 + threshold:
+            status = 'improved'
+        else:
+            status = ''
+        rows.append((name, old['per_sec'], new['per_sec'], ratio, status))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare benchmark results.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.15,
+            help='relative change treated as significant (default 0.15)')
+    args = parser.parse_args(argv)
+
+    rows = compare(load(args.baseline)['results'], load(args.current)['results'],
+            args.threshold)
+    regressions = 0
+    for name, old, new, ratio, status in rows:
+        print('%-70s %10.1f/s -> %10.1f/s  x%5.2f  %s' % (name, old, new, ratio,
+            status))
+        if status in ('REGRESSION', 'error'):
+            regressions += 1
+    print('%d benchmarks compared, %d regressions' % (len(rows), regressions))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
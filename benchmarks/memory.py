@@ -0,0 +1,109 @@
+'''
+Measures the memory used per problem by a large in-memory bank of rendered
+problems, for every way problemgen can hold one.
+
+Usage (from the repository root):
+
+    python -m benchmarks.memory --problems 100000 --output memory.json
+'''
+import problemgen.backend as backend
+import problemgen.columnar as columnar
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+
+from benchmarks.common import environment, save
+
+class DictProblem:
+    '''
+    A Problem as it was stored before Problem had __slots__, kept as a
+    reference point.
+    '''
+
+    def __init__(self, data):
+        self.latex_question = data[0]
+        self.latex_solution = data[1]
+        self.str_question = data[2]
+        self.str_solution = data[3]
+
+# Ways of holding a bank of rendered problems, built from an iterable of
+# 4-tuples of strings
+REPRESENTATIONS = {
+    'dict': lambda rows: [DictProblem(r) for r in rows],
+    'Problem': lambda rows: [backend.Problem(r) for r in rows],
+    'ProblemRecord': lambda rows: [backend.ProblemRecord(r) for r in rows],
+    'ColumnarProblems': columnar.ColumnarProblems,
+}
+
+def sample_fields(num_samples):
+    '''
+    Renders a few real problems to copy the shape of their strings from.
+    '''
+    gen = backend.Generator()
+    makers = [
+        lambda: gen.gen_algebraic_expression(num_terms=3, order=2),
+        lambda: gen.gen_linear(num_lhs_terms=3),
+        lambda: gen.gen_quadratic(max_lowest_term=6),
+    ]
+    samples = []
+    while len(samples) < num_samples:
+        try:
+            p = backend.Problem(random.choice(makers)())
+        except Exception:
+            continue
+        samples.append((p.latex_question, p.latex_solution, p.str_question,
+            p.str_solution))
+    return samples
+
+def make_fields(samples, n):
+    '''
+    Returns n distinct 4-tuples of strings shaped like the samples. Every
+    string is a new object, as it would be after rendering.
+    '''
+    fields = []
+    for i in range(n):
+        suffix = ' %d' % i
+        fields.append(tuple(f + suffix for f in samples[i % len(samples)]))
+    return fields
+
+def measure_memory(make_bank, fields):
+    '''
+    Returns the number of bytes allocated per problem to hold every entry
+    of fields in a bank made by make_bank, strings included.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    # Copying the strings, so that representations keeping them are charged
+    # for them and the others only for what they keep
+    bank = make_bank(tuple(''.join(f) for f in row) for row in fields)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del bank
+    return size / len(fields)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure bytes per problem.')
+    parser.add_argument('--problems', type=int, default=100000,
+            help='number of problems in the bank')
+    parser.add_argument('--output', default=None,
+            help='JSON file the results are written to')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    fields = make_fields(sample_fields(50), args.problems)
+    results = {}
+    for name, make_bank in REPRESENTATIONS.items():
+        results[name] = {'bytes_per_problem': measure_memory(make_bank,
+            fields)}
+        print('%-20s %8.1f bytes/problem' % (name,
+            results[name]['bytes_per_problem']), file=sys.stderr)
+    if args.output is not None:
+        save({'environment': environment(), 'problems': args.problems,
+            'results': results}, args.output)
+
+if __name__ == '__main__':
+    main()
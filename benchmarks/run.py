@@ -0,0 +1,206 @@
+'''
+Benchmarks every Generator.gen_* method over a grid of parameters, Problem
+rendering, ProblemContainer.add_* at increasing container sizes and
+Worksheet.make with pdflatex stubbed out.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+'''
+import problemgen.backend as backend
+import problemgen.container as container
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+
+from benchmarks.common import environment, label, measure, save
+from unittest import mock
+
+# Parameter grids for every Generator method. Every combination is measured.
+GENERATOR_GRIDS = {
+    'gen_numerical_expression': {
+        'types': ['i', 'f', 'r', 'ifr'],
+        'num_terms': [2, 4],
+        'op': ['+-', '+-*/'],
+    },
+    'gen_numerical_problem': {
+        'types': ['i', 'f', 'if'],
+        'num_terms': [2, 4],
+        'op': ['+-', '+-*/'],
+    },
+    'gen_algebraic_expression': {
+        'types': ['i', 'f', 'r'],
+        'order': [1, 2, 3],
+        'num_terms': [2, 4],
+    },
+    'gen_factorable_expression': {
+        'order': [2, 3],
+        'factor_order': [1, 2],
+        'leading_coeff': [False, True],
+    },
+    'gen_equation': {
+        'types': ['i', 'f'],
+        'order_lhs': [1, 2],
+        'num_lhs_terms': [2, 3],
+    },
+    'gen_linear': {
+        'types': ['i', 'f', 'r'],
+        'num_lhs_terms': [2, 3],
+    },
+    'gen_quadratic': {
+        'factorable': [True, False],
+        'solvable': [True, False],
+        'max_lowest_term': [4, 10],
+    },
+    'gen_system': {
+        'num_equations': [2, 3],
+        'symbols': ['xy', 'xyz'],
+    },
+    'gen_num_conv': {
+        'q_type': ['num', 'word', 'expand', 'sci'],
+        's_type': ['word', 'sci'],
+    },
+    'gen_frac_to_dec': {
+        'max_multiple': [1, 5],
+    },
+    'gen_dec_to_frac': {
+        'max_multiple': [1, 5],
+    },
+}
+
+# Data rendered into Problems in the rendering benchmark
+RENDER_CASES = {
+    'numerical': lambda g: g.gen_numerical_expression(num_terms=4, types='ifr',
+        op='+-*/'),
+    'algebraic': lambda g: g.gen_algebraic_expression(num_terms=4, order=2),
+    'factorable': lambda g: g.gen_factorable_expression(order=2,
+        leading_coeff=True),
+    'linear': lambda g: g.gen_linear(num_lhs_terms=3),
+    'inequality': lambda g: g.gen_linear(num_lhs_terms=3, middle_sign='>'),
+    'quadratic': lambda g: g.gen_quadratic(max_lowest_term=6),
+    'system': lambda g: g.gen_system(),
+}
+
+CONTAINER_SIZES = [100, 1000, 5000]
+
+def valid(params):
+    '''
+    Returns False for the combinations of a grid the generators don't
+    support, e.g. a system with more equations than variables.
+    '''
+    if 'num_equations' in params and 'symbols' in params:
+        return params['num_equations'] <= len(params['symbols'])
+    return True
+
+def grid(params):
+    '''
+    Yields every valid combination of a parameter grid as a dictionary.
+    '''
+    names = sorted(params)
+    for values in itertools.product(*[params[n] for n in names]):
+        combination = dict(zip(names, values))
+        if valid(combination):
+            yield combination
+
+def bench_generators(results, repeat):
+    gen = backend.Generator()
+    for method, params in GENERATOR_GRIDS.items():
+        fn = getattr(gen, method)
+        for p in grid(params):
+            name = label(method, **p)
+            results[name] = measure(lambda: fn(**p), repeat=repeat)
+            print_result(name, results[name])
+
+def bench_rendering(results, repeat):
+    gen = backend.Generator()
+    for case, make in RENDER_CASES.items():
+        try:
+            data = [make(gen) for i in range(repeat)]
+        except Exception as e:
+            results[label('Problem', data=case)] = {'error': str(e)}
+            continue
+        it = iter(data)
+        name = label('Problem', data=case)
+        results[name] = measure(lambda: backend.Problem(next(it)),
+                repeat=repeat, warmup=0)
+        print_result(name, results[name])
+
+def bench_container(results, repeat):
+    # Adding already rendered problems isolates the cost of the dedupe check
+    for size in CONTAINER_SIZES:
+        c = container.ProblemContainer()
+        for i in range(size):
+            c.add_problem(backend.Problem(('q%d' % i, 's', 'q%d' % i, 's')))
+        counter = itertools.count(size)
+        def add():
+            i = next(counter)
+            c.add_problem(backend.Problem(('q%d' % i, 's', 'q%d' % i, 's')))
+        name = label('ProblemContainer.add_problem', size=size)
+        results[name] = measure(add, repeat=repeat * 10)
+        print_result(name, results[name])
+    # Full add_* calls, including generation and rendering
+    for size in CONTAINER_SIZES[:2]:
+        c = container.ProblemContainer()
+        for i in range(size):
+            c.add_problem(backend.Problem(('q%d' % i, 's', 'q%d' % i, 's')))
+        name = label('ProblemContainer.add_linear', size=size)
+        results[name] = measure(lambda: c.add_linear(num_lhs_terms=3),
+                repeat=repeat)
+        print_result(name, results[name])
+
+def bench_worksheet(results, repeat):
+    for num_problems in [25, 100]:
+        w = container.Worksheet('bench.tex')
+        w.set_title('Benchmark')
+        for i in range(num_problems):
+            w.add_quadratic(max_lowest_term=6, leading_coeff=True)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(container.os, 'system', return_value=0):
+            os.chdir(tmp)
+            try:
+                name = label('Worksheet.make', problems=num_problems)
+                results[name] = measure(w.make, repeat=repeat)
+                print_result(name, results[name])
+            finally:
+                os.chdir(cwd)
+
+def print_result(name, result):
+    if 'error' in result:
+        print('%-70s ERROR %s' % (name, result['error']), file=sys.stderr)
+    else:
+        print('%-70s %10.1f/s  p50 %8.3fms  p99 %8.3fms' % (name,
+            result['per_sec'], result['p50'] * 1000, result['p99'] * 1000),
+            file=sys.stderr)
+
+SUITES = {
+    'generators': bench_generators,
+    'rendering': bench_rendering,
+    'container': bench_container,
+    'worksheet': bench_worksheet,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the problemgen benchmarks.')
+    parser.add_argument('--output', default='bench.json',
+            help='JSON file the results are written to')
+    parser.add_argument('--repeat', type=int, default=30,
+            help='number of timed calls per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+            help='suite to run (default: all of them)')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    results = {}
+    for suite in args.suite or sorted(SUITES):
+        SUITES[suite](results, args.repeat)
+    save({'environment': environment(), 'repeat': args.repeat,
+        'results': results}, args.output)
+
+if __name__ == '__main__':
+    main()
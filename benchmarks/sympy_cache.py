@@ -0,0 +1,133 @@
+'''
+Measures the resident memory of a long-running process generating problems,
+with and without clearing sympy's cache (see
+ProblemContainer.manage_sympy_cache). Every mode runs in its own process,
+since memory given back to the allocator doesn't always leave the process.
+
+Recent versions of sympy bound every cached function to SYMPY_CACHE_SIZE
+entries (1000 by default). Pass --sympy-cache-size none to measure an
+unbounded cache, as in older versions.
+
+Usage (from the repository root):
+
+    python -m benchmarks.sympy_cache --problems 100000 --output cache.json
+'''
+import problemgen.cache as cache
+import problemgen.container as container
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import environment, save
+
+# Problems generated in turn, like a worker building mixed worksheets
+KINDS = [
+    lambda c: c.add_numerical_expression(num_terms=3, types='if', op='+-*'),
+    lambda c: c.add_algebraic_expression(num_terms=3, order=2),
+    lambda c: c.add_linear(num_lhs_terms=3),
+    lambda c: c.add_quadratic(max_lowest_term=20),
+    lambda c: c.add_factorable_expression(order=2, max_lowest_term=20),
+    lambda c: c.add_system(num_equations=2, symbols='xy'),
+]
+
+# Settings of the sympy cache compared by the benchmark
+MODES = {
+    'unmanaged': None,
+    'every_1000': {'every': 1000},
+    'max_entries_5000': {'every': None, 'max_entries': 5000},
+}
+
+def run_mode(settings, problems, interval, seed):
+    '''
+    Generates problems in one container and returns a list of samples
+    {'problems', 'seconds', 'rss', 'sympy_cache_entries'} taken every
+    interval problems. The problems are dropped at every sample, like a
+    worker starting a new worksheet, so that the memory held by the
+    problems themselves doesn't hide the cache.
+    '''
+    random.seed(seed)
+    c = container.ProblemContainer()
+    if settings is not None:
+        c.manage_sympy_cache(**settings)
+    samples = []
+    start = time.perf_counter()
+    for i in range(problems):
+        KINDS[i % len(KINDS)](c)
+        if (i + 1) % interval == 0:
+            c.clear_problems()
+            samples.append({
+                'problems': i + 1,
+                'seconds': time.perf_counter() - start,
+                'rss': cache.resident_memory(),
+                'sympy_cache_entries': cache.sympy_cache_entries(),
+            })
+    return samples
+
+def summarize(samples):
+    '''
+    Returns the growth of the resident memory over the second half of the
+    run (after the caches have warmed up) and its peak.
+    '''
+    rss = [s['rss'] for s in samples if s['rss'] is not None]
+    if len(rss) == 0:
+        return {}
+    half = rss[len(rss) // 2:]
+    return {
+        'peak_rss': max(rss),
+        'final_rss': rss[-1],
+        'rss_growth_second_half': half[-1] - half[0],
+        'problems_per_sec': samples[-1]['problems'] / samples[-1]['seconds'],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Measure memory over a long generation run.')
+    parser.add_argument('--problems', type=int, default=100000,
+            help='number of problems generated in every mode')
+    parser.add_argument('--interval', type=int, default=1000,
+            help='number of problems between two samples')
+    parser.add_argument('--output', default=None,
+            help='JSON file the results are written to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sympy-cache-size', default=None,
+            help='SYMPY_CACHE_SIZE of the processes running the modes, '
+            'e.g. none for an unbounded cache')
+    parser.add_argument('--mode', default=None, choices=sorted(MODES),
+            help='run a single mode in this process and print its samples')
+    args = parser.parse_args(argv)
+
+    if args.mode is not None:
+        samples = run_mode(MODES[args.mode], args.problems, args.interval,
+                args.seed)
+        print(json.dumps(samples))
+        return
+
+    env = dict(os.environ)
+    if args.sympy_cache_size is not None:
+        env['SYMPY_CACHE_SIZE'] = args.sympy_cache_size
+    results = {}
+    for mode in MODES:
+        out = subprocess.check_output([sys.executable, '-m',
+            'benchmarks.sympy_cache', '--mode', mode,
+            '--problems', str(args.problems),
+            '--interval', str(args.interval), '--seed', str(args.seed)],
+            env=env)
+        samples = json.loads(out.decode().splitlines()[-1])
+        results[mode] = {'summary': summarize(samples), 'samples': samples}
+        summary = results[mode]['summary']
+        if summary:
+            print('%-20s peak %7.1f MB, growth over 2nd half %+7.1f MB, '
+                    '%6.0f problems/s' % (mode, summary['peak_rss'] / 2**20,
+                    summary['rss_growth_second_half'] / 2**20,
+                    summary['problems_per_sec']), file=sys.stderr)
+    if args.output is not None:
+        save({'environment': environment(), 'problems': args.problems,
+            'sympy_cache_size': args.sympy_cache_size, 'results': results},
+            args.output)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 
+import problemgen.render as render
+import problemgen.sampler as sampler
 import random
 import os
 import math as m
@@ -6,10 +8,14 @@ import pdb
 import sys
 import linecache
 import inflect
+import itertools
+import struct
+import functools
 
 from sympy import *
 from sympy.solvers.inequalities import solve_poly_inequalities
 from sympy.solvers.solveset import linsolve
+from fractions import Fraction
 
 # From Apogentus on stackexchange
 def PrintException():
@@ -36,6 +42,7 @@ class Number:
                         e.g. (4.2, 1) to represent 42 = 4.2 * 10^1
     base            -   base to store the number in.
     '''
+    __slots__ = ['num', 'base', 'word', 'expanded', 'scientific']
 
     def __init__(self, num):
         '''
@@ -121,46 +128,170 @@ class Term:
     str_term :      A form of the term formatted as a Python string.
     expand :        Determines if any operations between this term and
                     another should expand fully.
+
+    Terms are never changed once created, so that make_term can share the
+    Terms of common atoms.
     '''
+    __slots__ = ['sympy_term', 'latex_term', 'str_term']
 
     def __init__(self, sympy_term, expand=True):
         '''
         Takes one Sympy expression as input to initalize the term.
         '''
         self.sympy_term = sympy_term
-        self.latex_term = latex(self.sympy_term)
-        self.str_term = str(self.sympy_term)
+        # The common forms are printed without sympy's printers
+        forms = render.render(sympy_term)
+        if forms is None:
+            self.latex_term = print_latex(self.sympy_term)
+            self.str_term = print_str(self.sympy_term)
+        else:
+            self.str_term, self.latex_term = forms
 
     # Overloaded operators
 
     def __add__(self, other):
         if not expand:
-            return Term(self.sympy_term + other.sympy_term)
-        return Term(expand(self.sympy_term + other.sympy_term))
+            return make_term(self.sympy_term + other.sympy_term)
+        return make_term(expand(self.sympy_term + other.sympy_term))
 
     def __sub__(self, other):
         if not expand:
-            return Term(self.sympy_term - other.sympy_term)
-        return Term(expand(self.sympy_term - other.sympy_term))
+            return make_term(self.sympy_term - other.sympy_term)
+        return make_term(expand(self.sympy_term - other.sympy_term))
 
     def __mul__(self, other):
         if not expand:
-            return Term(self.sympy_term * other.sympy_term)
-        return Term(expand(self.sympy_term * other.sympy_term))
+            return make_term(self.sympy_term * other.sympy_term)
+        return make_term(expand(self.sympy_term * other.sympy_term))
 
     def __truediv__(self, other):
         if not expand:
-            return Term(self.sympy_term / other.sympy_term)
-        return Term(expand(self.sympy_term / other.sympy_term))
+            return make_term(self.sympy_term / other.sympy_term)
+        return make_term(expand(self.sympy_term / other.sympy_term))
 
     def __pow__(self, other):
         if not expand:
-            return Term(self.sympy_term ** other.sympy_term)
-        return Term(expand(self.sympy_term ** other.sympy_term))
+            return make_term(self.sympy_term ** other.sympy_term)
+        return make_term(expand(self.sympy_term ** other.sympy_term))
 
     def __str__(self):
         return self.str_term
 
+# Largest absolute value of the integers, and of the denominators of the
+# unit fractions, whose Terms make_term shares
+MAX_INTERNED_INTEGER = 1000
+# Highest power of a Symbol whose Terms make_term shares
+MAX_INTERNED_ORDER = 10
+# Names of the Symbols whose monomials make_term shares
+INTERNED_SYMBOLS = frozenset('abcdefghijklmnopqrstuvwxyz')
+# Largest number of Terms make_term shares. Once it is reached, new atoms
+# get their own Term, so the table stays bounded in long-running processes.
+MAX_INTERNED_TERMS = 20000
+# (type, sympy term) -> shared Term, see make_term
+INTERNED_TERMS = {}
+
+def is_common_atom(sympy_term):
+    '''
+    Returns True if sympy_term is a small integer, a unit fraction with a
+    small denominator, a single letter Symbol, or a small integer multiple
+    of a low power of one.
+    '''
+    if type(sympy_term) is int:
+        return abs(sympy_term) <= MAX_INTERNED_INTEGER
+    if not isinstance(sympy_term, Basic):
+        return False
+    if sympy_term.is_Integer:
+        return abs(sympy_term.p) <= MAX_INTERNED_INTEGER
+    if sympy_term.is_Rational:
+        return abs(sympy_term.p) == 1 and sympy_term.q <= MAX_INTERNED_INTEGER
+    if sympy_term.is_Mul:
+        coefficient = sympy_term.args[0]
+        if len(sympy_term.args) != 2 or not coefficient.is_Integer or \
+                abs(coefficient.p) > MAX_INTERNED_INTEGER:
+            return False
+        sympy_term = sympy_term.args[1]
+    if sympy_term.is_Pow:
+        if not sympy_term.exp.is_Integer or \
+                not 1 < sympy_term.exp.p <= MAX_INTERNED_ORDER:
+            return False
+        sympy_term = sympy_term.base
+    return sympy_term.is_Symbol and sympy_term.name in INTERNED_SYMBOLS
+
+def make_term(sympy_term):
+    '''
+    Returns a Term of sympy_term. The Terms of common atoms (see
+    is_common_atom) are created and printed once, then shared: every call
+    with an equal atom of the same type returns the same instance, up to
+    MAX_INTERNED_TERMS shared Terms. Other terms get a new Term.
+    '''
+    if not is_common_atom(sympy_term):
+        return Term(sympy_term)
+    key = (type(sympy_term), sympy_term)
+    term = INTERNED_TERMS.get(key)
+    if term is None:
+        term = Term(sympy_term)
+        if len(INTERNED_TERMS) < MAX_INTERNED_TERMS:
+            INTERNED_TERMS[key] = term
+    return term
+
+# Number of printed sympy terms kept by print_latex and print_str
+PRINT_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=PRINT_CACHE_SIZE, typed=True)
+def cached_latex(sympy_term):
+    return latex(sympy_term)
+
+@functools.lru_cache(maxsize=PRINT_CACHE_SIZE, typed=True)
+def cached_str(sympy_term):
+    return str(sympy_term)
+
+def print_latex(sympy_term):
+    '''
+    latex(sympy_term), remembering the PRINT_CACHE_SIZE most recently
+    printed terms. Equal terms of the same type always print the same.
+    '''
+    try:
+        return cached_latex(sympy_term)
+    except TypeError:
+        # Not hashable
+        return latex(sympy_term)
+
+def print_str(sympy_term):
+    '''
+    str(sympy_term), remembering the PRINT_CACHE_SIZE most recently printed
+    terms.
+    '''
+    try:
+        return cached_str(sympy_term)
+    except TypeError:
+        # Not hashable
+        return str(sympy_term)
+
+def print_cache_info():
+    '''
+    Returns the state of the printing caches of print_latex and print_str
+    as a dictionary: {'latex': {...}, 'str': {...}}, each holding hits,
+    misses, size, maxsize and hit_rate.
+    '''
+    info = {}
+    for name, cache in (('latex', cached_latex), ('str', cached_str)):
+        hits, misses, maxsize, size = cache.cache_info()
+        info[name] = {
+            'hits': hits,
+            'misses': misses,
+            'size': size,
+            'maxsize': maxsize,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
+    return info
+
+def clear_print_cache():
+    '''
+    Empties the printing caches of print_latex and print_str.
+    '''
+    cached_latex.cache_clear()
+    cached_str.cache_clear()
+
 class FracTerm(Term):
     '''
     Object inherited from Terms designed to store a fractional term with
@@ -173,10 +304,22 @@ class FracTerm(Term):
     str_term        -   A form of the term formatted as a Python string.
     numerator       -   An expression representing the numerator of the fraction
     denominator     -   An expression representing the denominator of the fraction
+    unreduced_numerator
+                    -   The numerator as it was given, before normalization.
+    unreduced_denominator
+                    -   The denominator as it was given, before normalization.
+    normalize       -   Determines if the numerator and denominator are kept as
+                        reduced polynomials with their common factors cancelled.
+                        Operations between FracTerms keep normalizing if either
+                        of them does, so chained operations don't grow the
+                        numerator and denominator.
     expand          -   Determines if any operations between this FracTerm and
                         another should expand fully.
     '''
-    def __init__(self, numerator, denominator, expand=True):
+    __slots__ = ['numerator', 'denominator', 'unreduced_numerator',
+            'unreduced_denominator', 'normalize']
+
+    def __init__(self, numerator, denominator, expand=True, normalize=False):
         '''
         Initializes the FracTerm.
 
@@ -188,57 +331,77 @@ class FracTerm(Term):
                         Expression.
         expand      -   Determines if any operations between this FracTerm and
                         another should expand fully.
+        normalize   -   Determines if common factors of the numerator and
+                        denominator should be cancelled. The numerator and
+                        denominator given are kept in unreduced_numerator and
+                        unreduced_denominator for display.
         '''
         if isinstance(numerator, Term):
-            self.numerator = Expression([numerator], [numerator], [])
+            self.numerator = Expression([numerator], [numerator], ['', ''])
         elif isinstance(numerator, Expression):
             self.numerator = numerator
         if isinstance(denominator, Term):
-            self.denominator = Expression([denominator], [denominator], [])
+            self.denominator = Expression([denominator], [denominator], ['', ''])
         elif isinstance(denominator, Expression):
             self.denominator = denominator
+        self.unreduced_numerator = self.numerator
+        self.unreduced_denominator = self.denominator
+        self.normalize = normalize
+        if normalize:
+            # Cancelling the GCD, leaving expanded polynomials
+            n, d = fraction(cancel(self.numerator.get_sympy() /
+                self.denominator.get_sympy()))
+            n = make_term(n)
+            d = make_term(d)
+            self.numerator = Expression([n], [n], ['', ''])
+            self.denominator = Expression([d], [d], ['', ''])
         self.sympy_term = self.numerator.get_sympy() / self.denominator.get_sympy()
-        self.latex_term = "\\frac{%s}{%s}" % (latex(self.numerator.get_sympy()),
-                latex(self.denominator.get_sympy()))
-        self.str_term = str(self.sympy_term)
+        self.latex_term = "\\frac{%s}{%s}" % (
+                print_latex(self.numerator.get_sympy()),
+                print_latex(self.denominator.get_sympy()))
+        self.str_term = print_str(self.sympy_term)
 
     def __add__(self, other):
         if isinstance(other, FracTerm):
             new_numerator = self.numerator * other.denominator + \
                 other.numerator * self.denominator
             new_denominator = self.denominator * other.denominator
-            return FracTerm(new_numerator, new_denominator)
+            return FracTerm(new_numerator, new_denominator,
+                    normalize=self.normalize or other.normalize)
         elif isinstance(other, Term):
-            return self + FracTerm(other, Term(Rational(1,1)))
+            return self + FracTerm(other, make_term(Rational(1,1)))
 
     def __sub__(self, other):
         if isinstance(other, FracTerm):
             new_numerator = self.numerator * other.denominator - \
                 other.numerator * self.denominator
             new_denominator = self.denominator * other.denominator
-            return FracTerm(new_numerator, new_denominator)
+            return FracTerm(new_numerator, new_denominator,
+                    normalize=self.normalize or other.normalize)
         elif isinstance(other, Term):
-            return self - FracTerm(other, Term(Rational(1,1)))
+            return self - FracTerm(other, make_term(Rational(1,1)))
 
     def __mul__(self, other):
         if isinstance(other, FracTerm):
             new_numerator = self.numerator * other.numerator
             new_denominator = self.denominator * other.denominator
-            return FracTerm(new_numerator, new_denominator)
+            return FracTerm(new_numerator, new_denominator,
+                    normalize=self.normalize or other.normalize)
         elif isinstance(other, Term):
-            return self * FracTerm(other, Term(Rational(1,1)))
+            return self * FracTerm(other, make_term(Rational(1,1)))
 
     def __truediv__(self, other):
         if isinstance(other, FracTerm):
-            new_numerator = self.numerator * other.denomintor
+            new_numerator = self.numerator * other.denominator
             new_denominator = self.denominator * other.numerator
-            return FracTerm(new_numerator, new_denominator)
+            return FracTerm(new_numerator, new_denominator,
+                    normalize=self.normalize or other.normalize)
         elif isinstance(other, Term):
-            return self / FracTerm(other, Term(Rational(1,1)))
+            return self / FracTerm(other, make_term(Rational(1,1)))
 
     def __pow__(self, other):
         if isinstance(other, FracTerm) or isinstance(other, Term):
-            return Term(self.sympy_term)^Term(other.sympy_term)
+            return Term(self.sympy_term) ** Term(other.sympy_term)
 
 class Expression:
     '''
@@ -258,16 +421,50 @@ class Expression:
                         operation in this list corresponds to the first and
                         second terms in either of the terms lists, and so
                         forth. These operations are restricted to +-*/.
+
+    The three lists are shared between copies of an Expression and only
+    copied when the Expression itself changes them (copy-on-write), so they
+    must not be changed in place from outside: assign new lists instead.
+    Assigning them clears the cached result of get_sympy.
     '''
+    __slots__ = ['_unreduced_terms', '_reduced_terms', '_operations', '_sympy']
 
     def __init__(self, unreduced_terms, reduced_terms, operations):
         assert len(operations) == len(unreduced_terms) + 1
         assert len(unreduced_terms) == len(reduced_terms)
-        self.unreduced_terms = unreduced_terms[:]
-        self.reduced_terms = reduced_terms[:]
-        self.operations = operations
+        self._unreduced_terms = unreduced_terms
+        self._reduced_terms = reduced_terms
+        self._operations = operations
+        self._sympy = None
         self.zero_clean()
 
+    @property
+    def unreduced_terms(self):
+        return self._unreduced_terms
+
+    @unreduced_terms.setter
+    def unreduced_terms(self, terms):
+        self._unreduced_terms = terms
+        self._sympy = None
+
+    @property
+    def reduced_terms(self):
+        return self._reduced_terms
+
+    @reduced_terms.setter
+    def reduced_terms(self, terms):
+        self._reduced_terms = terms
+        self._sympy = None
+
+    @property
+    def operations(self):
+        return self._operations
+
+    @operations.setter
+    def operations(self, operations):
+        self._operations = operations
+        self._sympy = None
+
     def zero_clean(self):
         '''
         Deleting any terms that are zero in unreduced form unless it is the only term.
@@ -278,15 +475,26 @@ class Expression:
         '''
         if len(self.unreduced_terms) <= 1:
             return
-        for i in reversed(range(len(self.unreduced_terms))):
-            if self.unreduced_terms[i].sympy_term == 0:
-                del self.unreduced_terms[i]
-                del self.reduced_terms[i]
-                del self.operations[i]
+        zeros = [i for i in range(len(self.unreduced_terms))
+                if self.unreduced_terms[i].sympy_term == 0]
+        if len(zeros) == 0:
+            return
+        # The lists may be shared with other Expressions
+        unreduced_terms = self.unreduced_terms[:]
+        reduced_terms = self.reduced_terms[:]
+        operations = self.operations[:]
+        for i in reversed(zeros):
+            del unreduced_terms[i]
+            del reduced_terms[i]
+            del operations[i]
+        self.unreduced_terms = unreduced_terms
+        self.reduced_terms = reduced_terms
+        self.operations = operations
 
     def copy(self):
         '''
-        Returns a copy of the Expression.
+        Returns a copy of the Expression. The copy shares the lists of this
+        Expression until either of them changes them.
         '''
         return Expression(self.unreduced_terms, self.reduced_terms, self.operations)
 
@@ -306,11 +514,13 @@ class Expression:
     def get_sympy(self):
         '''
         Returns the sympy term that represents the reduced version of the
-        reduced terms.
+        reduced terms. The result is cached until the Expression changes.
         '''
-        e = self.copy()
-        e.simplify()
-        return e.reduced_terms[0].sympy_term
+        if self._sympy is None:
+            e = self.copy()
+            self._sympy = e.combine_terms(e.reduced_terms,
+                    e.operations).sympy_term
+        return self._sympy
 
     def combine_terms(self, terms, ops):
         '''
@@ -331,9 +541,13 @@ class Expression:
         '''
         # Copying lists to avoid strange bugs
         # hashtaghonestcomments hashtagthistookmeadaytofigureout
-        terms = terms[:]
-        ops = ops[:]
+        return self.combine_terms_in_place(terms[:], ops[:])
 
+    def combine_terms_in_place(self, terms, ops):
+        '''
+        Does the work of combine_terms, consuming the lists given rather
+        than copying them at every step of the recursion.
+        '''
         assert len(ops) == len(terms) + 1
 
         #########################
@@ -363,7 +577,7 @@ class Expression:
             # Now that the enclosed operation has been denoted, it can be
             # combined.
             new_ops = [''] + ops[left_most_locs[-1]+1:closest_loc] + ['']
-            new_term = self.combine_terms(terms[left_most_locs[-1]:closest_loc], new_ops)
+            new_term = self.combine_terms_in_place(terms[left_most_locs[-1]:closest_loc], new_ops)
             # Removing the enclosed operation and replacing it with the resulting term
             del ops[left_most_locs[-1] + 1: closest_loc]
             del terms[left_most_locs[-1] : closest_loc]
@@ -372,7 +586,7 @@ class Expression:
             # Removing enclosure marks
             ops[left_most_locs[-1]] = ops[left_most_locs[-1]].replace('(', '')
             ops[left_most_locs[-1]+1] = ops[left_most_locs[-1]+1].replace(')', '')
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
 
         #########################
         # Exponent case
@@ -385,7 +599,7 @@ class Expression:
             terms[caret_loc] = terms[caret_loc - 1] ** terms[caret_loc]
             del terms[caret_loc - 1]
             # Recursion is now ready.
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
 
         #########################
         # Multiplication/Division case
@@ -413,7 +627,7 @@ class Expression:
             # terms[mul_loc-1] can now be removed.
             del terms[mul_loc-1]
             # The recursion is now ready.
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
         if (mul_found and div_found and div_loc < mul_loc) or \
                 (div_found and not mul_found):
             # div is first
@@ -425,7 +639,7 @@ class Expression:
             # terms[div_loc-1] can now be removed.
             del terms[div_loc - 1]
             # The recursion is now ready.
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
 
         #########################
         # Addition/Subtraction case
@@ -453,7 +667,7 @@ class Expression:
             # terms[add_loc-1] can now be removed.
             del terms[add_loc-1]
             # The recursion is now ready.
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
         if (sub_found and add_found and sub_loc < add_loc) or \
                 (sub_found and not add_found):
             # sub is first
@@ -465,57 +679,47 @@ class Expression:
             # terms[sub_loc] can now be removed.
             del terms[sub_loc-1]
             # The recursion is now ready.
-            return self.combine_terms(terms, ops)
+            return self.combine_terms_in_place(terms, ops)
 
     # Overloaded operators
     def __str__(self):
         return str(Problem(self))
 
     def __add__(self, other):
-        unreduced_terms = self.unreduced_terms[:]
-        reduced_terms = self.reduced_terms[:]
-        unreduced_terms.extend(other.unreduced_terms)
-        reduced_terms.extend(other.reduced_terms)
+        unreduced_terms = self.unreduced_terms + other.unreduced_terms
+        reduced_terms = self.reduced_terms + other.reduced_terms
         # adding parentheticals to preserve order of operations
         ops = ['('] + self.operations[1:-1] + [')+('] + other.operations[1:-1] + \
                 [')']
         return Expression(unreduced_terms, reduced_terms, ops)
 
     def __sub__(self, other):
-        unreduced_terms = self.unreduced_terms[:]
-        reduced_terms = self.reduced_terms[:]
-        unreduced_terms.extend(other.unreduced_terms)
-        reduced_terms.extend(other.reduced_terms)
+        unreduced_terms = self.unreduced_terms + other.unreduced_terms
+        reduced_terms = self.reduced_terms + other.reduced_terms
         # adding parentheticals to preserve order of operations
         ops = ['('] + self.operations[1:-1] + [')-('] + other.operations[1:-1] + \
                 [')']
         return Expression(unreduced_terms, reduced_terms, ops)
 
     def __mul__(self, other):
-        unreduced_terms = self.unreduced_terms[:]
-        reduced_terms = self.reduced_terms[:]
-        unreduced_terms.extend(other.unreduced_terms)
-        reduced_terms.extend(other.reduced_terms)
+        unreduced_terms = self.unreduced_terms + other.unreduced_terms
+        reduced_terms = self.reduced_terms + other.reduced_terms
         # adding parentheticals to preserve order of operations
         ops = ['('] + self.operations[1:-1] + [')*('] + other.operations[1:-1] + \
                 [')']
         return Expression(unreduced_terms, reduced_terms, ops)
 
     def __truediv__(self, other):
-        unreduced_terms = self.unreduced_terms[:]
-        reduced_terms = self.reduced_terms[:]
-        unreduced_terms.extend(other.unreduced_terms)
-        reduced_terms.extend(other.reduced_terms)
+        unreduced_terms = self.unreduced_terms + other.unreduced_terms
+        reduced_terms = self.reduced_terms + other.reduced_terms
         # adding parentheticals to preserve order of operations
         ops = ['('] + self.operations[1:-1] + [')/('] + other.operations[1:-1] + \
                 [')']
         return Expression(unreduced_terms, reduced_terms, ops)
 
     def __pow__(self, other):
-        unreduced_terms = self.unreduced_terms[:]
-        reduced_terms = self.reduced_terms[:]
-        unreduced_terms.extend(other.unreduced_terms)
-        reduced_terms.extend(other.reduced_terms)
+        unreduced_terms = self.unreduced_terms + other.unreduced_terms
+        reduced_terms = self.reduced_terms + other.reduced_terms
         # adding parentheticals to preserve order of operations
         ops = ['('] + self.operations[1:-1] + [')^('] + other.operations[1:-1] + \
                 [')']
@@ -531,7 +735,11 @@ class Equation:
     middle_sign     -   The sign equating the lhs and rhs. Typically '=', but supports
                         inequalities.
     variable        -   The variable used in the equation.
+
+    The solutions are cached by solutions() until the sides, the sign or the
+    variable change.
     '''
+    __slots__ = ['lhs', 'rhs', 'middle_sign', 'variable', '_solutions']
 
     def __init__(self, lhs, rhs, variable='x', middle_sign='='):
         assert middle_sign == '=' or middle_sign == '>' or middle_sign == '<' or \
@@ -542,6 +750,34 @@ class Equation:
         self.rhs = rhs
         self.middle_sign = middle_sign
         self.variable = Symbol(variable)
+        self._solutions = None
+
+    def residual(self):
+        '''
+        Returns the sympy term lhs - rhs.
+        '''
+        return self.lhs.get_sympy() - self.rhs.get_sympy()
+
+    def solutions(self):
+        '''
+        Solves the equation. Returns the list of solutions given by solve
+        if middle_sign is '=', otherwise the list of Intervals given by
+        solve_poly_inequality.
+        '''
+        key = (self.lhs.get_sympy(), self.rhs.get_sympy(), self.middle_sign,
+                self.variable)
+        cached = self._solutions
+        if cached is None or cached[0][0] is not key[0] or \
+                cached[0][1] is not key[1] or cached[0][2:] != key[2:]:
+            residual = key[0] - key[1]
+            if self.middle_sign == '=':
+                solutions = solve(residual, self.variable)
+            else:
+                # This equation defines an inequality
+                solutions = solve_poly_inequality(Poly(residual,
+                    self.variable, domain='ZZ'), self.middle_sign)
+            cached = self._solutions = (key, solutions)
+        return cached[1]
 
 class System:
     '''
@@ -550,7 +786,10 @@ class System:
 
     equations       -   A list of Equations defining the system of equations.
     variables       -   A list of all the variables contained within the system.
+
+    The solutions are cached by solutions() until the equations change.
     '''
+    __slots__ = ['equations', 'variables', '_solutions']
 
     # TODO: add support for systems of inequalities
     def __init__(self, equations):
@@ -560,6 +799,24 @@ class System:
         elif isinstance(equations, Equation):
             self.equations = [equations]
         self.variables = [e.variable for e in equations]
+        self._solutions = None
+
+    def solutions(self):
+        '''
+        Solves the system with linsolve. Returns the set of solution
+        tuples, in the order of self.variables.
+        '''
+        key = [(e.lhs.get_sympy(), e.rhs.get_sympy()) for e in self.equations]
+        cached = self._solutions
+        if cached is None or len(cached[0]) != len(key) or \
+                any(a is not c or b is not d
+                    for (a, b), (c, d) in zip(key, cached[0])) or \
+                cached[1] != self.variables:
+            # Getting list of equations such that they are equal to 0
+            eqs = [(e.lhs - e.rhs).get_sympy() for e in self.equations]
+            solutions = linsolve(eqs, tuple(self.variables))
+            cached = self._solutions = (key, self.variables[:], solutions)
+        return cached[2]
 
 class Problem:
     '''
@@ -574,6 +831,8 @@ class Problem:
     str_question    :   The question formatted as a Python string.
     str_solution    :   The solution formatted as a Python string.
     '''
+    __slots__ = ['latex_question', 'latex_solution', 'str_question',
+            'str_solution']
 
     def __init__(self, data):
         '''
@@ -634,30 +893,26 @@ class Problem:
 
     def str_solution_from_system(self, s):
         str_solution = ''
-        # Getting list of equations such that they are equal to 0
-        eqs = [(e.lhs - e.rhs).get_sympy() for e in s.equations]
-        solutions = linsolve(eqs, tuple(s.variables))
+        solutions = s.solutions()
         if len(solutions) == 0:
             return 'No solution'
         # Iterating through solution
         for solution in solutions:
             for i, sol in enumerate(solution):
-                str_solution += str(s.variables[i]) +  ' = ' + str(sol) + ', '
+                str_solution += print_str(s.variables[i]) +  ' = ' + print_str(sol) + ', '
             str_solution = str_solution[:-1] # deleting last extra comma
             str_solution += '\n'
         return str_solution
 
     def latex_solution_from_system(self, s):
         latex_solution = ''
-        # Getting list of equations such that they are equal to 0
-        eqs = [(e.lhs - e.rhs).get_sympy() for e in s.equations]
-        solutions = linsolve(eqs, tuple(s.variables))
+        solutions = s.solutions()
         if len(solutions) == 0:
             return '\\text{No solution}'
         # Iterating through solution
         for solution in solutions:
             for i, sol in enumerate(solution):
-                latex_solution += latex(s.variables[i]) +  ' = ' + latex(sol) + ','
+                latex_solution += print_latex(s.variables[i]) +  ' = ' + print_latex(sol) + ','
             latex_solution = latex_solution[:-1] # deleting last extra comma
             latex_solution += '\\\\'
         return latex_solution
@@ -673,14 +928,7 @@ class Problem:
                 self.latex_question_from_expression(e.rhs)
 
     def str_solution_from_equation(self, e):
-        lhs_term = e.lhs.combine_terms(e.lhs.reduced_terms, e.lhs.operations).sympy_term
-        rhs_term = e.rhs.combine_terms(e.rhs.reduced_terms, e.rhs.operations).sympy_term
-        if e.middle_sign == '=':
-            solutions = solve(lhs_term - rhs_term, e.variable)
-        else:
-            # This equation defines an inequality
-            solutions = solve_poly_inequality(Poly(lhs_term - rhs_term,
-                e.variable, domain='ZZ'), e.middle_sign)
+        solutions = e.solutions()
 
         if len(solutions) == 0:
             # no solutions
@@ -689,29 +937,21 @@ class Problem:
         str_solution = ''
         if e.middle_sign == '=':
             for s in solutions:
-                str_solution += str(e.variable) + e.middle_sign + ' '  + str(s) + ', '
+                str_solution += print_str(e.variable) + e.middle_sign + ' '  + print_str(s) + ', '
             # Deleting last comma and space
             str_solution = str_solution[:-2]
         else:
             # Printing the interval notation appropriately
             # u220a is the element of symbol, u222a is the union symbol
-            str_solution = str(e.variable) + ' \u220a '
+            str_solution = print_str(e.variable) + ' \u220a '
             for s in solutions:
-               str_solution += str(s) + ' \u222a '
+               str_solution += print_str(s) + ' \u222a '
             str_solution = str_solution[:-3] # deleting last union symbol
 
         return str_solution
 
     def latex_solution_from_equation(self, e):
-        lhs_term = e.lhs.combine_terms(e.lhs.reduced_terms, e.lhs.operations).sympy_term
-        rhs_term = e.rhs.combine_terms(e.rhs.reduced_terms, e.rhs.operations).sympy_term
-        solutions = solve(lhs_term - rhs_term, e.variable)
-        if e.middle_sign == '=':
-            solutions = solve(lhs_term - rhs_term, e.variable)
-        else:
-            # This equation defines an inequality
-            solutions = solve_poly_inequality(Poly(lhs_term - rhs_term,
-                e.variable, domain='ZZ'), e.middle_sign)
+        solutions = e.solutions()
 
         if len(solutions) == 0:
             # no solutions
@@ -720,15 +960,15 @@ class Problem:
         latex_solution = ''
         if e.middle_sign == '=':
             for s in solutions:
-                latex_solution += latex(e.variable) + e.middle_sign + ' '  + latex(s) + ', '
+                latex_solution += print_latex(e.variable) + e.middle_sign + ' '  + print_latex(s) + ', '
             # Deleting last comma and space
             latex_solution = latex_solution[:-2]
         else:
             # Printing the interval notation appropriately
             # u220a is the element of symbol, u222a is the union symbol
-            latex_solution = latex(e.variable) + ' \\in '
+            latex_solution = print_latex(e.variable) + ' \\in '
             for s in solutions:
-               latex_solution += latex(s) + ' \\cup '
+               latex_solution += print_latex(s) + ' \\cup '
             latex_solution = latex_solution[:-6] # deleting last union symbol
         if latex_solution == '':
             return '\\text{ No solution }'
@@ -739,22 +979,9 @@ class Problem:
         Creates a latex string representing the question in question_terms
         and returns it.
         '''
-        # Adding each operation
-        latex_question = ''
-        for i in range(len(e.unreduced_terms)):
-            latex_question += \
-                    self.convert_op_to_latex(e.operations[i]) + \
-                    e.unreduced_terms[i].latex_term
-        # Adding final operation
-        latex_question += self.convert_op_to_latex(e.operations[-1])
-
-        # Culling repeated signs from question
-        latex_question = latex_question.replace('+-', '-')
-        latex_question = latex_question.replace('-+', '-')
-        latex_question = latex_question.replace('--', '+')
-        latex_question = latex_question.replace('++', '+')
-
-        return latex_question
+        # Adding each operation, culling repeated signs
+        return render.join([convert_op_to_latex(op) for op in e.operations],
+                [t.latex_term for t in e.unreduced_terms])
 
     def latex_solution_from_expression(self, e):
         '''
@@ -768,19 +995,9 @@ class Problem:
         Creates a Python string representing the question in question_terms
         and returns it.
         '''
-        # Adding each operation
-        str_question = ''
-        for i in range(len(e.unreduced_terms)):
-            str_question += \
-                    e.operations[i] + \
-                    e.unreduced_terms[i].str_term
-        # Adding final operation
-        str_question += e.operations[-1]
-        # Culling any doubled signs
-        str_question = str_question.replace('+-', '-')
-        str_question = str_question.replace('-+', '-')
-        str_question = str_question.replace('--', '+')
-        str_question = str_question.replace('++', '+')
+        # Adding each operation, culling any doubled signs
+        str_question = render.join(e.operations,
+                [t.str_term for t in e.unreduced_terms])
         # Culling addition or subtraction of 0
         # add this in, use regular expressions
 
@@ -799,19 +1016,210 @@ class Problem:
         latex equivalent. Returns the conversion or the input string (if it
         didn't satisfy the input parameters).
         '''
+        return convert_op_to_latex(op)
+
+def convert_op_to_latex(op):
+    '''
+    See Problem.convert_op_to_latex.
+    '''
+    if op == '*':
+        return '\\cdot '
+    elif op == '/':
+        return '\\div '
+    elif op == '>=':
+        return '\\geq '
+    elif op == '<=':
+        return '\\leq '
+    elif op == '!=':
+        return '\\neq '
+    else:
+        return op
+
+def reduced_radical(multiple, inner):
+    '''
+    Returns the sympy number multiple*sqrt(inner) for a square-free inner,
+    built directly instead of having sympy look for square factors of
+    inner. multiple can be an int or a Fraction.
+    '''
+    multiple = Rational(multiple.numerator, multiple.denominator)
+    if inner == 1:
+        return multiple
+    root = Pow(Integer(inner), S.Half, evaluate=False)
+    if multiple == 1:
+        return root
+    return Mul(multiple, root)
+
+class QuadraticSurd:
+    '''
+    Object designed to hold the exact number rational + radical*sqrt(root),
+    for a square-free root greater than 1, so that like radicals can be
+    combined with integer arithmetic instead of sympy (see
+    Generator.gen_numerical_problem). Supports +, - and * with ints,
+    Fractions and QuadraticSurds of the same root.
+
+    Member variables:
+
+    rational    -   the rational part, an int or a Fraction.
+    radical     -   the coefficient of sqrt(root), an int or a Fraction.
+    root        -   the square-free number under the radical.
+    '''
+    __slots__ = ['rational', 'radical', 'root']
+
+    def __init__(self, rational, radical, root):
+        self.rational = rational
+        self.radical = radical
+        self.root = root
+
+    def parts(self, other):
+        if isinstance(other, QuadraticSurd):
+            assert other.root == self.root
+            return other.rational, other.radical
+        return other, 0
+
+    def __add__(self, other):
+        rational, radical = self.parts(other)
+        return QuadraticSurd(self.rational + rational, self.radical + radical,
+                self.root)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        rational, radical = self.parts(other)
+        return QuadraticSurd(self.rational - rational, self.radical - radical,
+                self.root)
+
+    def __rsub__(self, other):
+        rational, radical = self.parts(other)
+        return QuadraticSurd(rational - self.rational, radical - self.radical,
+                self.root)
+
+    def __mul__(self, other):
+        rational, radical = self.parts(other)
+        return QuadraticSurd(
+                self.rational * rational + self.radical * radical * self.root,
+                self.rational * radical + self.radical * rational, self.root)
+
+    __rmul__ = __mul__
+
+    def to_sympy(self):
+        '''
+        Returns the equal sympy number.
+        '''
+        rational = Rational(self.rational.numerator, self.rational.denominator)
+        return rational + reduced_radical(self.radical, self.root)
+
+def evaluate_rational(values, operations):
+    '''
+    Evaluates a list of Fractions joined by the operations +-*/ (laid out
+    as in Expression.operations), multiplying and dividing first, left to
+    right, like Expression.combine_terms. QuadraticSurds work too, for the
+    operations +-*.
+    '''
+    # Multiplication and division
+    sums = [values[0]]
+    signs = ['+']
+    for value, op in zip(values[1:], operations[1:-1]):
         if op == '*':
-            return '\\cdot '
+            sums[-1] *= value
         elif op == '/':
-            return '\\div '
-        elif op == '>=':
-            return '\\geq '
-        elif op == '<=':
-            return '\\leq '
-        elif op == '!=':
-            return '\\neq '
+            sums[-1] /= value
         else:
-            return op
+            sums.append(value)
+            signs.append(op)
+    # Addition and subtraction
+    total = Fraction(0)
+    for value, sign in zip(sums, signs):
+        if sign == '+':
+            total += value
+        else:
+            total -= value
+    return total
+
+# A ProblemRecord starts with the byte lengths of the four strings of the
+# Problem (latex_question, latex_solution, str_question, str_solution),
+# followed by the UTF-8 encoded strings themselves.
+RECORD_HEADER = struct.Struct('<4I')
+
+class ProblemRecord:
+    '''
+    Compact, read-only form of a rendered Problem, for keeping large banks of
+    problems in memory. The four strings are kept UTF-8 encoded in a single
+    bytes object and decoded when they are accessed, which saves the
+    overhead of four str objects per problem.
+
+    This is also the record format of ProblemBank data files, so records can
+    be read from a bank without decoding them.
+
+    Member variables:
+
+    data            :   The encoded record (see RECORD_HEADER).
+    latex_question, latex_solution, str_question, str_solution
+                    :   Same as for Problem, decoded on access.
+    '''
+    __slots__ = ['data']
+
+    def __init__(self, data):
+        '''
+        Initializes the ProblemRecord.
+
+        Arguments:
+
+        data :      A Problem (or ProblemRecord), a tuple in the form
+                    (latex_question, latex_solution, str_question, str_solution),
+                    or an encoded record (bytes).
+        '''
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.data = bytes(data)
+            return
+        if isinstance(data, (Problem, ProblemRecord)):
+            data = (data.latex_question, data.latex_solution, data.str_question,
+                    data.str_solution)
+        fields = [f.encode('utf-8') for f in data]
+        self.data = RECORD_HEADER.pack(*[len(f) for f in fields]) + \
+                b''.join(fields)
+
+    def field(self, i):
+        '''
+        Decodes the i-th string of the record.
+        '''
+        lengths = RECORD_HEADER.unpack_from(self.data)
+        start = RECORD_HEADER.size + sum(lengths[:i])
+        return self.data[start:start + lengths[i]].decode('utf-8')
+
+    @property
+    def latex_question(self):
+        return self.field(0)
+
+    @property
+    def latex_solution(self):
+        return self.field(1)
+
+    @property
+    def str_question(self):
+        return self.field(2)
+
+    @property
+    def str_solution(self):
+        return self.field(3)
+
+    def to_problem(self):
+        '''
+        Returns the record as a Problem.
+        '''
+        return Problem(tuple(self.field(i) for i in range(4)))
 
+    def __eq__(self, other):
+        return isinstance(other, ProblemRecord) and self.data == other.data
+
+    def __hash__(self):
+        return hash(self.data)
+
+    def __str__(self):
+        '''
+        String representation of the Problem, same as Problem.__str__.
+        '''
+        return "Question: " + self.str_question + "\n" + "Solution: " + \
+                self.str_solution
 
 class Generator:
     '''
@@ -826,11 +1234,55 @@ class Generator:
                         functions.
     worksheet_fn -      the name of the pdf document for the generated
                         worksheet. Is initially blank.
+    monomials   -       cache of the monomial Terms used to build algebraic
+                        expressions, see monomial_table.
+    quadratic_tables -  cache of the tables used to draw the coefficients of
+                        quadratics, see quadratic_table.
+    radical_tables -    cache of the square-free decompositions used to
+                        reduce radicals, see radical_table.
+    sampler     -       optional sampler.BatchSampler the random numbers are
+                        drawn with, see use_batch_sampler. None means random
+                        is used.
 
     '''
     def __init__(self):
         self.problem_list = []
         self.worksheet_fn = ''
+        self.monomials = {}
+        self.quadratic_tables = {}
+        self.radical_tables = {}
+        self.sampler = None
+
+    def use_batch_sampler(self, seed=None, block_size=4096):
+        '''
+        Draws the random numbers of gen_numerical_expression,
+        gen_numerical_problem, gen_factorable_expression and gen_quadratic
+        in blocks with NumPy instead of with random (requires numpy, see
+        sampler.BatchSampler). The problems follow the same distributions,
+        but the state of random no longer determines them, so gen_seeded
+        should be used without it.
+
+        Arguments:
+        seed        -   seed of the sampler.
+        block_size  -   number of draws made at once.
+        '''
+        self.sampler = sampler.BatchSampler(seed=seed, block_size=block_size)
+
+    def randint(self, a, b):
+        '''
+        random.randint, drawn with the batch sampler when it's used.
+        '''
+        if self.sampler is None:
+            return random.randint(a, b)
+        return self.sampler.randint(a, b)
+
+    def choice(self, seq):
+        '''
+        random.choice, drawn with the batch sampler when it's used.
+        '''
+        if self.sampler is None:
+            return random.choice(seq)
+        return self.sampler.choice(seq)
 
     def gen_factorable_expression(self, order=2, factor_order=1, max_lowest_term=10,
             symbols='x', leading_coeff=False, mixed_var=False, len_factor=2):
@@ -857,7 +1309,7 @@ class Generator:
             factors = [self.gen_algebraic_expression(num_terms=len_factor, order=factor_order, symbols=symbols, mixed_var=mixed_var, max_lowest_term=max_lowest_term) for i in range(order)]
         else:
             factors = [self.gen_algebraic_expression(\
-                    num_terms=len_factor, order=factor_order, coeff=[1, random.randint(0, max_lowest_term)], symbols=symbols, mixed_var=mixed_var, max_lowest_term=max_lowest_term) \
+                    num_terms=len_factor, order=factor_order, coeff=[1, self.randint(0, max_lowest_term)], symbols=symbols, mixed_var=mixed_var, max_lowest_term=max_lowest_term) \
                     for i in range(order)]
         # Multiplying factors
         for f in factors:
@@ -868,8 +1320,27 @@ class Generator:
         expr.simplify()
         # Changing the reduced term to reflect the initial factors
         expanded_term = expr.reduced_terms[0]
-        expr.reduced_terms[0] = Term(factor(expanded_term.sympy_term))
+        expr.reduced_terms = [Term(factor(expanded_term.sympy_term))]
+
+        return expr
 
+    def gen_expandable_expression(self, order=2, factor_order=1, max_lowest_term=10,
+            symbols='x', leading_coeff=False, mixed_var=False, len_factor=2):
+        '''
+        Generates a product of factors to be expanded. Takes the same
+        arguments as gen_factorable_expression.
+
+        Returns an expression where the factored form is in the reduced
+        terms, and the expanded expression is stored in the unreduced terms.
+        '''
+        expr = self.gen_factorable_expression(order=order,
+                factor_order=factor_order, max_lowest_term=max_lowest_term,
+                symbols=symbols, leading_coeff=leading_coeff,
+                mixed_var=mixed_var, len_factor=len_factor)
+        # swap the reduced and unreduced terms
+        temp = expr.unreduced_terms
+        expr.unreduced_terms = expr.reduced_terms
+        expr.reduced_terms = temp
         return expr
 
     def gen_equation(self, num_lhs_terms=2, num_rhs_terms=1, types='i',
@@ -927,6 +1398,39 @@ class Generator:
                 variable=variable)
         return equation
 
+    def monomial_table(self, symbols, order, mixed_var):
+        '''
+        Returns the monomial Terms used by gen_algebraic_expression, built
+        once per (symbols, order, mixed_var) and kept in self.monomials.
+
+        If mixed_var is True, the table is a dictionary mapping sorted
+        tuples of positions in symbols to the product of those variables
+        (the empty tuple maps to 1), for every product of up to order
+        variables. Otherwise it is a list holding, for every variable, the
+        list of its powers from 0 to order.
+        '''
+        key = (symbols, order, mixed_var)
+        if key not in self.monomials:
+            variables = [make_term(Symbol(s)) for s in symbols]
+            if mixed_var:
+                table = {}
+                for o in range(order + 1):
+                    for positions in itertools.combinations_with_replacement(
+                            range(len(variables)), o):
+                        term = make_term(Rational(1, 1))
+                        for i in positions:
+                            term *= variables[i]
+                        table[positions] = term
+            else:
+                table = []
+                for variable in variables:
+                    powers = [make_term(Rational(1, 1))]
+                    for o in range(order):
+                        powers.append(powers[-1] * variable)
+                    table.append(powers)
+            self.monomials[key] = table
+        return self.monomials[key]
+
     def gen_algebraic_expression(self, num_terms=2, types='i',
             symbols='x', order=1, mixed_var=False, coeff=[],
             max_lowest_term=10, max_multiple=1, same_base_root=True):
@@ -967,10 +1471,18 @@ class Generator:
         assert len(coeff) == num_terms or len(coeff) == 0
         # other arguments are checked when fed to gen_numerical_expression.
 
-        # Initialzing sympy variables
-        variables = []
-        for i in range(len(symbols)):
-            variables.append(Term(Symbol(symbols[i])))
+        # Ready-made monomial Terms
+        monomials = self.monomial_table(symbols, order, mixed_var)
+        positions = range(len(symbols))
+
+        def monomial(o):
+            # Draws from random exactly like multiplying the multiplicative
+            # identity by o random variables (mixed_var) or by o times the
+            # same random variable.
+            if mixed_var:
+                return monomials[tuple(sorted(random.choice(positions)
+                    for i in range(o)))]
+            return random.choice(monomials)[o]
 
         # Creating algebraic terms
         algebraic_terms = []
@@ -979,39 +1491,20 @@ class Generator:
         constant_term_exists = False # ensures there's only one constant term
                                      # in the expression
         for o in range(order+1)[::-1]:
-            constant_term = True
             # Creating the terms with the highest order first
-            term = Term(Rational(1, 1)) # the multiplicative identity
-            if mixed_var:
-                for i in range(0, o):
-                    term *= random.choice(variables)
-                    constant_term = False
-            else:
-                variable = random.choice(variables)
-                for i in range(0, o):
-                    term *= variable
-                    constant_term = False
-            if constant_term:
+            if o == 0:
                 constant_term_exists = True
-            algebraic_terms.append(term)
+            algebraic_terms.append(monomial(o))
 
         # Adjusting algebraic terms to fit the size specified by num_terms
         if len(algebraic_terms) < num_terms:
             # Adding more terms
             for i in range(num_terms - len(algebraic_terms)):
-                term = Term(Rational(1, 1))
                 if not constant_term_exists:
                     random_order = random.randint(0, order)
                 else:
                     random_order = random.randint(1, order)
-                if mixed_var:
-                    for j in range(random_order):
-                        term *= random.choice(variables)
-                else:
-                    variable = random.choice(variables)
-                    for j in range(random_order):
-                        term *= variable
-                algebraic_terms.append(term)
+                algebraic_terms.append(monomial(random_order))
                 if random_order == 0:
                     constant_term_exists = True
 
@@ -1029,19 +1522,19 @@ class Generator:
                     types=types, max_lowest_term=max_lowest_term,
                     max_multiple=max_multiple, same_base_root=same_base_root)
             # Combining algebraic terms into expression
-            for i in range(num_terms):
-                expression.unreduced_terms[i] *= algebraic_terms[i]
-                expression.reduced_terms[i] *= algebraic_terms[i]
+            expression.unreduced_terms = [expression.unreduced_terms[i] *
+                    algebraic_terms[i] for i in range(num_terms)]
+            expression.reduced_terms = [expression.reduced_terms[i] *
+                    algebraic_terms[i] for i in range(num_terms)]
         else:
             # Generating numeric expression where every constant is 1
             expression = self.gen_numerical_expression(num_terms, op='+-',
                     types='i', max_lowest_term=1, max_multiple=1)
             # Combining algebraic terms and coeff into expression
-            for i in range(num_terms):
-                expression.unreduced_terms[i] *= algebraic_terms[i] * \
-                        Term(coeff[i])
-                expression.reduced_terms[i] *= algebraic_terms[i] * \
-                        Term(coeff[i])
+            expression.unreduced_terms = [expression.unreduced_terms[i] *
+                    (algebraic_terms[i] * make_term(coeff[i])) for i in range(num_terms)]
+            expression.reduced_terms = [expression.reduced_terms[i] *
+                    (algebraic_terms[i] * make_term(coeff[i])) for i in range(num_terms)]
             # Removing zero terms
             expression.zero_clean()
 
@@ -1140,6 +1633,23 @@ class Generator:
         return Problem((latex_question, latex_solution, str_question,
             str_solution))
 
+    def radical_table(self, limit):
+        '''
+        Returns the square-free decompositions of the numbers up to limit,
+        built once per limit and kept in self.radical_tables. The table is a
+        list where table[n] is the tuple (outer, inner) such that
+        sqrt(n) = outer*sqrt(inner) and inner is square-free.
+        '''
+        if limit not in self.radical_tables:
+            # largest[n] is the largest number whose square divides n
+            largest = [1] * (limit + 1)
+            for d in range(2, m.isqrt(limit) + 1):
+                for n in range(d * d, limit + 1, d * d):
+                    largest[n] = d
+            self.radical_tables[limit] = [(d, n // (d * d))
+                    for n, d in enumerate(largest)]
+        return self.radical_tables[limit]
+
     def gen_numerical_expression(self, num_terms=2, op='+-', types='i',
             max_lowest_term=10, max_multiple=1, same_base_root=True):
         '''
@@ -1173,6 +1683,58 @@ class Generator:
 
         Returns an Expression.
         '''
+        base_root, samples, operations = self.sample_numerical_expression(
+                num_terms=num_terms, op=op, types=types,
+                max_lowest_term=max_lowest_term, max_multiple=max_multiple,
+                same_base_root=same_base_root)
+
+        if 'r' in types:
+            radicals = self.radical_table(max_lowest_term * max_multiple)
+        # Generating terms in the expression
+        terms = []
+        reduced_terms = [] # these are terms allowed to be reduced by sympy
+        for constants, type_of_num in samples:
+            if type_of_num == 'i':
+                # Generating integer. Integer is used so that dividing two
+                # integer terms doesn't give a float
+                term = make_term(Integer(constants[0]))
+                terms.append(term)
+                reduced_terms.append(term)
+            elif type_of_num == 'r':
+                root = base_root
+                if root is None:
+                    # Radicals don't share a root, every one gets its own
+                    root = self.randint(1, max_lowest_term)
+                # UnevaluatedExpr has to be used here so the term isn't fully
+                # reduced
+                terms.append(Term(constants[0] * \
+                        sqrt(UnevaluatedExpr(constants[2]*root))))
+                # Looking up the reduced radical rather than having sympy
+                # factor it
+                outer, inner = radicals[constants[2] * root]
+                reduced_terms.append(Term(reduced_radical(
+                    constants[0] * outer, inner)))
+            elif type_of_num == 'f':
+                # Mul is used in this way so the fraction doesn't reduce
+                terms.append(Term(Mul(constants[0] * constants[3],
+                    Rational(1, constants[1] * constants[3]), evaluate=False)))
+                reduced_terms.append(make_term(Rational(constants[0]*constants[3],
+                    constants[1]*constants[3])))
+
+        # Returning expression
+        return Expression(terms, reduced_terms, operations)
+
+    def sample_numerical_expression(self, num_terms=2, op='+-', types='i',
+            max_lowest_term=10, max_multiple=1, same_base_root=True):
+        '''
+        Draws the random numbers gen_numerical_expression builds its terms
+        from. Takes the same arguments.
+
+        Returns a tuple (base_root, samples, operations), where base_root is
+        the root shared by radicals (None unless same_base_root), samples is
+        a list of (constants, type of number) for every term, and operations
+        is the list of operations of the Expression.
+        '''
         assert num_terms >= 1
         assert '+' in op or '-' in op or '*' in op or '/' in op
         assert max_lowest_term >= 1
@@ -1180,14 +1742,17 @@ class Generator:
         assert 'i' in types or 'r' in types or 'f' in types
 
         # Generating list of perfect squares for use as multipliers
+        if self.sampler is not None:
+            return self.sampler.numerical_expression(num_terms, op, types,
+                    max_lowest_term, max_multiple, same_base_root)
+
         perfect_squares = [x**2 for x in range(1,
             int(m.sqrt(max_multiple)) + 1)]
 
-        # Generating terms in the expression
-        terms = []
-        reduced_terms = [] # these are terms allowed to be reduced by sympy
-        # the root appearing in the reduced expression
+        samples = []
         operations = ['']
+        # the root appearing in the reduced expression
+        base_root = None
         if same_base_root:
             base_root = random.randint(1, max_lowest_term)
         for n in range(num_terms):
@@ -1211,33 +1776,82 @@ class Generator:
                 constants[1] = temp
             # Choosing a type of number to generate
             type_of_num = random.choice(types)
-
-            if type_of_num is 'i':
-                # Generating integer
-                terms.append(Term(constants[0]))
-                reduced_terms.append(Term(constants[0]))
-            elif type_of_num is 'r':
-                # UnevaluatedExpr has to be used here so the term isn't fully
-                # reduced
-                terms.append(Term(constants[0] * \
-                        sqrt(UnevaluatedExpr(constants[2]*base_root))))
-                reduced_terms.append(Term(constants[0] * \
-                        sqrt(constants[2] * base_root)))
-            elif type_of_num is 'f':
-                # Mul is used in this way so the fraction doesn't reduce
-                terms.append(Term(Mul(constants[0] * constants[3],
-                    Rational(1, constants[1] * constants[3]), evaluate=False)))
-                reduced_terms.append(Term(Rational(constants[0]*constants[3],
-                    constants[1]*constants[3])))
+            samples.append((constants, type_of_num))
             operations.append(random.choice(op))
         # Deleting the last operation in the operations list, since it's
         # unnecessary
         del operations[-1]
         # Replacing it with a null character
         operations.append('')
+        return base_root, samples, operations
 
-        # Returning expression
-        return Expression(terms, reduced_terms, operations)
+    def gen_numerical_problem(self, num_terms=2, op='+-', types='i',
+            max_lowest_term=10, max_multiple=1, same_base_root=True):
+        '''
+        Generates the same Problem as Problem(gen_numerical_expression(...))
+        with the same arguments and state of random. Takes the same
+        arguments.
+
+        When only integers and fractions (types 'i' and 'f') and the
+        operations +-*/ are involved, the terms and the solution are
+        computed with fractions.Fraction and formatted directly, without
+        sympy, which is much faster. Radicals (type 'r') sharing the same
+        base root are handled the same way for the operations +-*: they are
+        reduced with radical_table and combined as QuadraticSurds, and
+        sympy only prints the solution.
+
+        Returns a Problem.
+        '''
+        exact = set('+-*/')
+        if 'r' in types:
+            exact = set('+-*') if same_base_root else set()
+        if not set(types) <= set('ifr') or not set(op) <= exact:
+            return Problem(self.gen_numerical_expression(num_terms=num_terms,
+                op=op, types=types, max_lowest_term=max_lowest_term,
+                max_multiple=max_multiple, same_base_root=same_base_root))
+        base_root, samples, operations = self.sample_numerical_expression(
+                num_terms=num_terms, op=op, types=types,
+                max_lowest_term=max_lowest_term, max_multiple=max_multiple,
+                same_base_root=same_base_root)
+
+        if 'r' in types:
+            radicals = self.radical_table(max_lowest_term * max_multiple)
+        values = []
+        str_terms = []
+        latex_terms = []
+        for constants, type_of_num in samples:
+            if type_of_num == 'i':
+                values.append(Fraction(constants[0]))
+                str_term = latex_term = str(constants[0])
+            elif type_of_num == 'r':
+                n = constants[2] * base_root
+                outer, inner = radicals[n]
+                if inner == 1:
+                    values.append(Fraction(constants[0] * outer))
+                else:
+                    values.append(QuadraticSurd(0, constants[0] * outer,
+                        inner))
+                str_term, latex_term = render.format_radical(constants[0], n)
+            else:
+                numerator = constants[0] * constants[3]
+                denominator = constants[1] * constants[3]
+                values.append(Fraction(numerator, denominator))
+                str_term, latex_term = render.format_unreduced_fraction(
+                        numerator, denominator)
+            str_terms.append(str_term)
+            latex_terms.append(latex_term)
+        str_question = render.join(operations, str_terms)
+        latex_question = render.join(
+                [convert_op_to_latex(op) for op in operations], latex_terms)
+        value = evaluate_rational(values, operations)
+        if isinstance(value, QuadraticSurd):
+            solution = value.to_sympy()
+            str_solution = print_str(solution)
+            latex_solution = print_latex(solution)
+        else:
+            str_solution, latex_solution = render.format_rational(value)
+        return Problem((latex_question, latex_solution, str_question,
+            str_solution))
 
     def gen_linear(self, max_lowest_term=10, max_multiple=1, types='i',
             num_lhs_terms=2, num_rhs_terms=1, lhs_coeff=[], rhs_coeff=[],
@@ -1288,6 +1902,43 @@ class Generator:
                 same_base_root=same_base_root)
         return equation
 
+    def quadratic_table(self, max_lowest_term):
+        '''
+        Returns the tables gen_quadratic draws coefficients from, built once
+        per max_lowest_term and kept in self.quadratic_tables. The table is
+        a dictionary holding:
+
+        perfect_squares -   list of the squares of 0 to max_lowest_term - 1.
+        not_perfect     -   list of the numbers below max_lowest_term^2 that
+                            aren't in perfect_squares.
+        divisors        -   dictionary of |product| -> positive divisors of
+                            product up to max_lowest_term, filled as products
+                            come up (see quadratic_divisors).
+        '''
+        if max_lowest_term not in self.quadratic_tables:
+            perfect_squares = [i**2 for i in range(max_lowest_term)]
+            squares = set(perfect_squares)
+            self.quadratic_tables[max_lowest_term] = {
+                'perfect_squares': perfect_squares,
+                'not_perfect': [i for i in range(max_lowest_term**2)
+                    if i not in squares],
+                'divisors': {},
+            }
+        return self.quadratic_tables[max_lowest_term]
+
+    def quadratic_divisors(self, product, max_lowest_term):
+        '''
+        Returns a new list of the positive divisors of product that are at
+        most max_lowest_term, in increasing order. The divisors of every
+        product are only computed once.
+        '''
+        cache = self.quadratic_table(max_lowest_term)['divisors']
+        key = abs(product)
+        if key not in cache:
+            cache[key] = [d for d in divisors(key) if d <= max_lowest_term]
+        # gen_quadratic removes the divisor it picks first
+        return cache[key][:]
+
     def gen_quadratic(self, max_lowest_term=10, factorable=True,
             solvable=True, leading_coeff=False, middle_sign='='):
         '''
@@ -1307,19 +1958,20 @@ class Generator:
         '''
         if not factorable and solvable:
             # This requires b^2 - 4ac to not be a perfect square
-            # Generating list of perfect squares
-            perfect_squares = [i**2 for i in range(max_lowest_term)]
-            # Generating list of non perfect squares
-            not_perfect = []
-            for i in range(max_lowest_term**2):
-                if i not in perfect_squares:
-                    not_perfect.append(i)
-            # this is b^2 - 4ac
-            discrim = random.choice(not_perfect)
-            # this is b^2
-            b2 = random.choice(perfect_squares)
-            # this is -4ac
-            product = (discrim - b2)
+            # Looking up the lists of perfect and non perfect squares
+            table = self.quadratic_table(max_lowest_term)
+            perfect_squares = table['perfect_squares']
+            not_perfect = table['not_perfect']
+            if self.sampler is not None:
+                discrim, b2, product = self.sampler.quadratic_discriminant(
+                        table, max_lowest_term)
+            else:
+                # this is b^2 - 4ac
+                discrim = random.choice(not_perfect)
+                # this is b^2
+                b2 = random.choice(perfect_squares)
+                # this is -4ac
+                product = (discrim - b2)
             if product % 4 != 0:
                 # discrim is not a perfect square, so multiplying it
                 # by 4 can't make it a perfect square
@@ -1328,17 +1980,14 @@ class Generator:
                 # stay a perfect square
                 b2 *= 4
                 product = (discrim - b2)
-            # Choosing two random divisors of -4ac to be a and c
-            ac_choices = divisors(product)
-            # Eliminating all divisors above max
-            for i in reversed(range(len(ac_choices))):
-                if ac_choices[i] > max_lowest_term:
-                    del ac_choices[i]
-            a = random.choice(ac_choices)
+            # Choosing two random divisors of -4ac (up to the max) to be a
+            # and c
+            ac_choices = self.quadratic_divisors(product, max_lowest_term)
+            a = self.choice(ac_choices)
             if len(ac_choices) > 1:
                 del ac_choices[ac_choices.index(a)]
             # Rememeber product is -4ac, not just ac
-            c = int(random.choice(ac_choices) / (-4))
+            c = int(self.choice(ac_choices) / (-4))
             # divisors returns all positive numbers regardless of the
             # input. If product (-4ac) is negative, a and c must have same
             # signs.
@@ -1348,10 +1997,10 @@ class Generator:
             b = int(m.sqrt(b2))
             # b can be positive or negative and a and c can either be
             # both positive or both negative.
-            if random.randint(0, 1):
+            if self.randint(0, 1):
                 c *= -1
                 a *= -1
-            if random.randint(0, 1):
+            if self.randint(0, 1):
                 b *= -1
             equation = self.gen_equation(num_lhs_terms=3, order_lhs=2,
                     lhs_coeff=[a, b, c], rhs_coeff=[0],
@@ -1359,25 +2008,21 @@ class Generator:
         elif not solvable:
             # This requires b^2 - 4ac < 0. We do a procedure similiar to
             # the one above.
-            # Generating list of perfect squares
-            perfect_squares = [i**2 for i in range(max_lowest_term)]
+            # Looking up the list of perfect squares
+            perfect_squares = self.quadratic_table(max_lowest_term)['perfect_squares']
             # this is b^2
-            b2 = random.choice(perfect_squares)
+            b2 = self.choice(perfect_squares)
             # This is b^2 - 4ac
-            discrim = random.randint(-max_lowest_term**2, -1)
+            discrim = self.randint(-max_lowest_term**2, -1)
             # this is -4ac
             product = (discrim - b2)
-            # Choosing two random divisors of ac to be a and c
-            ac_choices = divisors(product)
-            # Eliminating all divisors above max
-            for i in reversed(range(len(ac_choices))):
-                if ac_choices[i] > max_lowest_term:
-                    del ac_choices[i]
-            a = random.choice(ac_choices)
+            # Choosing two random divisors of ac (up to the max) to be a and c
+            ac_choices = self.quadratic_divisors(product, max_lowest_term)
+            a = self.choice(ac_choices)
             if len(ac_choices) > 1:
                 del ac_choices[ac_choices.index(a)]
             # Rememeber product is -4ac, not just ac
-            c = random.choice(ac_choices) / (-4)
+            c = self.choice(ac_choices) / (-4)
             # divisors returns all positive numbers regardless of the
             # input. If product (-4ac) is negative, a and c must have same
             # signs.
@@ -1387,17 +2032,18 @@ class Generator:
             b = m.sqrt(b2)
             # b can be positive or negative and a and c can either be
             # both positive or both negative.
-            if random.randint(0, 1):
+            if self.randint(0, 1):
                 c *= -1
                 a *= -1
-            if random.randint(0, 1):
+            if self.randint(0, 1):
                 b *= -1
             equation = self.gen_equation(num_lhs_terms=3, order_lhs=2,
                     lhs_coeff=[a, b, c], rhs_coeff=[0],
                     max_lowest_term=max_lowest_term, middle_sign=middle_sign)
         else:
             # Creating factorable quadratic
-            rhs = Expression([Term(0)], [Term(0)], ['',''])
+            zero = make_term(0)
+            rhs = Expression([zero], [zero], ['',''])
             lhs = self.gen_factorable_expression(order=2,
                     max_lowest_term=max_lowest_term,
                     leading_coeff=leading_coeff)
@@ -1520,6 +2166,71 @@ class Generator:
                 variable=variable))
         return System(equations)
 
+    def gen_problem(self, kind, **params):
+        '''
+        Generates a Problem of the given kind.
+
+        Arguments:
+        kind        -   kind of problem, i.e. the name of a gen_* method
+                        without the 'gen_' prefix, e.g. 'linear' or
+                        'expandable_expression'.
+        params      -   keyword arguments passed on to the gen_* method.
+
+        Returns a tuple (Problem, data), where data is the Expression,
+        Equation or System the Problem was created from (None for the kinds
+        generating Problems directly).
+        '''
+        data = getattr(self, 'gen_' + kind)(**params)
+        if isinstance(data, Problem):
+            return data, None
+        return Problem(data), data
+
+    def gen_seeded(self, kind, params, seed):
+        '''
+        Generates a Problem of the given kind from a seed. The same kind,
+        parameters and seed always give the same Problem, so a Problem can be
+        stored as just these three values. The state of random is restored
+        afterwards.
+
+        Arguments:
+        kind        -   kind of problem, see gen_problem.
+        params      -   dictionary of keyword arguments passed on to the
+                        gen_* method.
+        seed        -   integer seed for random.
+
+        Returns a tuple (Problem, data), see gen_problem.
+        '''
+        state = random.getstate()
+        random.seed(seed)
+        try:
+            return self.gen_problem(kind, **params)
+        finally:
+            random.setstate(state)
+
+    def stream(self, kind, container=None, **params):
+        '''
+        Generator yielding Problems of the given kind one at a time, never
+        the same Problem twice. Problems are deduped and retried by the
+        loop shared with ProblemContainer.add_generated (see
+        ProblemContainer.generate_unique), so the seen index, fingerprinter
+        and retry telemetry of the container apply. A GeneratorError is
+        raised once no more unique problems can be generated.
+
+        Arguments:
+        kind        -   kind of problem, see gen_problem.
+        container   -   ProblemContainer the problems are added to. A new
+                        one using this Generator by default.
+        params      -   keyword arguments passed on to the gen_* method.
+        '''
+        if container is None:
+            # Imported here, problemgen.container imports backend
+            import problemgen.container
+            container = problemgen.container.ProblemContainer()
+            container.gen = self
+        generate = lambda: self.gen_problem(kind, **params)
+        while True:
+            yield container.generate_unique(kind, generate)
+
 ################################### Error classes
 class Error(Exception):
     '''Base class for exceptions in this module.'''
@@ -0,0 +1,328 @@
+import problemgen.backend as backend
+import problemgen.container as container
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+
+from array import array
+
+# Each record in the data file is an encoded backend.ProblemRecord: the byte
+# lengths of the four strings of the Problem (latex_question, latex_solution,
+# str_question, str_solution), followed by the UTF-8 encoded strings
+# themselves.
+RECORD_HEADER = backend.RECORD_HEADER
+# Each entry in the index file holds the offset of a record in the data file
+# and the id of the tag (kind and parameters) it was generated with.
+INDEX_ENTRY = struct.Struct('<QI')
+
+class ProblemBank:
+    '''
+    Class designed to store rendered Problems on disk so that they can be
+    drawn into a ProblemContainer later without being generated again.
+
+    The bank is made of three files:
+    fn          -   the append-only data file holding the rendered Problems.
+    fn.idx      -   the index file, holding an offset and a tag id for every
+                    Problem in the data file.
+    fn.tags     -   the tag file, holding one (kind, parameters) pair per
+                    line. The line number is the tag id.
+
+    The data and index files are read through mmap, so drawing Problems
+    never loads the whole bank into memory and never touches sympy.
+
+    Member variables:
+    fn          -   filename of the data file.
+    tags        -   list of (kind, params) tuples. The position of a tag in
+                    the list is its tag id.
+    '''
+
+    def __init__(self, fn):
+        '''
+        Arguments:
+
+        fn  -   filename of the data file. The index and tag files are kept
+                next to it. The files are created if they don't exist.
+        '''
+        assert type(fn) == str
+        self.fn = fn
+        self.index_fn = fn + '.idx'
+        self.tags_fn = fn + '.tags'
+        self.tags = []
+        self._tag_ids = {}
+        self._data_file = None
+        self._data_map = None
+        self._index_file = None
+        self._index_map = None
+        # Tag id -> array('I') of positions in the index, built lazily
+        self._positions = None
+
+        for f in (self.fn, self.index_fn, self.tags_fn):
+            if not os.path.exists(f):
+                open(f, 'ab').close()
+        with open(self.tags_fn, 'r') as tags_file:
+            for line in tags_file:
+                kind, params = json.loads(line)
+                self._tag_ids[self.tag_key(kind, params)] = len(self.tags)
+                self.tags.append((kind, params))
+
+    def __len__(self):
+        return os.path.getsize(self.index_fn) // INDEX_ENTRY.size
+
+    def normalize_params(self, params):
+        '''
+        Returns params as they read back from the tag file, e.g. with tuples
+        turned into lists, so that they compare equal to stored tags.
+        '''
+        return json.loads(json.dumps(params, sort_keys=True))
+
+    def tag_key(self, kind, params):
+        '''
+        Returns a hashable key identifying a kind and a dictionary of
+        parameters.
+        '''
+        return kind + '|' + json.dumps(params, sort_keys=True)
+
+    def get_tag_id(self, kind, params):
+        '''
+        Returns the tag id of the given kind and parameters, adding a new tag
+        to the tag file if needed.
+        '''
+        params = self.normalize_params(params)
+        key = self.tag_key(kind, params)
+        if key not in self._tag_ids:
+            with open(self.tags_fn, 'a') as tags_file:
+                tags_file.write(json.dumps([kind, params], sort_keys=True) + '\n')
+            self._tag_ids[key] = len(self.tags)
+            self.tags.append((kind, params))
+        return self._tag_ids[key]
+
+    def extend(self, problems, kind, params={}):
+        '''
+        Appends a list of Problems to the bank.
+
+        Arguments:
+        problems    -   list of Problems (or ProblemRecords) to store.
+        kind        -   kind of generator the problems came from. This is the
+                        name of the ProblemContainer method without the 'add_'
+                        prefix, e.g. 'linear' or 'factorable_expression'.
+        params      -   dictionary of the parameters the problems were
+                        generated with.
+        '''
+        tag_id = self.get_tag_id(kind, params)
+        # The current maps don't cover the new records
+        self.close()
+        with open(self.fn, 'ab') as data_file, \
+                open(self.index_fn, 'ab') as index_file:
+            offset = data_file.tell()
+            for p in problems:
+                if not isinstance(p, backend.ProblemRecord):
+                    p = backend.ProblemRecord(p)
+                data_file.write(p.data)
+                index_file.write(INDEX_ENTRY.pack(offset, tag_id))
+                offset += len(p.data)
+
+    def append(self, problem, kind, params={}):
+        '''
+        Appends a single Problem to the bank. See extend for the arguments.
+        '''
+        self.extend([problem], kind, params)
+
+    def fill(self, kind, n, bloom_error_rate=None, chunk_size=10000, **params):
+        '''
+        Generates n unique Problems of the given kind and stores them in the
+        bank. Problems are written every chunk_size problems, so only the
+        dedupe state is kept in memory for the whole run.
+
+        Arguments:
+        kind        -   name of the ProblemContainer method used to generate
+                        the problems, without the 'add_' prefix.
+        n           -   number of problems to generate.
+        bloom_error_rate
+                    -   if given, problems are deduped with a Bloom filter
+                        with this false positive rate instead of a set of
+                        strings (see ProblemContainer.use_bloom_dedupe).
+        chunk_size  -   number of problems generated between two writes.
+        params      -   keyword arguments passed on to the add method.
+        '''
+        c = container.ProblemContainer()
+        if bloom_error_rate is not None:
+            c.use_bloom_dedupe(error_rate=bloom_error_rate,
+                    initial_capacity=n)
+        add = getattr(c, 'add_' + kind)
+        for i in range(n):
+            add(**params)
+            if len(c.problems) >= chunk_size:
+                self.extend(c.problems, kind, params)
+                # Keeping the dedupe state, dropping the problems
+                c.problems = []
+        self.extend(c.problems, kind, params)
+
+    def open(self):
+        '''
+        Maps the data and index files into memory. Called automatically when
+        the bank is read.
+        '''
+        if self._index_map is not None:
+            return
+        if len(self) == 0:
+            # mmap can't map empty files
+            return
+        self._data_file = open(self.fn, 'rb')
+        self._data_map = mmap.mmap(self._data_file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        self._index_file = open(self.index_fn, 'rb')
+        self._index_map = mmap.mmap(self._index_file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+
+    def close(self):
+        '''
+        Unmaps the data and index files.
+        '''
+        for m in (self._data_map, self._index_map):
+            if m is not None:
+                m.close()
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = None
+        self._data_map = None
+        self._index_file = None
+        self._index_map = None
+        self._positions = None
+
+    def matching_tags(self, kind, params):
+        '''
+        Returns the ids of every tag of the given kind whose parameters
+        include all of the given parameters.
+        '''
+        params = self.normalize_params(params)
+        tag_ids = []
+        for tag_id, (tag_kind, tag_params) in enumerate(self.tags):
+            if tag_kind != kind:
+                continue
+            if all(k in tag_params and tag_params[k] == v
+                    for k, v in params.items()):
+                tag_ids.append(tag_id)
+        return tag_ids
+
+    def position_arrays(self, kind, params={}):
+        '''
+        Returns a list of array('I'), one per matching tag, holding the
+        index positions of every Problem of the given kind generated with
+        (at least) the given parameters. The arrays are shared with the
+        bank and must not be modified.
+        '''
+        self.open()
+        if self._index_map is None:
+            return []
+        if self._positions is None:
+            # Only the index is scanned, the data file is left alone. The
+            # positions are kept as 4 byte integers rather than Python ints.
+            self._positions = {}
+            for i, (offset, tag_id) in enumerate(
+                    INDEX_ENTRY.iter_unpack(self._index_map)):
+                positions = self._positions.get(tag_id)
+                if positions is None:
+                    positions = self._positions[tag_id] = array('I')
+                positions.append(i)
+        return [self._positions[tag_id]
+                for tag_id in self.matching_tags(kind, params)
+                if tag_id in self._positions]
+
+    def positions(self, kind, params={}):
+        '''
+        Returns a list of the index positions of every Problem of the given
+        kind generated with (at least) the given parameters.
+        '''
+        positions = []
+        for a in self.position_arrays(kind, params):
+            positions.extend(a)
+        return positions
+
+    def count(self, kind, **params):
+        '''
+        Returns the number of Problems of the given kind in the bank.
+        '''
+        return sum(len(a) for a in self.position_arrays(kind, params))
+
+    def position_lookup(self, kind, params={}):
+        '''
+        Returns a tuple (total, lookup), where total is the number of
+        matching Problems and lookup(i) returns the index position of the
+        i-th of them (0 <= i < total), without copying the positions of
+        every match.
+        '''
+        arrays = self.position_arrays(kind, params)
+        # Running totals of the sizes of the arrays, to find the array a
+        # position drawn over all of them belongs to
+        ends = []
+        total = 0
+        for a in arrays:
+            total += len(a)
+            ends.append(total)
+
+        def lookup(i):
+            j = bisect.bisect_right(ends, i)
+            return arrays[j][i - (ends[j] - len(arrays[j]))]
+
+        return total, lookup
+
+    def sample_positions(self, kind, n, params={}):
+        '''
+        Returns a list of n distinct random index positions of Problems of
+        the given kind, without copying the positions of every match.
+        '''
+        total, lookup = self.position_lookup(kind, params)
+        if total < n:
+            raise backend.GeneratorError(kind, 'Only ' + str(total) +
+                    ' problems of this kind are stored in ' + self.fn + '.')
+        return [lookup(i) for i in random.sample(range(total), n)]
+
+    def iter_positions(self, kind, params={}):
+        '''
+        Generator yielding the index positions of every Problem of the given
+        kind in random order, each once. Only the positions yielded so far
+        are remembered, so taking a few of them stays cheap.
+        '''
+        total, lookup = self.position_lookup(kind, params)
+        drawn = set()
+        # Drawing at random until half of the positions are used, then
+        # shuffling the rest rather than drawing mostly repeats
+        while len(drawn) < total // 2:
+            i = random.randrange(total)
+            if i not in drawn:
+                drawn.add(i)
+                yield lookup(i)
+        rest = [i for i in range(total) if i not in drawn]
+        random.shuffle(rest)
+        for i in rest:
+            yield lookup(i)
+
+    def get(self, position):
+        '''
+        Reads the Problem stored at the given index position. It is returned
+        as a backend.ProblemRecord, which is only decoded when its strings
+        are accessed.
+        '''
+        self.open()
+        offset, tag_id = INDEX_ENTRY.unpack_from(self._index_map,
+                position * INDEX_ENTRY.size)
+        lengths = RECORD_HEADER.unpack_from(self._data_map, offset)
+        size = RECORD_HEADER.size + sum(lengths)
+        return backend.ProblemRecord(self._data_map[offset:offset + size])
+
+    def draw(self, kind, n, **params):
+        '''
+        Returns a list of n distinct random Problems (as ProblemRecords) of
+        the given kind.
+
+        Arguments:
+        kind        -   kind of the problems to draw.
+        n           -   number of problems to draw.
+        params      -   parameters the problems must have been generated
+                        with. Parameters that aren't given aren't checked.
+        '''
+        return [self.get(p) for p in self.sample_positions(kind, n, params)]
@@ -0,0 +1,131 @@
+import problemgen.backend as backend
+import os
+import sys
+
+from sympy.core.cache import CACHE, clear_cache
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def sympy_cache_entries():
+    '''
+    Returns the number of entries held by sympy's global cache, summed over
+    every cached function.
+    '''
+    entries = 0
+    for cached in CACHE:
+        info = getattr(cached, 'cache_info', None)
+        if info is not None:
+            entries += info().currsize
+    return entries
+
+def resident_memory():
+    '''
+    Returns the resident set size of the process in bytes. Falls back on
+    the peak resident set size where /proc isn't available, and returns
+    None if neither can be read.
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class CacheManager:
+    '''
+    Class designed to keep sympy's global cache from growing without bound
+    in long-running processes. Every expand, solve, factor and Rational of
+    backend leaves entries in it, so it is cleared every few problems, when
+    it holds too many entries, or between worksheets (see
+    ProblemContainer.manage_sympy_cache).
+
+    Clearing the cache only costs the time to rebuild the entries that are
+    used again. The Terms shared by backend.make_term (at most
+    backend.MAX_INTERNED_TERMS) and the printing caches (PRINT_CACHE_SIZE
+    entries each) have fixed bounds and are kept.
+
+    Member variables:
+    every       -   number of problems added between two clears, or None.
+    max_entries -   number of entries of sympy's cache above which it is
+                    cleared, or None.
+    problems    -   number of problems added since the manager was made.
+    since_clear -   number of problems added since the last clear.
+    clears      -   number of times the cache was cleared.
+    rss         -   resident set size in bytes after the last clear (see
+                    resident_memory), or None before the first one.
+    peak_rss    -   largest rss seen so far, or None.
+    '''
+
+    def __init__(self, every=1000, max_entries=None):
+        '''
+        Arguments:
+
+        every       -   clear the cache every time this many problems are
+                        added. None to only clear it on demand or when
+                        max_entries is reached.
+        max_entries -   clear the cache as soon as it holds more than this
+                        many entries. Counting them walks every cached
+                        function of sympy, so it is only checked once every
+                        100 problems. None to not check it.
+        '''
+        self.every = every
+        self.max_entries = max_entries
+        self.problems = 0
+        self.since_clear = 0
+        self.clears = 0
+        self.rss = None
+        self.peak_rss = None
+
+    def problem_added(self):
+        '''
+        Records that a problem was added, clearing the cache when it is due.
+        Returns a boolean (True if the cache was cleared).
+        '''
+        self.problems += 1
+        self.since_clear += 1
+        if self.every is not None and self.since_clear >= self.every:
+            self.clear()
+            return True
+        if self.max_entries is not None and self.since_clear % 100 == 0 \
+                and sympy_cache_entries() > self.max_entries:
+            self.clear()
+            return True
+        return False
+
+    def clear(self):
+        '''
+        Clears sympy's cache and measures the resident memory.
+        '''
+        clear_cache()
+        self.clears += 1
+        self.since_clear = 0
+        self.rss = resident_memory()
+        if self.rss is not None:
+            self.peak_rss = max(self.rss, self.peak_rss or 0)
+
+    def report(self):
+        '''
+        Returns the state of the manager as a dictionary holding problems,
+        clears, sympy_cache_entries, rss (current resident set size in
+        bytes), rss_after_clear, peak_rss and print_cache (see
+        backend.print_cache_info).
+        '''
+        rss = resident_memory()
+        if rss is not None:
+            self.peak_rss = max(rss, self.peak_rss or 0)
+        return {
+            'problems': self.problems,
+            'clears': self.clears,
+            'sympy_cache_entries': sympy_cache_entries(),
+            'rss': rss,
+            'rss_after_clear': self.rss,
+            'peak_rss': self.peak_rss,
+            'print_cache': backend.print_cache_info(),
+        }
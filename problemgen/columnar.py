@@ -0,0 +1,156 @@
+import problemgen.backend as backend
+import random
+
+from array import array
+
+# Strings kept for every problem, in the order of the Problem tuple form
+FIELDS = ['latex_question', 'latex_solution', 'str_question', 'str_solution']
+
+class ColumnarProblems:
+    '''
+    Class designed to hold a very large number of rendered Problems with
+    little memory, as an alternative to the list in ProblemContainer.problems
+    (see ProblemContainer.use_columnar_storage).
+
+    Every string field is appended, UTF-8 encoded, to one contiguous buffer
+    per field, and its end offset to an array('Q'). Problems are only
+    created again (as Problems) when they are indexed or iterated over.
+    Shuffling and slicing only touch the order array, so slices are views
+    sharing the buffers of the original.
+
+    Member variables:
+    buffers     -   list of four bytearrays, one per field in FIELDS.
+    offsets     -   list of four array('Q') of end offsets into the buffers.
+                    offsets[j][r] is where the field j of row r starts.
+    kinds       -   list of the kinds of problems stored. The position of a
+                    kind in the list is its id.
+    tags        -   array('H') of the kind id of every row.
+    order       -   array('Q') of the rows in the order the problems are
+                    presented.
+    '''
+
+    def __init__(self, problems=[], kind=''):
+        '''
+        Arguments:
+
+        problems    -   optional iterable of Problems (or anything with the
+                        four string fields, or 4-tuples of strings) to add.
+        kind        -   kind of the problems given.
+        '''
+        self.buffers = [bytearray() for f in FIELDS]
+        self.offsets = [array('Q', [0]) for f in FIELDS]
+        self.kinds = []
+        self.kind_ids = {}
+        self.tags = array('H')
+        self.order = array('Q')
+        self.extend(problems, kind)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.view(self.order[i])
+        return self.problem(self.order[i])
+
+    def __iter__(self):
+        for row in self.order:
+            yield self.problem(row)
+
+    def kind_id(self, kind):
+        '''
+        Returns the id of a kind, adding it if needed.
+        '''
+        if kind not in self.kind_ids:
+            self.kind_ids[kind] = len(self.kinds)
+            self.kinds.append(kind)
+        return self.kind_ids[kind]
+
+    def append(self, problem, kind=''):
+        '''
+        Adds a Problem at the end.
+
+        Arguments:
+        problem     -   the Problem to add. A ProblemRecord or a tuple in the
+                        form (latex_question, latex_solution, str_question,
+                        str_solution) also works.
+        kind        -   kind of the problem, e.g. 'linear'.
+        '''
+        if isinstance(problem, tuple):
+            fields = problem
+        else:
+            fields = (problem.latex_question, problem.latex_solution,
+                    problem.str_question, problem.str_solution)
+        for buffer, offsets, field in zip(self.buffers, self.offsets, fields):
+            buffer += field.encode('utf-8')
+            offsets.append(len(buffer))
+        self.order.append(len(self.tags))
+        self.tags.append(self.kind_id(kind))
+
+    def extend(self, problems, kind=''):
+        '''
+        Adds every Problem of an iterable at the end.
+        '''
+        for p in problems:
+            self.append(p, kind)
+
+    def field(self, row, j):
+        '''
+        Decodes the field j (see FIELDS) of a row.
+        '''
+        offsets = self.offsets[j]
+        return self.buffers[j][offsets[row]:offsets[row + 1]].decode('utf-8')
+
+    def problem(self, row):
+        '''
+        Returns the Problem stored in a row.
+        '''
+        return backend.Problem(tuple(self.field(row, j)
+            for j in range(len(FIELDS))))
+
+    def kind(self, i):
+        '''
+        Returns the kind of the i-th problem.
+        '''
+        return self.kinds[self.tags[self.order[i]]]
+
+    def view(self, order):
+        '''
+        Returns a ColumnarProblems sharing the buffers of this one, presenting
+        the rows in order. Problems appended to a view are only presented by
+        that view.
+        '''
+        v = ColumnarProblems()
+        v.buffers = self.buffers
+        v.offsets = self.offsets
+        v.kinds = self.kinds
+        v.kind_ids = self.kind_ids
+        v.tags = self.tags
+        v.order = order
+        return v
+
+    def select(self, kind):
+        '''
+        Returns a view of the problems of the given kind.
+        '''
+        if kind not in self.kind_ids:
+            return self.view(array('Q'))
+        kind_id = self.kind_ids[kind]
+        return self.view(array('Q', [row for row in self.order
+            if self.tags[row] == kind_id]))
+
+    def shuffle(self):
+        '''
+        Shuffles the order of the problems. Only the order array is
+        permuted; random is used the same way as for a list of the same
+        length.
+        '''
+        random.shuffle(self.order)
+
+    def nbytes(self):
+        '''
+        Returns the number of bytes held by the buffers and arrays.
+        '''
+        arrays = self.offsets + [self.tags, self.order]
+        return sum(len(b) for b in self.buffers) + \
+                sum(a.itemsize * len(a) for a in arrays)
@@ -1,7 +1,20 @@
 import problemgen.backend as backend
+import problemgen.cache as cache
+import problemgen.columnar as columnar
+import problemgen.dedupe as dedupe
+import problemgen.stats as stats
+import problemgen.verify as verify
 import random
 import os
+import shutil
 import subprocess
+import tempfile
+import time
+
+# Counters kept for every kind of problem generated, see
+# ProblemContainer.retry_stats
+RETRY_FIELDS = ['calls', 'attempts', 'duplicates', 'errors', 'failures',
+        'rejected_seconds']
 
 # Add problem container with all of the add methods and a problem list
 # have worksheet be a child class
@@ -11,7 +24,30 @@ class ProblemContainer:
 
     Member variables:
     gen         -   Generator used to create all of the problems.
-    problems    -   List of problems contained within the container.
+    problems    -   List of problems contained within the container, or a
+                    ColumnarProblems (see use_columnar_storage).
+    seen        -   Optional persistent index of problems handed out by
+                    earlier containers (a SeenIndex or BloomFilter from
+                    problemgen.dedupe). None by default.
+    problem_keys -  Set of the dedupe keys of the problems in the container,
+                    or a BloomDedupe (see use_bloom_dedupe).
+    fingerprinter - Optional Fingerprinter (from problemgen.dedupe) used to
+                    detect problems that are the same up to term order.
+                    None by default, in which case problems are compared
+                    as strings.
+    instrumentation - Optional Stats collector (from problemgen.stats)
+                    recording timers and counters while problems are
+                    generated. None by default, see enable_stats.
+    verifier    -   Optional Verifier (from problemgen.verify) checking the
+                    answer keys of the problems added. None by default, see
+                    enable_verification.
+    cache_manager - Optional CacheManager (from problemgen.cache) clearing
+                    sympy's global cache as problems are added. None by
+                    default, see manage_sympy_cache.
+    retries     -   Dictionary of kind -> retry telemetry of the add_*
+                    calls, see retry_stats.
+    last_data   -   The Expression, Equation or System the most recently
+                    added problem was created from, or None.
 
     Constants:
     NUM_ATTEMPTS -  number of times an attempt at generating a non-duplicate
@@ -21,40 +57,450 @@ class ProblemContainer:
     def __init__(self):
         self.gen = backend.Generator()
         self.problems = []
+        self.seen = None
+        self.problem_keys = set()
+        self.fingerprinter = None
+        self.instrumentation = None
+        self.verifier = None
+        self.cache_manager = None
+        self.retries = {}
+        self.last_data = None
         self.NUM_ATTEMPTS = 200
 
     def __str__(self):
         problems_str = ''
-        for p in self.problems:
-            problems_str += str(self.problems.index(p)) + '. ' + str(p) + '\n'
+        for i, p in enumerate(self.problems):
+            problems_str += str(i) + '. ' + str(p) + '\n'
         return problems_str
 
     def clear_problems(self):
         '''
         Resets all problems.
         '''
-        self.problem_list = []
+        self.problems = type(self.problems)()
+        self.problem_keys.clear()
 
     def shuffle(self):
         '''
         Shuffles the order of the problems.
         '''
-        random.shuffle(self.problems)
+        if isinstance(self.problems, list):
+            random.shuffle(self.problems)
+        else:
+            self.problems.shuffle()
+
+    def use_columnar_storage(self):
+        '''
+        Keeps the problems in a ColumnarProblems (see problemgen.columnar)
+        instead of a list, which takes far less memory for millions of
+        problems. Problems are recreated from the buffers whenever they are
+        accessed. The problems already added are moved over, without a kind.
+        '''
+        if isinstance(self.problems, list):
+            self.problems = columnar.ColumnarProblems(self.problems)
+
+    def set_seen(self, seen):
+        '''
+        Sets a persistent index of problems that were already handed out,
+        so that problems are not repeated across worksheets. See
+        problemgen.dedupe.open_seen to open the index of a class or term.
+        Pass None to stop using it.
+        '''
+        self.seen = seen
+
+    def set_fingerprinter(self, fingerprinter):
+        '''
+        Sets a Fingerprinter (see problemgen.dedupe) so that problems that are
+        the same up to term order or trivial rewriting count as duplicates.
+        Should be set before any problem is added. Pass None to compare
+        problems as strings again.
+        '''
+        self.fingerprinter = fingerprinter
+
+    def enable_stats(self, hook=None):
+        '''
+        Starts recording timers and counters for problem generation
+        (Generator.gen_* calls, combine_terms, sympy solvers, latex printing,
+        Problem rendering, dedupe checks, attempts per add_* call and
+        pdflatex runs). Nothing is recorded, and nothing is slowed down,
+        until this is called.
+
+        Backend events are sent to every container with stats enabled.
+
+        Arguments:
+        hook    -   optional callable called for every event as
+                    hook(kind, name, value), see problemgen.stats.Stats.
+        '''
+        if self.instrumentation is None:
+            self.instrumentation = stats.Stats(hook)
+            stats.activate(self.instrumentation)
+        else:
+            self.instrumentation.hook = hook
+
+    def disable_stats(self):
+        '''
+        Stops recording timers and counters. The collected values are
+        dropped.
+        '''
+        if self.instrumentation is not None:
+            stats.deactivate(self.instrumentation)
+            self.instrumentation = None
+
+    def stats(self):
+        '''
+        Returns a snapshot of the timers and counters recorded since
+        enable_stats was called (see problemgen.stats.Stats.snapshot), or an
+        empty dictionary if stats aren't enabled.
+        '''
+        if self.instrumentation is None:
+            return {}
+        return self.instrumentation.snapshot()
+
+    def enable_verification(self, batch_size=256, tolerance=verify.TOLERANCE):
+        '''
+        Starts checking the answer keys of the problems added (requires
+        numpy, see problemgen.verify.Verifier). Problems are queued as they
+        are added and checked batch_size at a time, and whatever is left is
+        checked by verify (called by Worksheet.make before anything is
+        written). Problems with a wrong answer key are reported and kept in
+        self.verifier.failures.
+        '''
+        self.verifier = verify.Verifier(tolerance=tolerance,
+                batch_size=batch_size)
+
+    def disable_verification(self):
+        '''
+        Stops checking answer keys. Problems still queued aren't checked.
+        '''
+        self.verifier = None
+
+    def verify(self):
+        '''
+        Checks the answer keys of the problems queued since the last check.
+        Every wrong one is printed. Returns the list of (Problem, kind,
+        reason) of the wrong ones, or an empty list if verification isn't
+        enabled.
+        '''
+        if self.verifier is None:
+            return []
+        start = time.perf_counter()
+        failures = self.verifier.run()
+        if self.instrumentation is not None:
+            self.instrumentation.add_time('verify', time.perf_counter() - start)
+        for p, kind, reason in failures:
+            print('VerificationError: %s problem %s has a wrong answer key: %s'
+                    % (kind, p.str_question, reason))
+        return failures
+
+    def manage_sympy_cache(self, every=1000, max_entries=None):
+        '''
+        Keeps sympy's global cache from growing without bound, for
+        long-running processes generating many problems. The cache is
+        cleared every time every problems are added, when it holds more than
+        max_entries entries (see problemgen.cache.CacheManager), and after
+        every Worksheet.make. The resident memory is measured at every clear
+        and reported by memory_stats.
+        '''
+        self.cache_manager = cache.CacheManager(every=every,
+                max_entries=max_entries)
+
+    def disable_sympy_cache_management(self):
+        '''
+        Stops clearing sympy's cache.
+        '''
+        self.cache_manager = None
 
-    def add_problem(self, p):
+    def clear_sympy_cache(self):
+        '''
+        Clears sympy's global cache now, e.g. between two worksheets.
+        '''
+        if self.cache_manager is None:
+            cache.clear_cache()
+        else:
+            self.cache_manager.clear()
+        if self.instrumentation is not None:
+            self.instrumentation.count('sympy_cache.clears')
+
+    def memory_stats(self):
+        '''
+        Returns the resident memory of the process and the size of sympy's
+        cache, see problemgen.cache.CacheManager.report. Without a cache
+        manager, the counters of problems and clears are 0.
+        '''
+        if self.cache_manager is None:
+            return cache.CacheManager().report()
+        return self.cache_manager.report()
+
+    def use_bloom_dedupe(self, error_rate=0.001, initial_capacity=100000,
+            recent_window=10000):
+        '''
+        Remembers the problems added in a scalable Bloom filter instead of a
+        set of strings, using a few bytes per problem. Meant for generating
+        very large banks. Duplicates among the recent_window most recent
+        problems are detected exactly; older ones are detected with a false
+        positive rate below error_rate.
+
+        Arguments:
+        error_rate          -   bound on the rate of new problems wrongly
+                                rejected as duplicates.
+        initial_capacity    -   number of problems the first Bloom filter is
+                                sized for. It grows as needed.
+        recent_window       -   number of recent problems checked exactly.
+        '''
+        keys = dedupe.BloomDedupe(initial_capacity=initial_capacity,
+                error_rate=error_rate, recent_window=recent_window)
+        if isinstance(self.problem_keys, set):
+            for key in self.problem_keys:
+                keys.add(key)
+        self.problem_keys = keys
+
+    def problem_key(self, p, data=None):
+        '''
+        Returns the key used to detect duplicates of the Problem p, which was
+        created from data (an Expression, Equation or System, or None).
+        '''
+        if self.fingerprinter is not None and data is not None:
+            key = self.fingerprinter.fingerprint(data)
+            if key is not None:
+                return key
+        return str(p)
+
+    def add_problem(self, p, data=None, kind=''):
         '''
         Adds a problem to problem list, not allowing duplicates.
         Returns a boolean (True if problem was added successfully,
         false otherwise)
+
+        Arguments:
+        p       -   the Problem to add.
+        data    -   the Expression, Equation or System the Problem was
+                    created from, if any. Only used for fingerprinting.
+        kind    -   kind of the problem, kept by columnar storage.
+        '''
+        if self.instrumentation is not None:
+            start = time.perf_counter()
+            added = self.add_unique(p, data, kind)
+            self.instrumentation.add_time('dedupe', time.perf_counter() - start)
+            return added
+        return self.add_unique(p, data, kind)
+
+    def add_unique(self, p, data=None, kind=''):
         '''
+        Does the work of add_problem.
+        '''
+        key = self.problem_key(p, data)
         # Checking for duplicate
-        for problem in self.problems:
-            if str(problem) == str(p):
+        if key in self.problem_keys:
+            return False
+        # Checking for problems handed out before
+        if self.seen is not None:
+            if key in self.seen:
                 return False
+            self.seen.add(key)
         # Adding problem
-        self.problems.append(p)
+        if isinstance(self.problems, list):
+            self.problems.append(p)
+        else:
+            self.problems.append(p, kind)
+        self.problem_keys.add(key)
+        self.last_data = data
+        if self.verifier is not None:
+            self.verifier.add(p, data, kind)
+            if len(self.verifier.pending) >= self.verifier.batch_size:
+                self.verify()
+        if self.cache_manager is not None:
+            if self.cache_manager.problem_added() and \
+                    self.instrumentation is not None:
+                self.instrumentation.count('sympy_cache.clears')
         return True
 
+    def generate_unique(self, kind, generate):
+        '''
+        Calls generate until it produces a problem that isn't a duplicate,
+        and adds it. Raises a GeneratorError after NUM_ATTEMPTS duplicates;
+        errors raised by generate are passed on. This is the loop shared by
+        every way of generating problems (add_generated, Generator.stream,
+        SeedBank.fill), so that they all dedupe the same way.
+
+        Every call is recorded in the retry telemetry of its kind (see
+        retry_stats).
+
+        Arguments:
+        kind        -   kind of problem generated, i.e. the name of the add
+                        method without the 'add_' prefix.
+        generate    -   function taking no arguments and returning a tuple
+                        (Problem, data), where data is the Expression,
+                        Equation or System the Problem was created from (or
+                        None).
+
+        Returns the Problem added.
+        '''
+        record = self.retries.get(kind)
+        if record is None:
+            record = self.retries[kind] = dict.fromkeys(RETRY_FIELDS, 0)
+        record['calls'] += 1
+        attempts = 0
+        try:
+            for i in range(self.NUM_ATTEMPTS):
+                attempts += 1
+                start = time.perf_counter()
+                try:
+                    # Attempting to add it
+                    problem, data = generate()
+                    added = self.add_problem(problem, data, kind)
+                except:
+                    # The candidate is lost along with the add call
+                    record['errors'] += 1
+                    record['rejected_seconds'] += time.perf_counter() - start
+                    raise
+                if added:
+                    return problem
+                # Problem was a dupe, looping back
+                record['duplicates'] += 1
+                record['rejected_seconds'] += time.perf_counter() - start
+            # All of the problems generated were dupes, there likely aren't many unique
+            # problems for the parameters given
+            record['failures'] += 1
+            raise backend.GeneratorError(kind, 'Unable to generate additional ' +
+                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
+                    'Your input parameters may be too restrictive.')
+        finally:
+            record['attempts'] += attempts
+            if self.instrumentation is not None:
+                self.instrumentation.count('add.%s.calls' % kind)
+                self.instrumentation.count('add.%s.attempts' % kind, attempts)
+
+    def add_generated(self, kind, generate):
+        '''
+        Adds a problem made by generate that isn't a duplicate, see
+        generate_unique. Errors are printed rather than raised.
+
+        Returns the Problem added, or None if none could be added.
+        '''
+        try:
+            return self.generate_unique(kind, generate)
+        except backend.GeneratorError as e:
+            print('GeneratorError: %s' % e.message)
+        except:
+            backend.PrintException()
+
+    def retry_stats(self, kind=None):
+        '''
+        Returns the retry telemetry of the add_* calls made so far, to spot
+        parameter sets that waste work on rejected candidates.
+
+        For every kind (name of the add method without the 'add_' prefix) the
+        telemetry is a dictionary holding:
+        calls           -   number of add calls.
+        attempts        -   number of candidates generated.
+        duplicates      -   number of candidates rejected as duplicates.
+        errors          -   number of exceptions swallowed (the add call
+                            gives up on the first one).
+        failures        -   number of add calls that gave up after
+                            NUM_ATTEMPTS duplicates.
+        rejected_seconds -  time spent generating rejected candidates.
+        rejection_rate  -   fraction of the candidates that were rejected.
+        attempts_per_problem
+                        -   average number of candidates generated per
+                            problem added.
+
+        Arguments:
+        kind    -   if given, only the telemetry of this kind is returned
+                    (all zeros if it was never generated). Otherwise a
+                    dictionary of kind -> telemetry is returned.
+        '''
+        if kind is not None:
+            record = self.retries.get(kind, dict.fromkeys(RETRY_FIELDS, 0))
+            added = record['attempts'] - record['duplicates'] - record['errors']
+            summary = dict(record)
+            if record['attempts']:
+                summary['rejection_rate'] = 1 - added / record['attempts']
+            else:
+                summary['rejection_rate'] = 0.0
+            if added:
+                summary['attempts_per_problem'] = record['attempts'] / added
+            else:
+                summary['attempts_per_problem'] = 0.0
+            return summary
+        return {k: self.retry_stats(k) for k in self.retries}
+
+    def reset_retry_stats(self):
+        '''
+        Drops the retry telemetry collected so far.
+        '''
+        self.retries = {}
+
+    def add_from_bank(self, bank, kind, n, **params):
+        '''
+        Adds n problems drawn at random from a ProblemBank. No problems are
+        generated, so this never touches sympy.
+
+        Arguments:
+        bank        -   ProblemBank to draw the problems from.
+        kind        -   kind of problem to draw, e.g. 'linear' or 'quadratic'.
+        n           -   number of problems to draw.
+        params      -   parameters the problems must have been generated with.
+
+        Problems rejected by add_problem (duplicates, or problems handed out
+        before) are replaced by other ones drawn from the bank. Reports a
+        GeneratorError if the bank runs out of problems before n are added.
+        '''
+        try:
+            stored = bank.count(kind, **params)
+            if stored < n:
+                raise backend.GeneratorError(kind, 'Only ' + str(stored) +
+                        ' problems of this kind are stored in ' + bank.fn + '.')
+            added = 0
+            for position in bank.iter_positions(kind, params):
+                if added == n:
+                    break
+                if self.add_problem(bank.get(position), kind=kind):
+                    added += 1
+            if added < n:
+                raise backend.GeneratorError(kind, 'Only ' + str(added) +
+                        ' of the ' + str(n) + ' problems could be added from ' +
+                        bank.fn + ', the others are duplicates or were ' +
+                        'handed out before.')
+        except backend.GeneratorError as e:
+            print('GeneratorError: %s' % e.message)
+        except:
+            backend.PrintException()
+
+    def add_from_store(self, query, n):
+        '''
+        Adds n problems selected from a ProblemStore.
+
+        Arguments:
+        query       -   StoreQuery describing the problems to select, as
+                        returned by ProblemStore.query.
+        n           -   number of problems to add.
+
+        Problems rejected by add_problem (duplicates, or problems handed out
+        before) are replaced by other ones matching the query. Only the
+        problems added are counted as used in the store. Reports a
+        GeneratorError if fewer than n problems could be added.
+        '''
+        try:
+            added = []
+            candidates = query.candidates()
+            for i, p in candidates:
+                if len(added) == n:
+                    break
+                if self.add_problem(p, kind=query.kind):
+                    added.append(i)
+            # The cursor has to be done with before the store is updated
+            candidates.close()
+            query.mark_used(added)
+            if len(added) < n:
+                raise backend.GeneratorError(query.kind, 'Only ' +
+                        str(len(added)) + ' of the ' + str(n) + ' problems ' +
+                        'could be added from ' + query.store.fn +
+                        ', the others are duplicates or were handed out before.')
+        except backend.GeneratorError as e:
+            print('GeneratorError: %s' % e.message)
+        except:
+            backend.PrintException()
+
     def add_algebraic_expression(self, num_terms=2, types='i',
             symbols='x', order=1, mixed_var=False, coeff=[],
             max_lowest_term=10, max_multiple=1, same_base_root=True):
@@ -91,25 +537,14 @@ class ProblemContainer:
                             should reduce to the same base root.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                expr = self.gen.gen_algebraic_expression(num_terms=num_terms, types=types,
-                        symbols=symbols, order=order, mixed_var=mixed_var, coeff=coeff,
-                        max_lowest_term=max_lowest_term, max_multiple=max_multiple, same_base_root=same_base_root)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(expr)):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('algebraic', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            expr = self.gen.gen_algebraic_expression(num_terms=num_terms, types=types,
+                    symbols=symbols, order=order, mixed_var=mixed_var, coeff=coeff,
+                    max_lowest_term=max_lowest_term, max_multiple=max_multiple, same_base_root=same_base_root)
+            return backend.Problem(expr), expr
+
+        return self.add_generated('algebraic_expression', generate)
 
     def add_num_conv(self, q_type='num', s_type='word', types='i',
             lower_num_bound=1, upper_num_bound=1e9):
@@ -133,25 +568,14 @@ class ProblemContainer:
         upper_num_bound     -   Upper bound of number generated
 
         '''
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                prob = self.gen.gen_num_conv(q_type=q_type, s_type=s_type,
-                        types=types, lower_num_bound=lower_num_bound,
-                        upper_num_bound=upper_num_bound)
-                # Attempting to add it
-                if self.add_problem(prob):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('num_conv', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            prob = self.gen.gen_num_conv(q_type=q_type, s_type=s_type,
+                    types=types, lower_num_bound=lower_num_bound,
+                    upper_num_bound=upper_num_bound)
+            return prob, None
+
+        return self.add_generated('num_conv', generate)
     def add_dec_to_frac(self, max_lowest_term=10, max_multiple=1):
         '''
         Adds a Problem for converting decimals to fractions.
@@ -165,24 +589,13 @@ class ProblemContainer:
                         and radicals.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                prob = self.gen.gen_dec_to_frac(max_lowest_term=max_lowest_term,
-                        max_multiple=max_multiple)
-                # Attempting to add it
-                if self.add_problem(prob):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('dec_to_frac', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            prob = self.gen.gen_dec_to_frac(max_lowest_term=max_lowest_term,
+                    max_multiple=max_multiple)
+            return prob, None
+
+        return self.add_generated('dec_to_frac', generate)
 
     # Fix bug for repeating decimals being truncated
     def add_frac_to_dec(self, max_lowest_term=10, max_multiple=1):
@@ -198,24 +611,13 @@ class ProblemContainer:
                     -   the maximum multiplier used in the creation of fractions
                         and radicals.
         '''
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                prob = self.gen.gen_frac_to_dec(max_lowest_term=max_lowest_term,
-                        max_multiple=max_multiple)
-                # Attempting to add it
-                if self.add_problem(prob):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('frac_to_dec', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            prob = self.gen.gen_frac_to_dec(max_lowest_term=max_lowest_term,
+                    max_multiple=max_multiple)
+            return prob, None
+
+        return self.add_generated('frac_to_dec', generate)
 
     def add_equation(self, num_lhs_terms=2, num_rhs_terms=1, types='i',
             symbols='x', order_lhs=1, order_rhs=0, lhs_coeff=[],
@@ -258,29 +660,18 @@ class ProblemContainer:
                             Default True.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                eq = self.gen.gen_equation(num_lhs_terms=num_lhs_terms,
-                        num_rhs_terms=num_rhs_terms, types=types,
-                        symbols=symbols, order_lhs=order_lhs, order_rhs=order_rhs,
-                        lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
-                        mixed_var=mixed_var, max_lowest_term=max_lowest_term,
-                        middle_sign=middle_sign, max_multiple=max_multiple,
-                        same_base_root=same_base_root)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(eq)):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('generic_equation', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            eq = self.gen.gen_equation(num_lhs_terms=num_lhs_terms,
+                    num_rhs_terms=num_rhs_terms, types=types,
+                    symbols=symbols, order_lhs=order_lhs, order_rhs=order_rhs,
+                    lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
+                    mixed_var=mixed_var, max_lowest_term=max_lowest_term,
+                    middle_sign=middle_sign, max_multiple=max_multiple,
+                    same_base_root=same_base_root)
+            return backend.Problem(eq), eq
+
+        return self.add_generated('equation', generate)
 
 
     def add_factorable_expression(self, order=2, max_lowest_term=10, factor_order=1,
@@ -302,25 +693,14 @@ class ProblemContainer:
         factored, the second expression is expanded.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                expr = self.gen.gen_factorable_expression(factor_order=factor_order, order=order, leading_coeff=leading_coeff,
-                        max_lowest_term=max_lowest_term, symbols=symbols, mixed_var=mixed_var, len_factor=len_factor)
-                prob = backend.Problem(expr)
-                # Attempting to add it
-                if self.add_problem(prob):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('factorable', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            expr = self.gen.gen_factorable_expression(factor_order=factor_order, order=order, leading_coeff=leading_coeff,
+                    max_lowest_term=max_lowest_term, symbols=symbols, mixed_var=mixed_var, len_factor=len_factor)
+            prob = backend.Problem(expr)
+            return prob, expr
+
+        return self.add_generated('factorable_expression', generate)
 
 # TODO: Sometimes this generates monomials, strange behavior
     def add_expandable_expression(self, order=2, max_lowest_term=10, factor_order=1,
@@ -342,30 +722,15 @@ class ProblemContainer:
         factored, the second expression is expanded.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                expr = self.gen.gen_factorable_expression(len_factor=len_factor, factor_order=factor_order, order=order, leading_coeff=leading_coeff,
-                        max_lowest_term=max_lowest_term, symbols=symbols, mixed_var = mixed_var)
-                # swap the reduced and unreduced terms
-                temp = expr.unreduced_terms
-                expr.unreduced_terms = expr.reduced_terms
-                expr.reduced_terms = temp
-                # Setting up problem
-                prob = backend.Problem(expr)
-                # Attempting to add it
-                if self.add_problem(prob):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('expandable', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            expr = self.gen.gen_expandable_expression(len_factor=len_factor, factor_order=factor_order, order=order, leading_coeff=leading_coeff,
+                    max_lowest_term=max_lowest_term, symbols=symbols, mixed_var = mixed_var)
+            # Setting up problem
+            prob = backend.Problem(expr)
+            return prob, expr
+
+        return self.add_generated('expandable_expression', generate)
 
     def add_linear(self, max_lowest_term=10, max_multiple=1, types='i',
             num_lhs_terms=2, num_rhs_terms=1, lhs_coeff=[], rhs_coeff=[],
@@ -406,29 +771,18 @@ class ProblemContainer:
         Returns Equation.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                eq = self.gen.gen_linear(max_lowest_term=max_lowest_term,
-                        max_multiple=max_multiple, types=types,
-                        num_lhs_terms=num_lhs_terms, num_rhs_terms=num_rhs_terms,
-                        lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
-                        middle_sign=middle_sign, mixed_var=mixed_var,
-                        symbols=symbols, same_base_root=same_base_root,
-                        order_lhs=order_lhs, order_rhs=order_rhs)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(eq)):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('linear', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            eq = self.gen.gen_linear(max_lowest_term=max_lowest_term,
+                    max_multiple=max_multiple, types=types,
+                    num_lhs_terms=num_lhs_terms, num_rhs_terms=num_rhs_terms,
+                    lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
+                    middle_sign=middle_sign, mixed_var=mixed_var,
+                    symbols=symbols, same_base_root=same_base_root,
+                    order_lhs=order_lhs, order_rhs=order_rhs)
+            return backend.Problem(eq), eq
+
+        return self.add_generated('linear', generate)
 
     def add_numerical_expression(self, num_terms=2, op='+-', types='i',
             max_lowest_term=10, max_multiple=1, same_base_root=True):
@@ -464,25 +818,21 @@ class ProblemContainer:
         Returns an Expression.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                expr = self.gen.gen_numerical_expression(num_terms=num_terms,
+        def generate():
+            if self.fingerprinter is None and self.verifier is None:
+                # Rational problems are rendered without sympy. Fingerprints
+                # and answer key checks need the Expression.
+                prob = self.gen.gen_numerical_problem(num_terms=num_terms,
                         op=op, types=types, max_lowest_term=max_lowest_term,
                         max_multiple=max_multiple, same_base_root=same_base_root)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(expr)):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('numerical', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+                return prob, None
+            # Generating expression
+            expr = self.gen.gen_numerical_expression(num_terms=num_terms,
+                    op=op, types=types, max_lowest_term=max_lowest_term,
+                    max_multiple=max_multiple, same_base_root=same_base_root)
+            return backend.Problem(expr), expr
+
+        return self.add_generated('numerical_expression', generate)
 
     # coeffs are generated like max_lowest_term^2, not like max_lowest_term
     # TODO: bug
@@ -504,25 +854,14 @@ class ProblemContainer:
         Returns an Equation.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                eq = self.gen.gen_quadratic(max_lowest_term=max_lowest_term,
-                        factorable=factorable, solvable=solvable,
-                        leading_coeff=leading_coeff, middle_sign=middle_sign)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(eq)):
-                    return
-                # Problem was a dupe, looping back
-            # All of the problems generated were dupes, there likely aren't many unique
-            # problems for the parameters given
-            raise backend.GeneratorError('quadratic', 'Unable to generate additional ' +
-                    'unique problems after trying ' + str(self.NUM_ATTEMPTS) + ' times.' +
-                    'Your input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            eq = self.gen.gen_quadratic(max_lowest_term=max_lowest_term,
+                    factorable=factorable, solvable=solvable,
+                    leading_coeff=leading_coeff, middle_sign=middle_sign)
+            return backend.Problem(eq), eq
+
+        return self.add_generated('quadratic', generate)
 
     def add_system(self, num_equations=2, num_lhs_terms=2, num_rhs_terms=1,
             types='i', symbols='xy', order_lhs=1, order_rhs=0, lhs_coeff=[],
@@ -569,29 +908,123 @@ class ProblemContainer:
                             terms. Default 'x'.
         '''
 
-        try:
-            for i in range(self.NUM_ATTEMPTS):
-                # Generating expression
-                syst = self.gen.gen_system(num_equations=num_equations,
-                        num_lhs_terms=num_lhs_terms, num_rhs_terms=num_rhs_terms,
-                        types=types, symbols=symbols, order_lhs=order_lhs,
-                        order_rhs=order_rhs, lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
-                        mixed_var=mixed_var, max_lowest_term=max_lowest_term,
-                        middle_sign=middle_sign, max_multiple=max_multiple,
-                        same_base_root=same_base_root)
-                # Attempting to add it
-                if self.add_problem(backend.Problem(syst)):
-                    return
-                # Problem was a dupe, looping back
-                # All of the problems generated were dupes, likely aren't many unique
-                # problems for the parameters given
-                raise backend.GeneratorError('system', 'Unable to generate additional ' +
-                        'unique problems after trying ' + str(self.NUM_ATTEMPTS) +
-                        ' times.' + 'Input parameters may be too restrictive.')
-        except backend.GeneratorError as e:
-            print('GeneratorError: %s' % e.message)
-        except:
-            backend.PrintException()
+        def generate():
+            # Generating expression
+            syst = self.gen.gen_system(num_equations=num_equations,
+                    num_lhs_terms=num_lhs_terms, num_rhs_terms=num_rhs_terms,
+                    types=types, symbols=symbols, order_lhs=order_lhs,
+                    order_rhs=order_rhs, lhs_coeff=lhs_coeff, rhs_coeff=rhs_coeff,
+                    mixed_var=mixed_var, max_lowest_term=max_lowest_term,
+                    middle_sign=middle_sign, max_multiple=max_multiple,
+                    same_base_root=same_base_root)
+            return backend.Problem(syst), syst
+
+        return self.add_generated('system', generate)
+
+    def iter_problems(self, kind, n=None, **params):
+        '''
+        Generator adding unique problems of the given kind one at a time,
+        and yielding every one as soon as it is added, so that they can be
+        shown or written while the rest are still being generated. The
+        problems are added with add_<kind>, so they are checked against the
+        problems already in the container (and the seen index, if any)
+        and kept in self.problems like any other.
+
+        Arguments:
+        kind        -   kind of problem, i.e. the name of an add method
+                        without the 'add_' prefix, e.g. 'linear'.
+        n           -   number of problems to yield. None to keep going
+                        until no more unique problems can be generated.
+        params      -   keyword arguments passed on to the add method.
+
+        Stops early if a problem can't be added (the error is printed by
+        add_generated).
+        '''
+        add = getattr(self, 'add_' + kind)
+        count = 0
+        while n is None or count < n:
+            p = add(**params)
+            if p is None:
+                return
+            count += 1
+            yield p
+
+    def iter_algebraic_expression(self, n=None, **params):
+        '''
+        Like add_algebraic_expression, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('algebraic_expression', n, **params)
+
+    def iter_num_conv(self, n=None, **params):
+        '''
+        Like add_num_conv, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('num_conv', n, **params)
+
+    def iter_dec_to_frac(self, n=None, **params):
+        '''
+        Like add_dec_to_frac, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('dec_to_frac', n, **params)
+
+    def iter_frac_to_dec(self, n=None, **params):
+        '''
+        Like add_frac_to_dec, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('frac_to_dec', n, **params)
+
+    def iter_equation(self, n=None, **params):
+        '''
+        Like add_equation, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('equation', n, **params)
+
+    def iter_factorable_expression(self, n=None, **params):
+        '''
+        Like add_factorable_expression, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('factorable_expression', n, **params)
+
+    def iter_expandable_expression(self, n=None, **params):
+        '''
+        Like add_expandable_expression, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('expandable_expression', n, **params)
+
+    def iter_linear(self, n=None, **params):
+        '''
+        Like add_linear, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('linear', n, **params)
+
+    def iter_numerical_expression(self, n=None, **params):
+        '''
+        Like add_numerical_expression, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('numerical_expression', n, **params)
+
+    def iter_quadratic(self, n=None, **params):
+        '''
+        Like add_quadratic, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('quadratic', n, **params)
+
+    def iter_system(self, n=None, **params):
+        '''
+        Like add_system, yielding n problems one at a time, see
+        iter_problems.
+        '''
+        return self.iter_problems('system', n, **params)
 
 class Worksheet(ProblemContainer):
     '''
@@ -635,59 +1068,126 @@ class Worksheet(ProblemContainer):
 
     # TODO: improve line break errors for fields in \text{}
     # TODO: Use PyLatex to avoid external dependencies
-    def make(self, num_cols=2, separate_answers=True):
+    def make(self, num_cols=2, separate_answers=True, problems=None):
         '''
         Takes a predefined latex template, an author, a title, and a list of
         problems with their solutions and generates a latex worksheet.
 
+        The worksheets are written to their files as they are made, in
+        sections: the header, then the \\item of every problem, then the
+        footer. Both worksheets are written in a single pass over the
+        problems; the answers are kept in a temporary file until the
+        problems are all written.
+
         num_cols: number of columns in the worksheet.
         separate_answers: boolean describing if answers should be generated in
         a separate worksheet.
+        problems: optional iterable of the Problems to put in the worksheet,
+        e.g. iter_linear(100), consumed as it is written. The problems it
+        generates are verified in sections of the verifier's batch_size,
+        before their items are written. Default self.problems.
 
         Returns nothing.
         '''
         assert num_cols >= 1
+        if problems is None:
+            problems = self.problems
+        # Flagging wrong answer keys before anything is printed
+        self.verify()
         # Opening template
         if num_cols == 1:
             template = TEMPLATE1COL
         else:
             template = TEMPLATE
 
-        # Formatting problems to fit into a latex enumerate environment
-
-        question_str = ''
-        solution_str = ''
-        for p in self.problems:
-            q = self.make_line_breaks(p.latex_question, 200)
-            s = self.make_line_breaks(p.latex_solution, 200)
-            question_str += '\\item $ %s $\n \\vspace{10mm}\n' % q
-            solution_str += '\\item $ %s $\n \\vspace{10mm}\n' % s
-
         # Creating author and title strings
         title_str = '\\chead{\\textbf{\\LARGE %s }}\n' % self.title
         author_str = '\\rhead{%s}\n' % self.author
 
-        # Subbing strings into template to make the worksheet. The template
-        # should have 5 separate %s characters marking the locations of each
-        # of these substitutions in order, and a %d character for the number of columns
-        worksheet = template % (num_cols, title_str, author_str, self.message, question_str,
-                solution_str)
-
+        # Splitting the templates into the sections around the problems and
+        # the solutions. The header should have 3 separate %s characters
+        # marking the locations of the title, author and message in order,
+        # and a %d character for the number of columns
+        header, middle, footer = split_template(template)
+        header = header % (num_cols, title_str, author_str, self.message)
         filename = self.worksheet_fn[:-4] + '--with-answers' + self.worksheet_fn[-4:]
-        # Saving worksheet
         worksheet_file = open(filename, 'w')
-        worksheet_file.write(worksheet)
-        worksheet_file.close()
+        # Solutions are spooled until all of the problems are written
+        solution_file = tempfile.TemporaryFile('w+')
+        worksheet_files = [worksheet_file]
+        if separate_answers:
+            # Generating another sheet with no Answers
+            header_no_answers, footer_no_answers = \
+                    split_template(TEMPLATE_NO_ANSWERS)
+            filename_no_answers = self.worksheet_fn[:-4] + '--without-answers' + \
+                    self.worksheet_fn[-4:]
+            no_answers_file = open(filename_no_answers, 'w')
+            no_answers_file.write(header_no_answers % (num_cols, title_str,
+                author_str, self.message))
+            worksheet_files.append(no_answers_file)
+        try:
+            worksheet_file.write(header)
+            section = []
+            for p in problems:
+                section.append(p)
+                if self.verifier is None or \
+                        len(section) >= self.verifier.batch_size:
+                    self.write_items(section, worksheet_files, solution_file)
+                    section = []
+            self.write_items(section, worksheet_files, solution_file)
+            worksheet_file.write(middle)
+            solution_file.seek(0)
+            shutil.copyfileobj(solution_file, worksheet_file)
+            worksheet_file.write(footer)
+            if separate_answers:
+                no_answers_file.write(footer_no_answers)
+        finally:
+            solution_file.close()
+            for f in worksheet_files:
+                f.close()
+
+        # Compiling worksheets and saving their names
+        self.output_fn = self.compile(filename)
+        if separate_answers:
+            self.output_fn_no_answers = self.compile(filename_no_answers)
 
-        # Compiling worksheet
+        if self.cache_manager is not None:
+            # Nothing generated for this worksheet is needed anymore
+            self.clear_sympy_cache()
+
+    def write_items(self, problems, worksheet_files, solution_file):
+        '''
+        Writes the \\item of every problem to the worksheet files and of
+        its solution to solution_file. The problems generated since the
+        last check (e.g. by an iterable given to make) are verified first.
+        '''
+        # Flagging wrong answer keys before the problems are printed
+        self.verify()
+        # Formatting problems to fit into a latex enumerate environment
+        for p in problems:
+            q = self.make_line_breaks(p.latex_question, 200)
+            s = self.make_line_breaks(p.latex_solution, 200)
+            question_item = '\\item $ %s $\n \\vspace{10mm}\n' % q
+            for f in worksheet_files:
+                f.write(question_item)
+            solution_file.write('\\item $ %s $\n \\vspace{10mm}\n' % s)
+
+    def compile(self, filename):
+        '''
+        Runs pdflatex on a worksheet, then moves the tex file to tex/ and the
+        pdf to worksheets/.
+
+        Returns the filename of the output pdf.
+        '''
         worksheet_dir = 'worksheets'
+        tex_dir = 'tex'
         output_pdf = filename.replace('.tex', '.pdf')
+        start = time.perf_counter()
         try:
             #subprocess.check_output("pdflatex %s" % filename, stderr=subprocess.STDOUT)
-            os.system("pdflatex %s" % filename) 
+            os.system("pdflatex %s" % filename)
             # Cleaning files and organizing
             os.system("rm *.aux *.log")
-            tex_dir = 'tex'
             if not os.path.exists(worksheet_dir):
                 os.makedirs(worksheet_dir)
             if not os.path.exists(tex_dir):
@@ -696,40 +1196,9 @@ class Worksheet(ProblemContainer):
             os.system("mv " + output_pdf + ' ' +  worksheet_dir + '/' + output_pdf)
         except (OSError, IOError, subprocess.CalledProcessError) as e:
             print(e)
-            
-
-        # Saving worksheet name
-        self.output_fn = worksheet_dir + '/' + output_pdf
-
-        if separate_answers:
-            # Generating another sheet with no Answers
-
-            worksheet = TEMPLATE_NO_ANSWERS % (num_cols, title_str, author_str, self.message, question_str)
-
-            filename = self.worksheet_fn[:-4] + '--without-answers' + self.worksheet_fn[-4:]
-            # Saving worksheet
-            worksheet_file = open(filename, 'w')
-            worksheet_file.write(worksheet)
-            worksheet_file.close()
-
-            try:
-                #subprocess.check_output("pdflatex %s" % filename, stderr=subprocess.STDOUT)
-                os.system("pdflatex %s" % filename) 
-                # Cleaning files and organizing
-                os.system("rm *.aux *.log")
-                worksheet_dir = 'worksheets'
-                tex_dir = 'tex'
-                if not os.path.exists(worksheet_dir):
-                    os.makedirs(worksheet_dir)
-                if not os.path.exists(tex_dir):
-                    os.makedirs(tex_dir)
-                os.system("mv " + filename + ' ' +  tex_dir + '/' + filename)
-                output_pdf = filename.replace('.tex', '.pdf')
-                os.system("mv " + output_pdf + ' ' +  worksheet_dir + '/' + output_pdf)
-            except (OSError, IOError, subprocess.CalledProcessError) as e:
-                 print(e)
-
-            self.output_fn_no_answers = worksheet_dir + '/' + output_pdf
+        if self.instrumentation is not None:
+            self.instrumentation.add_time('pdflatex', time.perf_counter() - start)
+        return worksheet_dir + '/' + output_pdf
 
     def make_line_breaks(self, string, num_char=70):
         '''
@@ -754,6 +1223,16 @@ class Worksheet(ProblemContainer):
         Returns nothing.
         '''
         os.system('xdg-open "%s"' % self.output_fn)
+def split_template(template):
+    '''
+    Splits a worksheet template at the %s marking the problems (and the
+    solutions). Returns a list [header, footer], or [header, middle,
+    footer] for templates with solutions. The header still has to be
+    formatted with the number of columns, title, author and message.
+    '''
+    sections = template.split('%s')
+    return ['%s'.join(sections[:4])] + sections[4:]
+
 # Latex template
 TEMPLATE = '''
 \\documentclass[11pt]{article}
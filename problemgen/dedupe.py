@@ -0,0 +1,453 @@
+import problemgen.backend as backend
+import hashlib
+import math as m
+import mmap
+import os
+import random
+import struct
+
+from collections import deque
+
+from sympy import Rational, sympify
+
+# Header of a SeenIndex file: magic, capacity (number of slots), count
+SEEN_HEADER = struct.Struct('<8sQQ')
+SEEN_MAGIC = b'PGSEEN01'
+SLOT = struct.Struct('<Q')
+# Header of a BloomFilter file: magic, number of bits, number of hashes, count
+BLOOM_HEADER = struct.Struct('<8sQQQ')
+BLOOM_MAGIC = b'PGBLOOM1'
+
+def hash_key(key):
+    '''
+    Returns a stable 64 bit hash of a string. 0 is never returned, since it
+    marks an empty slot in a SeenIndex.
+    '''
+    h = SLOT.unpack(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest())[0]
+    return h or 1
+
+def open_file_map(fn, header, size):
+    '''
+    Creates fn with the given header bytes and a total size of size bytes if
+    it doesn't exist, and returns (file, mmap) for it.
+    '''
+    if not os.path.exists(fn):
+        directory = os.path.dirname(fn)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(fn, 'wb') as f:
+            f.write(header)
+            f.truncate(size)
+    f = open(fn, 'r+b')
+    return f, mmap.mmap(f.fileno(), 0)
+
+class SeenIndex:
+    '''
+    Class designed to remember every problem handed out, across runs. It is
+    an open addressing hash table of 64 bit problem hashes stored in a file
+    and accessed through mmap, so lookups and insertions are O(1) and nothing
+    is loaded up front.
+
+    Member variables:
+    fn          -   filename of the index.
+    capacity    -   number of slots in the table. The table doubles in size
+                    when it gets half full.
+    count       -   number of problems in the index.
+    '''
+
+    def __init__(self, fn, capacity=1 << 16):
+        '''
+        Arguments:
+
+        fn          -   filename of the index. Created if it doesn't exist.
+        capacity    -   initial number of slots for a new index. Must be a
+                        power of 2.
+        '''
+        assert capacity & (capacity - 1) == 0
+        self.fn = fn
+        self.file, self.map = open_file_map(fn,
+                SEEN_HEADER.pack(SEEN_MAGIC, capacity, 0),
+                SEEN_HEADER.size + capacity * SLOT.size)
+        magic, self.capacity, self.count = SEEN_HEADER.unpack_from(self.map, 0)
+        assert magic == SEEN_MAGIC
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(hash_key(key))[1]
+
+    def find(self, h):
+        '''
+        Returns (slot, found) for the hash h, where slot is the slot holding
+        h or the empty slot it would be stored in.
+        '''
+        mask = self.capacity - 1
+        slot = h & mask
+        while True:
+            stored = SLOT.unpack_from(self.map, SEEN_HEADER.size + slot * SLOT.size)[0]
+            if stored == h:
+                return slot, True
+            if stored == 0:
+                return slot, False
+            slot = (slot + 1) & mask
+
+    def add(self, key):
+        '''
+        Adds a problem key (typically str(problem)) to the index.
+        '''
+        h = hash_key(key)
+        slot, found = self.find(h)
+        if found:
+            return
+        SLOT.pack_into(self.map, SEEN_HEADER.size + slot * SLOT.size, h)
+        self.count += 1
+        SEEN_HEADER.pack_into(self.map, 0, SEEN_MAGIC, self.capacity, self.count)
+        if self.count * 2 > self.capacity:
+            self.grow()
+
+    def grow(self):
+        '''
+        Doubles the capacity of the table, rehashing every stored hash into a
+        new file that then replaces the old one.
+        '''
+        hashes = [h for (h,) in SLOT.iter_unpack(self.map[SEEN_HEADER.size:]) if h]
+        self.close()
+        new_fn = self.fn + '.tmp'
+        if os.path.exists(new_fn):
+            os.remove(new_fn)
+        new = SeenIndex(new_fn, capacity=self.capacity * 2)
+        for h in hashes:
+            slot = new.find(h)[0]
+            SLOT.pack_into(new.map, SEEN_HEADER.size + slot * SLOT.size, h)
+        new.count = len(hashes)
+        SEEN_HEADER.pack_into(new.map, 0, SEEN_MAGIC, new.capacity, new.count)
+        new.close()
+        os.replace(new_fn, self.fn)
+        self.__init__(self.fn)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+class BloomFilter:
+    '''
+    Class designed to remember a very large number of problems in a fixed
+    amount of space, at the cost of a small rate of false positives (a new
+    problem is occasionally reported as seen). The bits are stored in a file
+    and accessed through mmap, or kept in memory.
+
+    Member variables:
+    fn          -   filename of the filter, or None for an in-memory filter.
+    num_bits    -   size of the bit array.
+    num_hashes  -   number of bits set per problem.
+    count       -   number of problems added to the filter.
+    '''
+
+    def __init__(self, fn, capacity=1000000, error_rate=0.001):
+        '''
+        Arguments:
+
+        fn          -   filename of the filter. Created if it doesn't exist,
+                        in which case the size is determined by capacity and
+                        error_rate. None keeps the filter in memory.
+        capacity    -   number of problems the filter is sized for.
+        error_rate  -   false positive rate once capacity problems were added.
+        '''
+        assert capacity >= 1
+        assert 0 < error_rate < 1
+        num_bits = int(-capacity * m.log(error_rate) / (m.log(2) ** 2)) + 1
+        num_hashes = max(1, int(round(num_bits / capacity * m.log(2))))
+        self.fn = fn
+        header = BLOOM_HEADER.pack(BLOOM_MAGIC, num_bits, num_hashes, 0)
+        size = BLOOM_HEADER.size + (num_bits + 7) // 8
+        if fn is None:
+            self.file = None
+            self.map = bytearray(header) + bytearray(size - len(header))
+        else:
+            self.file, self.map = open_file_map(fn, header, size)
+        magic, self.num_bits, self.num_hashes, self.count = \
+                BLOOM_HEADER.unpack_from(self.map, 0)
+        assert magic == BLOOM_MAGIC
+
+    def __len__(self):
+        return self.count
+
+    def bits(self, key):
+        '''
+        Returns the positions of the bits representing a key, using double
+        hashing on a single 128 bit digest.
+        '''
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        for b in self.bits(key):
+            if not self.map[BLOOM_HEADER.size + (b >> 3)] & (1 << (b & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        '''
+        Adds a problem key (typically str(problem)) to the filter.
+        '''
+        for b in self.bits(key):
+            self.map[BLOOM_HEADER.size + (b >> 3)] |= 1 << (b & 7)
+        self.count += 1
+        BLOOM_HEADER.pack_into(self.map, 0, BLOOM_MAGIC, self.num_bits,
+                self.num_hashes, self.count)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+class ScalableBloomFilter:
+    '''
+    Class designed to dedupe an unknown, possibly very large, number of
+    problems in a few bytes per problem. It is a series of in-memory
+    BloomFilters: when the last one is full, a larger one with a tighter
+    error rate is started, which keeps the overall false positive rate
+    below error_rate however many problems are added.
+
+    Member variables:
+    filters     -   list of BloomFilters, the last one receiving new keys.
+    error_rate  -   bound on the overall false positive rate.
+    count       -   number of keys added.
+
+    Constants:
+    GROWTH      -   capacity ratio between two consecutive filters.
+    TIGHTENING  -   error rate ratio between two consecutive filters.
+    '''
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, initial_capacity=100000, error_rate=0.001):
+        assert initial_capacity >= 1
+        assert 0 < error_rate < 1
+        self.error_rate = error_rate
+        self.count = 0
+        self.capacities = [initial_capacity]
+        self.filters = [BloomFilter(None, capacity=initial_capacity,
+            error_rate=error_rate * (1 - self.TIGHTENING))]
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        for f in self.filters:
+            if key in f:
+                return True
+        return False
+
+    def add(self, key):
+        if self.filters[-1].count >= self.capacities[-1]:
+            capacity = self.capacities[-1] * self.GROWTH
+            error_rate = self.error_rate * (1 - self.TIGHTENING) * \
+                    self.TIGHTENING ** len(self.filters)
+            self.capacities.append(capacity)
+            self.filters.append(BloomFilter(None, capacity=capacity,
+                error_rate=error_rate))
+        self.filters[-1].add(key)
+        self.count += 1
+
+    def num_bytes(self):
+        '''
+        Returns the memory used by the bit arrays.
+        '''
+        return sum(len(f.map) for f in self.filters)
+
+class BloomDedupe:
+    '''
+    Class designed to replace the set of problem keys of a ProblemContainer
+    when generating very large banks. Keys are remembered in a
+    ScalableBloomFilter, and exactly only for the most recent ones.
+
+    A key found among the recent keys is a certain duplicate. While no
+    more than recent_window keys were added, every key is among the recent
+    ones, so a key only found in the Bloom filter is a false positive and
+    is accepted. Past that, a key only found in the Bloom filter is a
+    duplicate with probability at least 1 - error_rate, and is rejected.
+
+    Member variables:
+    bloom       -   ScalableBloomFilter holding every key.
+    recent      -   deque of the most recent keys.
+    recent_set  -   set of the keys in recent.
+    confirmed   -   number of duplicates found among the recent keys.
+    probable    -   number of duplicates only found in the Bloom filter.
+    false_positives
+                -   number of Bloom filter hits known to be false positives
+                    (and accepted) because every key was still recent.
+    '''
+
+    def __init__(self, initial_capacity=100000, error_rate=0.001,
+            recent_window=10000):
+        '''
+        Arguments:
+
+        initial_capacity    -   number of keys the first Bloom filter is
+                                sized for.
+        error_rate          -   bound on the false positive rate.
+        recent_window       -   number of recent keys checked exactly.
+                                0 disables the exact check.
+        '''
+        assert recent_window >= 0
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.recent_window = recent_window
+        self.clear()
+
+    def __len__(self):
+        return len(self.bloom)
+
+    def __contains__(self, key):
+        if key in self.recent_set:
+            self.confirmed += 1
+            return True
+        if key in self.bloom:
+            if len(self.bloom) <= self.recent_window:
+                # Every key added is in recent_set
+                self.false_positives += 1
+                return False
+            self.probable += 1
+            return True
+        return False
+
+    def add(self, key):
+        self.bloom.add(key)
+        if self.recent_window == 0:
+            return
+        if len(self.recent) == self.recent_window:
+            self.recent_set.discard(self.recent.popleft())
+        self.recent.append(key)
+        self.recent_set.add(key)
+
+    def clear(self):
+        self.bloom = ScalableBloomFilter(self.initial_capacity, self.error_rate)
+        self.recent = deque()
+        self.recent_set = set()
+        self.confirmed = 0
+        self.probable = 0
+        self.false_positives = 0
+
+class Fingerprinter:
+    '''
+    Class designed to detect problems that are the same up to term order or
+    trivial rewriting (3x + 2 = 5 and 2 + 3x = 5), without any symbolic
+    simplification. Every reduced term is evaluated at a fixed set of
+    random rational points, and the values are hashed:
+
+    Expressions     -   the multiset of the signed values of the terms when
+                        the expression only adds and subtracts, the ordered
+                        values and operations otherwise.
+    Equations       -   the values of lhs - rhs (up to sign for '='), and the
+                        middle sign.
+    Systems         -   the multiset of the fingerprints of the equations.
+
+    Expressions are compared by value, so fraction problems reducing to the
+    same terms (2/8 and 3/12) are considered the same.
+
+    Member variables:
+    num_points  -   number of points every term is evaluated at.
+    seed        -   seed used to pick the points. Fingerprints are stable
+                    across runs for a given seed, so they can be stored in a
+                    SeenIndex.
+    '''
+
+    def __init__(self, num_points=3, seed=0):
+        assert num_points >= 1
+        self.num_points = num_points
+        self.seed = seed
+        # (symbol name, point number) -> Rational
+        self.points = {}
+
+    def point(self, name, i):
+        '''
+        Returns the value the symbol called name takes at point i.
+        '''
+        if (name, i) not in self.points:
+            rng = random.Random('%s:%s:%d' % (self.seed, name, i))
+            self.points[(name, i)] = Rational(rng.choice([-1, 1]) *
+                    rng.randint(1, 997), rng.randint(1, 997))
+        return self.points[(name, i)]
+
+    def evaluate(self, term, i):
+        '''
+        Returns the value of a Term at point i.
+        '''
+        t = sympify(term.sympy_term)
+        return t.xreplace({s: self.point(s.name, i) for s in t.free_symbols})
+
+    def expression_values(self, e, i):
+        '''
+        Returns the value of an Expression's reduced terms at point i.
+        '''
+        values = [self.evaluate(t, i) for t in e.reduced_terms]
+        return e.combine_terms(values, e.operations)
+
+    def expression_key(self, e):
+        if all(op in ('', '+', '-') for op in e.operations):
+            terms = []
+            for j, t in enumerate(e.reduced_terms):
+                sign = -1 if e.operations[j] == '-' else 1
+                terms.append(','.join(str(sign * self.evaluate(t, i))
+                    for i in range(self.num_points)))
+            return 'expr+|' + '|'.join(sorted(terms))
+        terms = []
+        for j, t in enumerate(e.reduced_terms):
+            terms.append(e.operations[j] + ','.join(str(self.evaluate(t, i))
+                for i in range(self.num_points)))
+        return 'expr|' + '|'.join(terms) + e.operations[-1]
+
+    def equation_key(self, e):
+        values = [self.expression_values(e.lhs, i) - self.expression_values(e.rhs, i)
+                for i in range(self.num_points)]
+        if e.middle_sign == '=':
+            # ax + b = 0 and -ax - b = 0 are the same equation
+            for v in values:
+                if v != 0:
+                    if v.could_extract_minus_sign():
+                        values = [-v for v in values]
+                    break
+        return 'eq' + e.middle_sign + '|' + ','.join(str(v) for v in values)
+
+    def fingerprint(self, data):
+        '''
+        Returns the fingerprint of an Expression, Equation or System as a
+        string, or None for anything else.
+        '''
+        if isinstance(data, backend.Expression):
+            key = self.expression_key(data)
+        elif isinstance(data, backend.Equation):
+            key = self.equation_key(data)
+        elif isinstance(data, backend.System):
+            key = 'sys|' + '|'.join(sorted(self.equation_key(e)
+                for e in data.equations))
+        else:
+            return None
+        return 'fp:' + hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+def open_seen(directory, scope, bloom=False, **kwargs):
+    '''
+    Opens the persistent seen-problems index of a scope, e.g. a class or a
+    term, creating it if needed.
+
+    Arguments:
+    directory   -   directory holding every index.
+    scope       -   name of the scope. Slashes nest scopes, so
+                    'algebra1/fall-2026' keeps the index of the fall 2026
+                    term in the algebra1 directory.
+    bloom       -   bool determining if a BloomFilter should be used instead
+                    of a SeenIndex, for very large histories.
+    kwargs      -   passed on to the SeenIndex or BloomFilter.
+
+    Returns a SeenIndex or a BloomFilter.
+    '''
+    fn = os.path.join(directory, *scope.split('/'))
+    if bloom:
+        return BloomFilter(fn + '.bloom', **kwargs)
+    return SeenIndex(fn + '.seen', **kwargs)
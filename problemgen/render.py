@@ -0,0 +1,244 @@
+from sympy import Basic, S, UnevaluatedExpr
+
+# Result of a sign doubled where an operation meets a term, see join
+CULLED = {'+-': '-', '-+': '-', '--': '+', '++': '+'}
+
+def render(term):
+    '''
+    Prints a term of the restricted forms the generators build the way
+    sympy's str() and latex() print it, without going through sympy's
+    printers. Handles ints, Integers, Rationals, single letter Symbols,
+    monomials and univariate polynomials with integer coefficients, square
+    roots of positive integers (evaluated or not) with integer
+    coefficients, and the unreduced fractions of gen_numerical_expression.
+
+    Returns a tuple (str form, latex form), or None if the term isn't of one
+    of these forms.
+    '''
+    if type(term) is int:
+        form = str(term)
+        return (form, form)
+    if not isinstance(term, Basic):
+        return None
+    if term.is_Integer:
+        form = str(term.p)
+        return (form, form)
+    if term.is_Rational:
+        return format_rational(term)
+    if term.is_Add:
+        return render_polynomial(term)
+    if term.is_Mul and len(term.args) == 2:
+        coefficient, factor = term.args
+        if not coefficient.is_Integer:
+            return None
+        if factor.is_Rational:
+            return render_unreduced_fraction(coefficient.p, factor)
+        n = radicand(factor)
+        if n is not None:
+            return format_radical(coefficient.p, n)
+    if term.is_Pow:
+        n = radicand(term)
+        if n is not None:
+            return format_radical(1, n)
+    monomial = parse_monomial(term)
+    if monomial is not None:
+        return format_monomial(*monomial)
+    return None
+
+def radicand(term):
+    '''
+    Returns n if term is sqrt(n) or sqrt(UnevaluatedExpr(n)) for a positive
+    integer n, otherwise None.
+    '''
+    if not term.is_Pow or term.exp is not S.Half:
+        return None
+    base = term.base
+    if isinstance(base, UnevaluatedExpr):
+        # UnevaluatedExpr(n) prints like n
+        base = base.args[0]
+    if not base.is_Integer or base.p <= 0:
+        return None
+    return base.p
+
+def render_unreduced_fraction(numerator, factor):
+    '''
+    Prints Mul(numerator, factor, evaluate=False), where factor is
+    Rational(1, denominator), if format_unreduced_fraction handles it.
+    '''
+    if factor.p == 1:
+        denominator = factor.q
+    elif factor.p == -1:
+        denominator = -factor.q
+    else:
+        return None
+    if numerator == 0 or (numerator > 0 and denominator < 0):
+        return None
+    return format_unreduced_fraction(numerator, denominator)
+
+def parse_monomial(term):
+    '''
+    Returns (coefficient, degree, name) if term is an integer multiple of a
+    power of a single letter Symbol (or an Integer, with degree 0 and name
+    None), otherwise None.
+    '''
+    coefficient = 1
+    if term.is_Integer:
+        return (term.p, 0, None)
+    if term.is_Mul:
+        if len(term.args) != 2 or not term.args[0].is_Integer:
+            return None
+        coefficient = term.args[0].p
+        term = term.args[1]
+    degree = 1
+    if term.is_Pow:
+        if not term.exp.is_Integer or term.exp.p < 2:
+            return None
+        degree = term.exp.p
+        term = term.base
+    if not term.is_Symbol:
+        return None
+    name = term.name
+    if len(name) != 1 or not ('a' <= name <= 'z' or 'A' <= name <= 'Z'):
+        return None
+    return (coefficient, degree, name)
+
+def format_monomial(coefficient, degree, name):
+    '''
+    Formats coefficient*name**degree the way sympy prints it.
+
+    Returns a tuple (str form, latex form).
+    '''
+    if degree == 0:
+        form = str(coefficient)
+        return (form, form)
+    if degree == 1:
+        str_form = latex_form = name
+    else:
+        str_form = '%s**%d' % (name, degree)
+        latex_form = '%s^{%d}' % (name, degree)
+    if coefficient == 1:
+        return (str_form, latex_form)
+    if coefficient == -1:
+        return ('-' + str_form, '- ' + latex_form)
+    if coefficient < 0:
+        return ('%d*%s' % (coefficient, str_form),
+                '- %d %s' % (-coefficient, latex_form))
+    return ('%d*%s' % (coefficient, str_form),
+            '%d %s' % (coefficient, latex_form))
+
+def render_polynomial(term):
+    '''
+    Prints an Add of monomials in a single variable with integer
+    coefficients, ordered like sympy orders them. Returns None for other
+    Adds.
+    '''
+    monomials = []
+    name = None
+    for arg in term.args:
+        monomial = parse_monomial(arg)
+        if monomial is None:
+            return None
+        if monomial[2] is not None:
+            if name is not None and monomial[2] != name:
+                return None
+            name = monomial[2]
+        monomials.append(monomial)
+    if len(set(monomial[1] for monomial in monomials)) != len(monomials):
+        # Unevaluated sums of like terms are ordered by coefficient too
+        return None
+    # Decreasing degree, except that sympy puts a positive constant first
+    # in a constant minus a monomial (see Expr.as_ordered_terms)
+    monomials.sort(key=lambda monomial: monomial[1], reverse=True)
+    if len(monomials) == 2 and monomials[1][1] == 0 and \
+            monomials[1][0] > 0 and monomials[0][0] < 0:
+        monomials.reverse()
+    str_form, latex_form = format_monomial(*monomials[0])
+    for coefficient, degree, name in monomials[1:]:
+        if coefficient < 0:
+            term_str, term_latex = format_monomial(-coefficient, degree, name)
+            str_form += ' - ' + term_str
+            latex_form += ' - ' + term_latex
+        else:
+            term_str, term_latex = format_monomial(coefficient, degree, name)
+            str_form += ' + ' + term_str
+            latex_form += ' + ' + term_latex
+    return (str_form, latex_form)
+
+def join(operations, forms):
+    '''
+    Joins printed terms with the operations between them (laid out as in
+    Expression.operations), culling the doubled signs where an operation
+    meets the sign of a term as it goes, e.g. '3', '+', '-4' gives '3-4'.
+    Gives the same result as joining everything and replacing '+-', '-+',
+    '--' and '++' one after the other, in a single pass.
+    '''
+    pieces = []
+    for op, form in zip(operations, forms):
+        if op and form and op[-1] in '+-' and form[0] in '+-':
+            pieces.append(op[:-1])
+            pieces.append(CULLED[op[-1] + form[0]])
+            pieces.append(form[1:])
+        else:
+            pieces.append(op)
+            pieces.append(form)
+    pieces.append(operations[-1])
+    return ''.join(pieces)
+
+def format_rational(value):
+    '''
+    Formats a Fraction (or a sympy Rational) the way sympy prints the equal
+    Rational.
+
+    Returns a tuple (str form, latex form).
+    '''
+    if value.denominator == 1:
+        return (str(value.numerator), str(value.numerator))
+    str_form = '%d/%d' % (value.numerator, value.denominator)
+    if value.numerator < 0:
+        return (str_form, '- \\frac{%d}{%d}' % (-value.numerator,
+            value.denominator))
+    return (str_form, '\\frac{%d}{%d}' % (value.numerator, value.denominator))
+
+def format_unreduced_fraction(numerator, denominator):
+    '''
+    Formats the unreduced fraction numerator/denominator the way sympy
+    prints Mul(numerator, Rational(1, denominator), evaluate=False), as
+    gen_numerical_expression builds it. Only handles the signs that
+    gen_numerical_expression produces: numerator <= denominator, so a
+    positive numerator always has a positive denominator.
+
+    Returns a tuple (str form, latex form).
+    '''
+    if numerator > 0:
+        if denominator == 1:
+            return ('%d*1' % numerator, '%d \\cdot 1' % numerator)
+        return ('%d*(1/%d)' % (numerator, denominator),
+                '%d \\cdot \\frac{1}{%d}' % (numerator, denominator))
+    str_form = '%d*' % numerator
+    latex_form = '\\left(%d\\right) ' % numerator
+    if denominator == 1:
+        return (str_form + '1', latex_form + '1')
+    if denominator > 0:
+        return (str_form + '1/%d' % denominator,
+                latex_form + '\\frac{1}{%d}' % denominator)
+    if denominator == -1:
+        return (str_form + '(-1)', latex_form + '\\left(-1\\right)')
+    return (str_form + '(-1/%d)' % -denominator,
+            latex_form + '\\left(- \\frac{1}{%d}\\right)' % -denominator)
+
+def format_radical(coefficient, n):
+    '''
+    Formats the unreduced radical coefficient*sqrt(n) the way sympy prints
+    coefficient*sqrt(UnevaluatedExpr(n)), as gen_numerical_expression
+    builds it.
+
+    Returns a tuple (str form, latex form).
+    '''
+    if coefficient == 1:
+        return ('sqrt(%d)' % n, '\\sqrt{%d}' % n)
+    if coefficient == -1:
+        return ('-sqrt(%d)' % n, '- \\sqrt{%d}' % n)
+    if coefficient < 0:
+        return ('%d*sqrt(%d)' % (coefficient, n),
+                '- %d \\sqrt{%d}' % (-coefficient, n))
+    return ('%d*sqrt(%d)' % (coefficient, n), '%d \\sqrt{%d}' % (coefficient, n))
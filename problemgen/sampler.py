@@ -0,0 +1,139 @@
+import math as m
+
+# numpy, imported by import_numpy the first time a BatchSampler is made,
+# so that importing problemgen doesn't pay for it
+np = None
+
+def import_numpy():
+    '''
+    Imports numpy into the module the first time it is needed. Raises an
+    ImportError if it isn't installed.
+    '''
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('BatchSampler requires numpy.')
+        np = numpy
+
+class BatchSampler:
+    '''
+    Class designed to draw the random numbers of the generators in blocks
+    with a NumPy Generator, instead of one random call at a time (see
+    Generator.use_batch_sampler). Every kind of draw has its own block,
+    keyed by the parameters it depends on. A block is drawn, masked and
+    converted to Python numbers at once, then handed out one row at a time.
+
+    The draws follow the same distributions as the ones made with random,
+    but not the same stream: the same seed of random doesn't give the same
+    problems.
+
+    Member variables:
+    rng         -   numpy.random.Generator the blocks are drawn with.
+    block_size  -   number of rows drawn at once.
+    blocks      -   dictionary of key -> [list of rows, position of the next
+                    row].
+    '''
+
+    def __init__(self, seed=None, block_size=4096):
+        '''
+        Arguments:
+
+        seed        -   seed of the NumPy Generator. None seeds it from the
+                        operating system.
+        block_size  -   number of rows drawn at once for every kind of draw.
+        '''
+        import_numpy()
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.blocks = {}
+
+    def next_row(self, key, draw):
+        '''
+        Returns the next row of the block stored under key. When the block
+        is used up, a new one is made by calling draw(block_size), which
+        returns a NumPy array of block_size rows.
+        '''
+        block = self.blocks.get(key)
+        if block is None or block[1] == len(block[0]):
+            block = self.blocks[key] = [draw(self.block_size).tolist(), 0]
+        row = block[0][block[1]]
+        block[1] += 1
+        return row
+
+    def randint(self, a, b):
+        '''
+        Returns a random integer N such that a <= N <= b, like
+        random.randint.
+        '''
+        return self.next_row(('randint', a, b),
+                lambda n: self.rng.integers(a, b, size=n, endpoint=True))
+
+    def choice(self, seq):
+        '''
+        Returns a random element of the non-empty sequence seq, like
+        random.choice.
+        '''
+        return seq[self.randint(0, len(seq) - 1)]
+
+    def numerical_terms(self, n, op, types, max_lowest_term, max_multiple):
+        '''
+        Draws a block of n terms for gen_numerical_expression. Every row
+        holds the four constants of a term (see
+        Generator.sample_numerical_expression), followed by the index of
+        its type of number in types and the index of its operation in op.
+        '''
+        rng = self.rng
+        perfect_squares = np.arange(1, int(m.sqrt(max_multiple)) + 1)**2
+        pair = rng.integers(1, max_lowest_term, size=(n, 2), endpoint=True)
+        # There's a 1 in 4 chance of generating a negative number
+        pair[rng.integers(0, 4, size=(n, 2)) == 0] *= -1
+        # Making sure constants[0] is smaller than constants[1]
+        pair.sort(axis=1)
+        return np.column_stack([pair,
+            rng.choice(perfect_squares, size=n),
+            rng.integers(1, max_multiple, size=n, endpoint=True),
+            rng.integers(0, len(types), size=n),
+            rng.integers(0, len(op), size=n)])
+
+    def numerical_expression(self, num_terms, op, types, max_lowest_term,
+            max_multiple, same_base_root):
+        '''
+        Draws the random numbers of gen_numerical_expression. Takes the same
+        arguments and returns the same tuple as
+        Generator.sample_numerical_expression.
+        '''
+        base_root = None
+        if same_base_root:
+            base_root = self.randint(1, max_lowest_term)
+        key = ('numerical', op, types, max_lowest_term, max_multiple)
+        draw = lambda n: self.numerical_terms(n, op, types, max_lowest_term,
+                max_multiple)
+        samples = []
+        operations = ['']
+        for i in range(num_terms):
+            row = self.next_row(key, draw)
+            samples.append((row[:4], types[row[4]]))
+            operations.append(op[row[5]])
+        # The operation drawn with the last term isn't used
+        operations[-1] = ''
+        return base_root, samples, operations
+
+    def quadratic_discriminant(self, table, max_lowest_term):
+        '''
+        Draws b^2 - 4ac and b^2 for an unfactorable solvable quadratic (see
+        Generator.gen_quadratic). Returns a list [discrim, b2, product],
+        where product = discrim - b2 is a multiple of 4.
+        '''
+        def draw(n):
+            discrim = self.rng.choice(table['not_perfect'], size=n)
+            b2 = self.rng.choice(table['perfect_squares'], size=n)
+            # Multiplying by 4 keeps discrim not a perfect square and b2 a
+            # perfect square
+            not_multiple = (discrim - b2) % 4 != 0
+            discrim[not_multiple] *= 4
+            b2[not_multiple] *= 4
+            return np.column_stack([discrim, b2, discrim - b2])
+
+        return self.next_row(('quadratic', max_lowest_term), draw)
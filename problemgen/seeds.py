@@ -0,0 +1,127 @@
+import problemgen.backend as backend
+import problemgen.bank as bank
+import problemgen.container as container
+import collections
+import functools
+import mmap
+import random
+
+from problemgen.bank import INDEX_ENTRY
+
+# Everything needed to regenerate a Problem: its kind, the id of the
+# parameters it was generated with (a tag id of the SeedBank) and the seed.
+ProblemHandle = collections.namedtuple('ProblemHandle',
+        ['kind', 'params_id', 'seed'])
+
+class SeedBank(bank.ProblemBank):
+    '''
+    Class designed to store Problems as the seeds they can be regenerated
+    from (see Generator.gen_seeded) instead of rendered strings. Every
+    Problem takes 12 bytes on disk: its seed and the id of its tag (kind and
+    parameters). Problems are regenerated when they are drawn, and the most
+    recently drawn ones are kept in an LRU cache.
+
+    The files are the same as for a ProblemBank, except that the data file
+    stays empty and the offset of every index entry holds the seed instead.
+    A SeedBank can't be read as a ProblemBank.
+
+    Member variables (besides the ones of ProblemBank):
+    gen         -   Generator used to regenerate the problems.
+    render      -   function (tag_id, seed) -> ProblemRecord, caching the
+                    cache_size most recently used problems.
+    '''
+
+    def __init__(self, fn, cache_size=1024):
+        '''
+        Arguments:
+
+        fn          -   filename of the data file, see ProblemBank.
+        cache_size  -   number of regenerated problems kept in memory.
+        '''
+        bank.ProblemBank.__init__(self, fn)
+        self.gen = backend.Generator()
+        self.render = functools.lru_cache(maxsize=cache_size)(self.regenerate)
+
+    def regenerate(self, tag_id, seed):
+        '''
+        Regenerates a Problem from its tag id and seed, as a ProblemRecord.
+        '''
+        kind, params = self.tags[tag_id]
+        problem, data = self.gen.gen_seeded(kind, params, seed)
+        return backend.ProblemRecord(problem)
+
+    def extend(self, seeds, kind, params={}):
+        '''
+        Appends a list of seeds to the bank.
+
+        Arguments:
+        seeds       -   list of the seeds of the problems to store.
+        kind        -   kind of the problems, see ProblemBank.extend.
+        params      -   dictionary of the parameters the problems are
+                        generated with.
+        '''
+        tag_id = self.get_tag_id(kind, params)
+        # The current map doesn't cover the new entries
+        self.close()
+        with open(self.index_fn, 'ab') as index_file:
+            for seed in seeds:
+                index_file.write(INDEX_ENTRY.pack(seed, tag_id))
+
+    def fill(self, kind, n, bloom_error_rate=None, chunk_size=10000, **params):
+        '''
+        Finds n seeds giving unique Problems of the given kind and stores
+        them in the bank. Every Problem is generated once here to check it
+        isn't a duplicate. See ProblemBank.fill for the arguments.
+        '''
+        c = container.ProblemContainer()
+        if bloom_error_rate is not None:
+            c.use_bloom_dedupe(error_rate=bloom_error_rate,
+                    initial_capacity=n)
+        seeds = []
+        # Seed of the last candidate generated
+        last_seed = [None]
+
+        def generate():
+            last_seed[0] = random.getrandbits(64)
+            return self.gen.gen_seeded(kind, params, last_seed[0])
+
+        for i in range(n):
+            c.generate_unique(kind, generate)
+            seeds.append(last_seed[0])
+            # Only the dedupe state is needed
+            c.problems = []
+            if len(seeds) >= chunk_size:
+                self.extend(seeds, kind, params)
+                seeds = []
+        self.extend(seeds, kind, params)
+
+    def open(self):
+        '''
+        Maps the index file into memory. Called automatically when the bank
+        is read.
+        '''
+        if self._index_map is not None:
+            return
+        if len(self) == 0:
+            # mmap can't map empty files
+            return
+        self._index_file = open(self.index_fn, 'rb')
+        self._index_map = mmap.mmap(self._index_file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+
+    def handle(self, position):
+        '''
+        Returns the ProblemHandle stored at the given index position.
+        '''
+        self.open()
+        seed, tag_id = INDEX_ENTRY.unpack_from(self._index_map,
+                position * INDEX_ENTRY.size)
+        return ProblemHandle(self.tags[tag_id][0], tag_id, seed)
+
+    def get(self, position):
+        '''
+        Regenerates the Problem stored at the given index position. It is
+        returned as a backend.ProblemRecord.
+        '''
+        handle = self.handle(position)
+        return self.render(handle.params_id, handle.seed)
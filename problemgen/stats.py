@@ -0,0 +1,147 @@
+import problemgen.backend as backend
+import time
+
+# Collectors currently receiving events. The timing wrappers are only
+# installed while this list isn't empty, so instrumentation costs nothing
+# when it isn't used.
+ACTIVE = []
+# (owner, attribute name) -> original value, for every wrapped function
+ORIGINALS = {}
+
+# sympy solvers called by backend.Problem
+SOLVERS = ['solve', 'linsolve', 'solve_poly_inequality']
+
+class Stats:
+    '''
+    Class designed to collect timers and counters from the hot points of
+    problem generation.
+
+    Member variables:
+    counters    -   dictionary of name -> count.
+    timers      -   dictionary of name -> [number of calls, total seconds].
+    hook        -   optional callable called for every event as
+                    hook(kind, name, value), where kind is 'count' (value is
+                    the increment) or 'time' (value is the duration in
+                    seconds). Useful to forward events to a metrics system.
+    '''
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.timers = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self.hook is not None:
+            self.hook('count', name, n)
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+        if self.hook is not None:
+            self.hook('time', name, seconds)
+
+    def snapshot(self):
+        '''
+        Returns a copy of the counters and timers as a dictionary:
+        {'counters': {name: count},
+         'timers': {name: {'calls': calls, 'seconds': seconds}},
+         'solver_calls_per_problem': average number of sympy solver calls
+                                     per Problem rendered,
+         'print_cache': state of the latex()/str() printing caches, see
+                        backend.print_cache_info}
+        '''
+        timers = {}
+        for name, (calls, seconds) in self.timers.items():
+            timers[name] = {'calls': calls, 'seconds': seconds}
+        solver_calls = sum(self.timers.get(s, [0, 0])[0] for s in SOLVERS)
+        problems = self.timers.get('Problem', [0, 0])[0]
+        return {
+            'counters': dict(self.counters),
+            'timers': timers,
+            'solver_calls_per_problem': solver_calls / problems if problems else 0.0,
+            'print_cache': backend.print_cache_info(),
+        }
+
+def record_time(name, seconds):
+    for c in ACTIVE:
+        c.add_time(name, seconds)
+
+def timed(name, fn):
+    '''
+    Returns a wrapper of fn recording the time spent in it under name.
+    '''
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_time(name, time.perf_counter() - start)
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+def timed_outermost(name, fn):
+    '''
+    Like timed, for recursive functions: only the outermost call is timed.
+    '''
+    depth = [0]
+    def wrapper(*args, **kwargs):
+        if depth[0]:
+            return fn(*args, **kwargs)
+        depth[0] += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            depth[0] -= 1
+            record_time(name, time.perf_counter() - start)
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+def wrap(owner, attr, name, wrapper=timed):
+    ORIGINALS[(owner, attr)] = getattr(owner, attr)
+    setattr(owner, attr, wrapper(name, ORIGINALS[(owner, attr)]))
+
+def install():
+    '''
+    Replaces the hot points of backend with timing wrappers.
+    '''
+    for attr in list(vars(backend.Generator)):
+        if attr.startswith('gen_'):
+            wrap(backend.Generator, attr, 'Generator.' + attr)
+    wrap(backend.Expression, 'combine_terms', 'combine_terms', timed_outermost)
+    wrap(backend.Problem, '__init__', 'Problem')
+    wrap(backend, 'latex', 'latex')
+    for solver in SOLVERS:
+        wrap(backend, solver, solver)
+
+def uninstall():
+    '''
+    Restores the original functions of backend.
+    '''
+    for (owner, attr), original in ORIGINALS.items():
+        setattr(owner, attr, original)
+    ORIGINALS.clear()
+
+def activate(collector):
+    '''
+    Starts sending backend events to a Stats collector.
+    '''
+    if len(ACTIVE) == 0:
+        install()
+    ACTIVE.append(collector)
+
+def deactivate(collector):
+    '''
+    Stops sending backend events to a Stats collector.
+    '''
+    if collector in ACTIVE:
+        ACTIVE.remove(collector)
+    if len(ACTIVE) == 0:
+        uninstall()
@@ -0,0 +1,318 @@
+import problemgen.backend as backend
+import problemgen.container as container
+import inspect
+import json
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    latex_question TEXT NOT NULL,
+    latex_solution TEXT NOT NULL,
+    str_question TEXT NOT NULL,
+    str_solution TEXT NOT NULL,
+    has_solution INTEGER NOT NULL,
+    integer_solutions INTEGER NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS params (
+    problem_id INTEGER NOT NULL REFERENCES problems (id),
+    name TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS problems_kind ON problems (kind, uses);
+CREATE INDEX IF NOT EXISTS problems_uses ON problems (uses);
+CREATE INDEX IF NOT EXISTS params_name_value ON params (name, value, problem_id);
+'''
+
+# Columns of the problems table that can be used as query conditions
+# (anything else is looked up in the params table).
+ATTRIBUTES = ['has_solution', 'integer_solutions', 'uses']
+OPERATORS = ['=', '!=', '<', '<=', '>', '>=']
+
+def solution_values(str_solution):
+    '''
+    Splits a Problem's str_solution into the values it contains, e.g.
+    'x = 1, y = 3/2' becomes ['1', '3/2'].
+    '''
+    values = []
+    for part in str_solution.replace('\n', ',').split(','):
+        part = part.strip()
+        if part == '':
+            continue
+        if '=' in part:
+            part = part.split('=')[-1].strip()
+        values.append(part)
+    return values
+
+def derive_attributes(problem, data=None):
+    '''
+    Returns a tuple (has_solution, integer_solutions) describing the solution
+    of a Problem.
+
+    For Equations and Systems, the attributes come from their solutions
+    (see Equation.solutions and System.solutions): has_solution means the
+    answer is one or more real values, and integer_solutions that they are
+    all integers. Inequalities (whose answers are intervals), complex roots
+    and systems with infinitely many solutions don't count as having a
+    solution. Other problems are described from their str_solution.
+
+    Arguments:
+    problem -   the Problem.
+    data    -   the Expression, Equation or System the Problem was created
+                from, or None.
+    '''
+    if isinstance(data, backend.Equation):
+        if data.middle_sign != '=':
+            return (0, 0)
+        return solution_attributes(data.solutions())
+    if isinstance(data, backend.System):
+        solutions = data.solutions()
+        if len(solutions) != 1:
+            return (0, 0)
+        return solution_attributes(list(solutions)[0])
+    values = solution_values(problem.str_solution)
+    has_solution = len(values) != 0 and 'No solution' not in problem.str_solution
+    integer_solutions = has_solution
+    for v in values:
+        try:
+            int(v)
+        except ValueError:
+            integer_solutions = False
+    return (int(has_solution), int(integer_solutions))
+
+def solution_attributes(values):
+    '''
+    Returns a tuple (has_solution, integer_solutions) for a list of sympy
+    solution values: whether there are some and they are all real numbers,
+    and whether they are all integers.
+    '''
+    has_solution = len(values) != 0 and all(v.is_real is True for v in values)
+    integer_solutions = has_solution and \
+            all(v.is_integer is True for v in values)
+    return (int(has_solution), int(integer_solutions))
+
+def effective_params(kind, params):
+    '''
+    Returns every parameter the problems of the given kind are generated
+    with: params bound against the signature of the add method of kind,
+    with the defaults of the ones left out. Kinds without an add method
+    are returned unchanged.
+    '''
+    add = getattr(container.ProblemContainer, 'add_' + kind, None)
+    if add is None:
+        return dict(params)
+    bound = inspect.signature(add).bind(None, **params)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    del arguments['self']
+    return arguments
+
+def to_sql_value(value):
+    '''
+    Converts a generation parameter to a value sqlite can store and compare.
+    '''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, str)):
+        return value
+    return json.dumps(value)
+
+class ProblemStore:
+    '''
+    Class designed to persist Problems in a sqlite database together with
+    the parameters they were generated with, so that they can be queried
+    later.
+
+    Member variables:
+    fn      -   filename of the database.
+    conn    -   sqlite3 connection to the database.
+    '''
+
+    def __init__(self, fn):
+        '''
+        Arguments:
+
+        fn  -   filename of the database. It is created if it doesn't exist.
+                ':memory:' can be used for a temporary store.
+        '''
+        assert type(fn) == str
+        self.fn = fn
+        self.conn = sqlite3.connect(fn)
+        self.conn.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM problems').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def extend(self, problems, kind, params={}, data=None):
+        '''
+        Stores a list of Problems in a single transaction.
+
+        Arguments:
+        problems    -   list of Problems to store.
+        kind        -   kind of generator the problems came from. This is the
+                        name of the ProblemContainer method without the 'add_'
+                        prefix, e.g. 'linear' or 'system'.
+        params      -   dictionary of the parameters the problems were
+                        generated with. The defaults of the add method of
+                        kind are stored for the ones left out, so that
+                        queries see the values actually used.
+        data        -   optional list of the Expression, Equation or System
+                        (or None) every problem was created from, used to
+                        derive the solution attributes (see
+                        derive_attributes).
+        '''
+        if data is None:
+            data = [None] * len(problems)
+        params = effective_params(kind, params)
+        param_rows = []
+        with self.conn:
+            cursor = self.conn.cursor()
+            for p, d in zip(problems, data):
+                has_solution, integer_solutions = derive_attributes(p, d)
+                cursor.execute('INSERT INTO problems (kind, latex_question, ' +
+                        'latex_solution, str_question, str_solution, ' +
+                        'has_solution, integer_solutions) ' +
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (kind, p.latex_question, p.latex_solution,
+                            p.str_question, p.str_solution, has_solution,
+                            integer_solutions))
+                for name, value in params.items():
+                    param_rows.append((cursor.lastrowid, name,
+                        to_sql_value(value)))
+            cursor.executemany('INSERT INTO params (problem_id, name, value) ' +
+                    'VALUES (?, ?, ?)', param_rows)
+
+    def fill(self, kind, n, bloom_error_rate=None, chunk_size=10000, **params):
+        '''
+        Generates n unique Problems of the given kind and stores them.
+        Problems are written every chunk_size problems, so only the dedupe
+        state is kept in memory for the whole run.
+
+        Arguments:
+        kind        -   name of the ProblemContainer method used to generate
+                        the problems, without the 'add_' prefix.
+        n           -   number of problems to generate.
+        bloom_error_rate
+                    -   if given, problems are deduped with a Bloom filter
+                        with this false positive rate instead of a set of
+                        strings (see ProblemContainer.use_bloom_dedupe).
+        chunk_size  -   number of problems generated between two writes.
+        params      -   keyword arguments passed on to the add method.
+        '''
+        c = container.ProblemContainer()
+        if bloom_error_rate is not None:
+            c.use_bloom_dedupe(error_rate=bloom_error_rate,
+                    initial_capacity=n)
+        add = getattr(c, 'add_' + kind)
+        data = []
+        for i in range(n):
+            if add(**params) is not None:
+                data.append(c.last_data)
+            if len(c.problems) >= chunk_size:
+                self.extend(c.problems, kind, params, data)
+                # Keeping the dedupe state, dropping the problems
+                c.problems = []
+                data = []
+        self.extend(c.problems, kind, params, data)
+
+    def query(self, kind, unused=False, **conditions):
+        '''
+        Returns a StoreQuery selecting Problems of the given kind.
+
+        Arguments:
+        kind        -   kind of the problems to select.
+        unused      -   bool determining if only problems that were never
+                        fetched before should be selected.
+        conditions  -   conditions on the generation parameters or on the
+                        derived attributes (has_solution, integer_solutions,
+                        uses). A plain value tests for equality, a tuple
+                        (operator, value) uses one of =, !=, <, <=, > or >=.
+                        E.g. max_lowest_term=('<=', 10).
+        '''
+        if unused:
+            conditions['uses'] = 0
+        return StoreQuery(self, kind, conditions)
+
+class StoreQuery:
+    '''
+    Class describing a selection of Problems in a ProblemStore. Created by
+    ProblemStore.query.
+
+    Member variables:
+    store       -   the ProblemStore being queried.
+    kind        -   kind of the problems selected.
+    conditions  -   dictionary of conditions the problems must satisfy.
+    '''
+
+    def __init__(self, store, kind, conditions):
+        self.store = store
+        self.kind = kind
+        self.conditions = conditions
+
+    def where(self):
+        '''
+        Returns the WHERE clause of the query and its arguments.
+        '''
+        clauses = ['kind = ?']
+        args = [self.kind]
+        for name, condition in self.conditions.items():
+            if isinstance(condition, tuple):
+                op, value = condition
+            else:
+                op, value = '=', condition
+            assert op in OPERATORS
+            if name in ATTRIBUTES:
+                clauses.append('%s %s ?' % (name, op))
+                args.append(to_sql_value(value))
+            else:
+                clauses.append('EXISTS (SELECT 1 FROM params WHERE ' +
+                        'params.problem_id = problems.id AND ' +
+                        'params.name = ? AND params.value %s ?)' % op)
+                args.extend([name, to_sql_value(value)])
+        return ' AND '.join(clauses), args
+
+    def count(self):
+        '''
+        Returns the number of Problems matching the query.
+        '''
+        where, args = self.where()
+        return self.store.conn.execute('SELECT COUNT(*) FROM problems WHERE ' +
+                where, args).fetchone()[0]
+
+    def candidates(self, limit=-1):
+        '''
+        Returns a cursor over (id, Problem) for the Problems matching the
+        query, in random order, without counting them as used (see
+        mark_used). limit bounds the number of rows (-1 for all of them).
+        '''
+        where, args = self.where()
+        cursor = self.store.conn.execute('SELECT id, latex_question, ' +
+                'latex_solution, str_question, str_solution FROM problems ' +
+                'WHERE ' + where + ' ORDER BY RANDOM() LIMIT ?',
+                args + [limit])
+        return ((row[0], backend.Problem(tuple(row[1:]))) for row in cursor)
+
+    def mark_used(self, ids):
+        '''
+        Counts the Problems with the given ids as used once more.
+        '''
+        with self.store.conn:
+            self.store.conn.executemany('UPDATE problems SET uses = uses + 1 ' +
+                    'WHERE id = ?', [(i,) for i in ids])
+
+    def fetch(self, n):
+        '''
+        Returns a list of n random Problems matching the query, and counts
+        them as used.
+        '''
+        rows = list(self.candidates(n))
+        if len(rows) < n:
+            raise backend.GeneratorError(self.kind, 'Only ' + str(len(rows)) +
+                    ' problems match the query in ' + self.store.fn + '.')
+        self.mark_used([i for i, p in rows])
+        return [p for i, p in rows]
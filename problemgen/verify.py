@@ -0,0 +1,342 @@
+import problemgen.backend as backend
+
+from sympy import Poly, PolynomialError, Interval, lambdify, \
+        linear_eq_to_matrix, oo
+
+# numpy, imported by import_numpy the first time a Verifier is made,
+# so that importing problemgen doesn't pay for it
+np = None
+
+def import_numpy():
+    '''
+    Imports numpy into the module the first time it is needed. Raises an
+    ImportError if it isn't installed.
+    '''
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('Verifier requires numpy.')
+        np = numpy
+
+# Primes the exact checks of rational roots of integer polynomials are made
+# modulo. Residues are below 2^31, so Horner steps stay below 2^62 and fit
+# in int64. A wrong root only passes if the numerator of the residual is a
+# multiple of both.
+PRIMES = [2147483647, 2147483629]
+
+# Relative tolerance of the floating point checks
+TOLERANCE = 1e-9
+
+# Number of random points the two sides of an algebraic Expression are
+# compared at
+NUM_POINTS = 8
+
+class Verifier:
+    '''
+    Class designed to check the answer keys of generated problems in
+    batches, without substituting the solutions back with sympy one problem
+    at a time.
+
+    Every problem is turned into rows of plain numbers: polynomial
+    coefficients and the points they should vanish at (Equations), linear
+    systems and their solution vectors (Systems), or the values of the
+    question and of the answer (Expressions). The rows of a batch are then
+    checked together with NumPy, exactly (modulo PRIMES) for rational
+    roots of integer polynomials and to a relative tolerance otherwise.
+
+    The solutions are the ones cached by Equation.solutions and
+    System.solutions when the Problem was rendered, so nothing is solved
+    again.
+
+    Member variables:
+    pending     -   list of (Problem, data, kind) waiting to be checked.
+    failures    -   list of (Problem, kind, reason) for every problem whose
+                    answer key is wrong.
+    checked     -   number of problems checked so far.
+    skipped     -   number of problems that couldn't be checked, because
+                    they have no data or aren't polynomial.
+    tolerance   -   relative tolerance of the floating point checks.
+    batch_size  -   number of queued problems a ProblemContainer checks at
+                    once.
+    rng         -   numpy.random.Generator drawing the points Expressions
+                    are compared at, so that random isn't disturbed.
+    '''
+
+    def __init__(self, tolerance=TOLERANCE, batch_size=256, seed=None):
+        import_numpy()
+        self.pending = []
+        self.failures = []
+        self.checked = 0
+        self.skipped = 0
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, problem, data, kind=''):
+        '''
+        Queues a Problem and the Expression, Equation or System it was
+        created from (or None) to be checked by the next run.
+        '''
+        self.pending.append((problem, data, kind))
+
+    def run(self):
+        '''
+        Checks every queued problem. Returns the list of (Problem, kind,
+        reason) of the ones with a wrong answer key, which are also added to
+        self.failures.
+        '''
+        batch = Batch(self.tolerance, self.rng)
+        for i, (problem, data, kind) in enumerate(self.pending):
+            try:
+                if isinstance(data, backend.Expression):
+                    batch.add_expression(i, data)
+                elif isinstance(data, backend.Equation):
+                    batch.add_equation(i, data)
+                elif isinstance(data, backend.System):
+                    batch.add_system(i, data)
+                else:
+                    batch.skip(i)
+            except (PolynomialError, TypeError, ValueError):
+                # Not a polynomial, or a solution sympy can't evaluate
+                batch.skip(i)
+        reasons = batch.run()
+        failures = [(self.pending[i][0], self.pending[i][2], reason)
+                for i, reason in sorted(reasons.items())]
+        self.skipped += len(batch.skipped)
+        self.checked += len(self.pending) - len(batch.skipped)
+        self.failures += failures
+        self.pending = []
+        return failures
+
+class Batch:
+    '''
+    Rows of one run of a Verifier, collected by problem type and checked
+    together.
+
+    Member variables:
+    tolerance   -   relative tolerance of the floating point checks.
+    rng         -   numpy.random.Generator drawing the points Expressions
+                    are compared at.
+    exact       -   list of (problem index, integer coefficients, numerator,
+                    denominator) of rational roots of integer polynomials.
+    numeric     -   list of (problem index, coefficients, point, relation)
+                    checked in floating point, where relation is '=' for a
+                    root or the sign the polynomial must satisfy at point.
+    values      -   list of (problem index, question values, answer
+                    values) of Expressions. For polynomials, the question
+                    values are the coefficients of question - answer and
+                    the answer values are 0.
+    systems     -   dictionary of (equations, variables) -> list of
+                    (problem index, A, b, x) of linear systems.
+    reasons     -   dictionary of problem index -> reason of the failure.
+    skipped     -   set of the indices of the problems that weren't checked.
+    '''
+
+    def __init__(self, tolerance, rng):
+        self.tolerance = tolerance
+        self.rng = rng
+        self.exact = []
+        self.numeric = []
+        self.values = []
+        self.systems = {}
+        self.reasons = {}
+        self.skipped = set()
+
+    def skip(self, i):
+        self.skipped.add(i)
+
+    def fail(self, i, reason):
+        if i not in self.reasons:
+            self.reasons[i] = reason
+
+    def add_expression(self, i, e):
+        '''
+        Adds the rows comparing the question of an Expression (its
+        unreduced terms) with its answer (its reduced terms).
+        '''
+        question = e.combine_terms(e.unreduced_terms, e.operations) \
+                .sympy_term.doit()
+        answer = e.get_sympy()
+        symbols = sorted(question.free_symbols | answer.free_symbols,
+                key=str)
+        if len(symbols) == 0:
+            self.values.append((i, [complex(question)], [complex(answer)]))
+            return
+        try:
+            residual = Poly(question - answer, *symbols)
+        except PolynomialError:
+            residual = None
+        if residual is not None:
+            # Polynomials are the same if the coefficients of their
+            # difference vanish
+            coeffs = [complex(c) for c in residual.coeffs()]
+            self.values.append((i, coeffs, [0] * len(coeffs)))
+            return
+        # Comparing the two sides at random points
+        points = self.rng.uniform(-2, 2, size=(len(symbols), NUM_POINTS))
+        f = lambdify(symbols, [question, answer], 'numpy')
+        q, a = f(*points)
+        self.values.append((i, np.broadcast_to(q, NUM_POINTS),
+            np.broadcast_to(a, NUM_POINTS)))
+
+    def add_equation(self, i, e):
+        '''
+        Adds the rows checking the solutions of an Equation against the
+        polynomial lhs - rhs.
+        '''
+        poly = Poly(e.residual(), e.variable)
+        solutions = e.solutions()
+        if poly.domain.is_ZZ or poly.domain.is_QQ:
+            integer_coeffs = [int(c) for c in poly.clear_denoms()[1].all_coeffs()]
+        else:
+            integer_coeffs = None
+        coeffs = [complex(c) for c in poly.all_coeffs()]
+        if e.middle_sign == '=':
+            if len(solutions) == 0:
+                # Only a nonzero constant has no roots at all
+                if poly.degree() > 0 or poly.is_zero:
+                    self.fail(i, 'no solution given for a solvable equation')
+                return
+            for s in solutions:
+                if integer_coeffs is not None and s.is_Rational:
+                    self.exact.append((i, integer_coeffs, int(s.p), int(s.q)))
+                else:
+                    self.numeric.append((i, coeffs, complex(s), '='))
+            return
+        # Inequalities: the finite ends of the intervals must be roots, and
+        # a point inside every interval must satisfy the inequality
+        for interval in solutions:
+            if not isinstance(interval, Interval):
+                raise ValueError(interval)
+            start, end = interval.start, interval.end
+            for point in (start, end):
+                if point.is_finite:
+                    self.numeric.append((i, coeffs, complex(point), '='))
+            if start == -oo and end == oo:
+                inside = 0
+            elif start == -oo:
+                inside = float(end) - 1
+            elif end == oo:
+                inside = float(start) + 1
+            else:
+                inside = (float(start) + float(end)) / 2
+            self.numeric.append((i, coeffs, complex(inside), e.middle_sign))
+
+    def add_system(self, i, s):
+        '''
+        Adds the rows checking the solutions of a linear System.
+        '''
+        eqs = [(e.lhs - e.rhs).get_sympy() for e in s.equations]
+        A, b = linear_eq_to_matrix(eqs, s.variables)
+        solutions = s.solutions()
+        if len(solutions) == 0:
+            # Inconsistent systems have rank(A) < rank([A | b])
+            if A.rank() == A.row_join(b).rank():
+                self.fail(i, 'no solution given for a consistent system')
+            return
+        A = np.array(A.tolist(), dtype=complex)
+        b = np.array(b.tolist(), dtype=complex)[:, 0]
+        key = A.shape
+        for solution in solutions:
+            # Free parameters of infinite solution sets can take any value
+            free = {p: 1 for v in solution for p in v.free_symbols}
+            x = [complex(v.subs(free)) for v in solution]
+            self.systems.setdefault(key, []).append((i, A, b, x))
+
+    def run(self):
+        '''
+        Checks every row. Returns a dictionary of problem index -> reason,
+        for every problem failing a check.
+        '''
+        self.check_exact()
+        self.check_numeric()
+        self.check_values()
+        self.check_systems()
+        return self.reasons
+
+    def close(self, error, scale):
+        return error <= self.tolerance * (1 + scale)
+
+    def check_exact(self):
+        '''
+        Checks that the rational roots make their integer polynomials
+        vanish, modulo every prime of PRIMES.
+        '''
+        if len(self.exact) == 0:
+            return
+        degree = max(len(row[1]) for row in self.exact)
+        bad = np.zeros(len(self.exact), dtype=bool)
+        for prime in PRIMES:
+            coeffs = np.zeros((len(self.exact), degree), dtype=np.int64)
+            roots = np.zeros(len(self.exact), dtype=np.int64)
+            for r, (i, c, p, q) in enumerate(self.exact):
+                # Padding with leading zeros doesn't change Horner's method
+                coeffs[r, degree - len(c):] = [x % prime for x in c]
+                roots[r] = p * pow(q, -1, prime) % prime
+            value = np.zeros(len(self.exact), dtype=np.int64)
+            for j in range(degree):
+                value = (value * roots + coeffs[:, j]) % prime
+            bad |= value != 0
+        for r in np.flatnonzero(bad):
+            self.fail(self.exact[r][0], 'x = %d/%d is not a root' %
+                    self.exact[r][2:])
+
+    def check_numeric(self):
+        '''
+        Evaluates the polynomials at their points with Horner's method, all
+        at once, and checks the relations.
+        '''
+        if len(self.numeric) == 0:
+            return
+        degree = max(len(row[1]) for row in self.numeric)
+        coeffs = np.zeros((len(self.numeric), degree), dtype=complex)
+        for r, row in enumerate(self.numeric):
+            coeffs[r, degree - len(row[1]):] = row[1]
+        points = np.array([row[2] for row in self.numeric])
+        value = np.zeros(len(self.numeric), dtype=complex)
+        # Size of the terms of the polynomial, to scale the tolerance by
+        scale = np.zeros(len(self.numeric))
+        for j in range(degree):
+            value = value * points + coeffs[:, j]
+            scale = scale * np.abs(points) + np.abs(coeffs[:, j])
+        relations = np.array([row[3] for row in self.numeric])
+        margin = self.tolerance * (1 + scale)
+        real = value.real
+        ok = np.select([relations == '=', relations == '>',
+            relations == '>=', relations == '<', relations == '<='],
+            [np.abs(value) <= margin, real > -margin, real >= -margin,
+                real < margin, real <= margin])
+        for r in np.flatnonzero(~ok.astype(bool)):
+            i, c, point, relation = self.numeric[r]
+            if relation == '=':
+                self.fail(i, 'x = %s is not a root' % point)
+            else:
+                self.fail(i, 'x = %s is in the solution but not %s 0' %
+                        (point, relation))
+
+    def check_values(self):
+        '''
+        Checks that the questions and answers of Expressions have the same
+        values.
+        '''
+        for i, q, a in self.values:
+            q = np.asarray(q, dtype=complex)
+            a = np.asarray(a, dtype=complex)
+            if not np.all(self.close(np.abs(q - a), np.abs(q) + np.abs(a))):
+                self.fail(i, 'the answer differs from the question')
+
+    def check_systems(self):
+        '''
+        Checks A x = b for the linear systems, one stack per shape.
+        '''
+        for rows in self.systems.values():
+            A = np.array([row[1] for row in rows])
+            b = np.array([row[2] for row in rows])
+            x = np.array([row[3] for row in rows])
+            residual = np.einsum('nij,nj->ni', A, x) - b
+            scale = np.einsum('nij,nj->ni', np.abs(A), np.abs(x)) + np.abs(b)
+            ok = np.all(self.close(np.abs(residual), scale), axis=1)
+            for r in np.flatnonzero(~ok):
+                self.fail(rows[r][0], 'the solution doesn\'t satisfy the system')
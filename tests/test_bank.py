@@ -0,0 +1,109 @@
+import problemgen.bank as bank
+import problemgen.container as container
+import problemgen.dedupe as dedupe
+import random
+
+def questions(problems):
+    return [p.str_question for p in problems]
+
+def generate(kind, n, **params):
+    random.seed(0)
+    c = container.ProblemContainer()
+    for i in range(n):
+        getattr(c, 'add_' + kind)(**params)
+    return c.problems
+
+def test_fill_and_draw_after_reopening(tmp_path):
+    fn = str(tmp_path / 'linear.bank')
+    b = bank.ProblemBank(fn)
+    random.seed(0)
+    b.fill('linear', 20, num_lhs_terms=2)
+    stored = questions(b.get(i) for i in range(len(b)))
+    b.close()
+
+    b = bank.ProblemBank(fn)
+    assert len(b) == 20
+    assert b.count('linear') == 20
+    assert b.count('linear', num_lhs_terms=2) == 20
+    assert b.count('linear', num_lhs_terms=3) == 0
+    assert b.count('quadratic') == 0
+    assert questions(b.get(i) for i in range(len(b))) == stored
+    drawn = questions(b.draw('linear', 5, num_lhs_terms=2))
+    assert len(set(drawn)) == 5
+    assert set(drawn) <= set(stored)
+    b.close()
+
+def test_positions_of_several_tags(tmp_path):
+    b = bank.ProblemBank(str(tmp_path / 'mixed.bank'))
+    linear = generate('linear', 6)
+    quadratic = generate('quadratic', 4)
+    b.extend(linear[:3], 'linear')
+    b.extend(quadratic, 'quadratic')
+    b.extend(linear[3:], 'linear')
+    assert [a.typecode for a in b.position_arrays('linear')] == ['I']
+    assert b.positions('linear') == [0, 1, 2, 7, 8, 9]
+    assert b.positions('quadratic') == [3, 4, 5, 6]
+    assert b.count('linear') == 6
+    assert sorted(b.iter_positions('linear')) == [0, 1, 2, 7, 8, 9]
+    assert set(questions(b.draw('linear', 6))) == set(questions(linear))
+    b.close()
+
+def test_params_match_after_reopening(tmp_path):
+    fn = str(tmp_path / 'system.bank')
+    b = bank.ProblemBank(fn)
+    b.extend(generate('linear', 5), 'system', {'symbols': ('x', 'y'),
+        'num_equations': 2})
+    assert b.count('system', symbols=('x', 'y')) == 5
+    b.close()
+
+    b = bank.ProblemBank(fn)
+    assert b.count('system', symbols=('x', 'y')) == 5
+    assert b.count('system', symbols=['x', 'y'], num_equations=2) == 5
+    assert b.count('system', symbols=('x', 'z')) == 0
+    b.append(generate('linear', 1)[0], 'system', {'num_equations': 2,
+        'symbols': ('x', 'y')})
+    assert len(b.tags) == 1
+    assert b.count('system', symbols=('x', 'y')) == 6
+    b.close()
+
+def test_add_from_bank_replaces_rejected_problems(tmp_path, capsys):
+    b = bank.ProblemBank(str(tmp_path / 'linear.bank'))
+    problems = generate('linear', 10)
+    # Every problem is stored twice
+    b.extend(problems, 'linear')
+    b.extend(problems, 'linear')
+
+    c = container.ProblemContainer()
+    c.add_from_bank(b, 'linear', 10)
+    assert sorted(questions(c.problems)) == sorted(questions(problems))
+
+    c = container.ProblemContainer()
+    c.add_from_bank(b, 'linear', 11)
+    assert len(c.problems) == 10
+    assert 'GeneratorError: Only 10 of the 11 problems' in capsys.readouterr().out
+    b.close()
+
+def test_add_from_bank_skips_problems_handed_out(tmp_path, capsys):
+    b = bank.ProblemBank(str(tmp_path / 'linear.bank'))
+    b.extend(generate('linear', 10), 'linear')
+    seen = dedupe.SeenIndex(str(tmp_path / 'class.seen'))
+
+    first = container.ProblemContainer()
+    first.set_seen(seen)
+    first.add_from_bank(b, 'linear', 6)
+    assert len(first.problems) == 6
+
+    second = container.ProblemContainer()
+    second.set_seen(seen)
+    second.add_from_bank(b, 'linear', 4)
+    assert len(second.problems) == 4
+    assert not set(questions(first.problems)) & set(questions(second.problems))
+    assert 'GeneratorError' not in capsys.readouterr().out
+
+    third = container.ProblemContainer()
+    third.set_seen(seen)
+    third.add_from_bank(b, 'linear', 1)
+    assert len(third.problems) == 0
+    assert 'GeneratorError: Only 0 of the 1 problems' in capsys.readouterr().out
+    seen.close()
+    b.close()
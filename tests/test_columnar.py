@@ -0,0 +1,88 @@
+import problemgen.columnar as columnar
+import problemgen.container as container
+import random
+
+def fields(problems):
+    return [(p.latex_question, p.latex_solution, p.str_question, p.str_solution)
+            for p in problems]
+
+def generate(n):
+    random.seed(0)
+    c = container.ProblemContainer()
+    for i in range(n):
+        c.add_linear()
+        c.add_quadratic()
+    return c.problems
+
+def columns(problems):
+    stored = columnar.ColumnarProblems()
+    for i, p in enumerate(problems):
+        stored.append(p, 'linear' if i % 2 == 0 else 'quadratic')
+    return stored
+
+def test_problems_round_trip():
+    problems = generate(10)
+    stored = columns(problems)
+    assert len(stored) == len(problems)
+    assert fields(stored) == fields(problems)
+    assert fields([stored[i] for i in range(len(stored))]) == fields(problems)
+    assert fields(columnar.ColumnarProblems(problems)) == fields(problems)
+    assert stored.nbytes() > 0
+
+def test_slices_are_views():
+    problems = generate(10)
+    stored = columns(problems)
+    for s in [slice(3, 8), slice(None, None, 2), slice(None, None, -1),
+            slice(15, 30)]:
+        view = stored[s]
+        assert isinstance(view, columnar.ColumnarProblems)
+        assert fields(view) == fields(problems[s])
+        assert [view.kind(i) for i in range(len(view))] == \
+                [stored.kind(i) for i in range(len(stored))][s]
+        assert view.buffers is stored.buffers
+
+    view = stored[:5]
+    view.append(problems[0], 'linear')
+    assert len(view) == 6
+    assert len(stored) == 20
+    assert fields(stored) == fields(problems)
+
+def test_select_by_kind():
+    problems = generate(10)
+    stored = columns(problems)
+    assert fields(stored.select('linear')) == fields(problems[::2])
+    assert fields(stored.select('quadratic')) == fields(problems[1::2])
+    assert len(stored.select('system')) == 0
+    assert stored.kind(0) == 'linear'
+    assert stored.kind(1) == 'quadratic'
+
+def test_shuffle_matches_a_list():
+    problems = generate(10)
+    stored = columns(problems)
+    random.seed(1)
+    stored.shuffle()
+    random.seed(1)
+    shuffled = list(problems)
+    random.shuffle(shuffled)
+    assert fields(stored) == fields(shuffled)
+    assert sorted(fields(stored)) == sorted(fields(problems))
+    kinds = {p.str_question: k for p, k in zip(problems,
+        ['linear', 'quadratic'] * 10)}
+    assert [stored.kind(i) for i in range(len(stored))] == \
+            [kinds[p.str_question] for p in shuffled]
+
+def test_container_storage():
+    random.seed(0)
+    c = container.ProblemContainer()
+    c.add_linear()
+    c.use_columnar_storage()
+    for i in range(9):
+        c.add_linear()
+    problems = list(c.problems)
+    assert len(problems) == 10
+    assert not c.add_problem(problems[3])
+    random.seed(2)
+    c.shuffle()
+    random.seed(2)
+    random.shuffle(problems)
+    assert fields(c.problems) == fields(problems)
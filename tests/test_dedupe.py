@@ -0,0 +1,128 @@
+import problemgen.backend as backend
+import problemgen.dedupe as dedupe
+import os
+
+from sympy import Integer, Symbol
+
+x = Symbol('x')
+
+def sum_of(terms):
+    terms = [backend.Term(t) for t in terms]
+    return backend.Expression(terms, terms, [''] + ['+'] * (len(terms) - 1) + [''])
+
+def equation(lhs, rhs, middle_sign='='):
+    return backend.Equation(sum_of(lhs), sum_of(rhs), middle_sign=middle_sign)
+
+def test_seen_index_grows_and_persists(tmp_path):
+    fn = str(tmp_path / 'index.seen')
+    seen = dedupe.SeenIndex(fn, capacity=8)
+    keys = ['problem %d' % i for i in range(100)]
+    for key in keys:
+        seen.add(key)
+    seen.add(keys[0])
+    assert len(seen) == 100
+    assert seen.capacity >= 256
+    assert all(key in seen for key in keys)
+    assert 'problem 100' not in seen
+    seen.close()
+
+    seen = dedupe.SeenIndex(fn)
+    assert len(seen) == 100
+    assert all(key in seen for key in keys)
+    assert 'problem 100' not in seen
+    seen.add('problem 100')
+    seen.close()
+    assert len(dedupe.SeenIndex(fn)) == 101
+
+def false_positive_rate(bloom, n=20000):
+    return sum('absent %d' % i in bloom for i in range(n)) / n
+
+# Leaves room for the sampling error of a rate measured on 20000 keys
+def within_bound(rate, error_rate):
+    return rate < error_rate * 1.2
+
+def test_bloom_filter_round_trip(tmp_path):
+    fn = str(tmp_path / 'index.bloom')
+    bloom = dedupe.BloomFilter(fn, capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add('present %d' % i)
+    assert len(bloom) == 5000
+    bloom.close()
+
+    bloom = dedupe.BloomFilter(fn)
+    assert len(bloom) == 5000
+    assert all('present %d' % i in bloom for i in range(5000))
+    assert within_bound(false_positive_rate(bloom), 0.01)
+    bloom.close()
+
+def test_in_memory_bloom_filter():
+    bloom = dedupe.BloomFilter(None, capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add('present %d' % i)
+    assert all('present %d' % i in bloom for i in range(5000))
+    assert within_bound(false_positive_rate(bloom), 0.01)
+
+def test_scalable_bloom_filter_stays_within_bound():
+    bloom = dedupe.ScalableBloomFilter(initial_capacity=1000, error_rate=0.01)
+    for i in range(20000):
+        bloom.add('present %d' % i)
+    assert len(bloom) == 20000
+    assert all('present %d' % i in bloom for i in range(20000))
+    assert within_bound(false_positive_rate(bloom), 0.01)
+    assert bloom.num_bytes() > 0
+
+def test_bloom_dedupe():
+    seen = dedupe.BloomDedupe(initial_capacity=1000, error_rate=0.01,
+            recent_window=10)
+    for i in range(5):
+        seen.add('key %d' % i)
+    assert 'key 0' in seen
+    assert seen.confirmed == 1
+    # Every key is still recent, so a Bloom filter hit is a false positive
+    assert all('other %d' % i not in seen for i in range(1000))
+    assert seen.probable == 0
+
+    for i in range(5, 100):
+        seen.add('key %d' % i)
+    assert 'key 0' in seen
+    assert seen.probable == 1
+    seen.clear()
+    assert len(seen) == 0
+    assert 'key 0' not in seen
+
+def test_fingerprint_ignores_term_order():
+    fingerprinter = dedupe.Fingerprinter()
+    a = equation([3 * x, Integer(2)], [Integer(5)])
+    b = equation([Integer(2), 3 * x], [Integer(5)])
+    assert fingerprinter.fingerprint(a) == fingerprinter.fingerprint(b)
+    assert dedupe.Fingerprinter().fingerprint(a) == fingerprinter.fingerprint(a)
+
+def test_fingerprint_tells_problems_apart():
+    fingerprinter = dedupe.Fingerprinter()
+    a = equation([3 * x, Integer(2)], [Integer(5)])
+    different = [
+        equation([3 * x, Integer(2)], [Integer(6)]),
+        equation([2 * x, Integer(3)], [Integer(5)]),
+        equation([3 * x, Integer(2)], [Integer(5)], middle_sign='<'),
+    ]
+    fingerprints = {fingerprinter.fingerprint(e) for e in [a] + different}
+    assert len(fingerprints) == 4
+    assert fingerprinter.fingerprint('3x + 2 = 5') is None
+
+def test_open_seen_scopes(tmp_path):
+    directory = str(tmp_path)
+    seen = dedupe.open_seen(directory, 'algebra1/fall-2026')
+    seen.add('problem')
+    seen.close()
+    assert os.path.exists(os.path.join(directory, 'algebra1', 'fall-2026.seen'))
+
+    assert 'problem' in dedupe.open_seen(directory, 'algebra1/fall-2026')
+    other = dedupe.open_seen(directory, 'algebra1/spring-2027')
+    assert 'problem' not in other
+    assert len(other) == 0
+
+    bloom = dedupe.open_seen(directory, 'algebra1/fall-2026', bloom=True,
+            capacity=1000)
+    assert isinstance(bloom, dedupe.BloomFilter)
+    bloom.close()
+    assert os.path.exists(os.path.join(directory, 'algebra1', 'fall-2026.bloom'))
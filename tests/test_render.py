@@ -0,0 +1,82 @@
+import problemgen.backend as backend
+import problemgen.render as render
+
+import pytest
+
+from fractions import Fraction
+from sympy import Integer, Mul, Rational, Symbol, UnevaluatedExpr, sqrt
+
+x = Symbol('x')
+y = Symbol('y')
+a = Symbol('a')
+
+def unreduced(numerator, denominator):
+    return Mul(numerator, Rational(1, denominator), evaluate=False)
+
+def radical(coefficient, n):
+    return coefficient * sqrt(UnevaluatedExpr(n))
+
+TERMS = [
+    # ints and Integers
+    0, 7, -12, Integer(0), Integer(1), Integer(-1), Integer(345),
+    # Rationals
+    Rational(1, 2), Rational(-3, 4), Rational(22, 7), Rational(-1, 1000),
+    # monomials
+    x, -x, 3 * x, -5 * x, x ** 2, -x ** 3, 3 * x ** 2, -4 * a ** 5, 2 * y,
+    # polynomials
+    x + 1, x - 1, 1 - x, 2 - 3 * x, -x - 1, 3 * x ** 2 + 2 * x - 5,
+    -x ** 2 + x, x ** 3 - 4 * x + 7, -2 * y ** 2 - y + 1, a ** 2 + 1,
+    # radicals, evaluated or not
+    sqrt(2), sqrt(Integer(12)), 2 * sqrt(3), -5 * sqrt(7), radical(1, 8),
+    radical(3, 12), radical(-2, 9), radical(-1, 5),
+    # unreduced fractions
+    unreduced(6, 8), unreduced(3, 1), unreduced(-2, 4), unreduced(-3, 1),
+    unreduced(-2, -4), unreduced(-3, -1), unreduced(1, 12),
+]
+
+# Terms render leaves to sympy's printers
+UNSUPPORTED = [
+    x * y, x + y, Rational(1, 2) * x, x ** Rational(1, 2), sqrt(-3),
+    Symbol('xy'), 2 * x + 3 * x ** 2 * y, 'x', 1.5,
+]
+
+@pytest.mark.parametrize('term', TERMS, ids=str)
+def test_render_matches_sympy(term):
+    forms = render.render(term)
+    assert forms is not None
+    assert forms == (backend.print_str(term), backend.print_latex(term))
+
+@pytest.mark.parametrize('term', UNSUPPORTED, ids=str)
+def test_render_leaves_other_terms(term):
+    assert render.render(term) is None
+
+def test_terms_print_like_sympy():
+    for term in TERMS + UNSUPPORTED[:-2]:
+        t = backend.Term(term)
+        assert (t.str_term, t.latex_term) == (backend.print_str(t.sympy_term),
+                backend.print_latex(t.sympy_term))
+
+@pytest.mark.parametrize('numerator, denominator', [(6, 8), (5, 1), (-2, 4),
+    (-3, 1), (-2, -4), (-3, -1)])
+def test_format_unreduced_fraction(numerator, denominator):
+    term = unreduced(numerator, denominator)
+    assert render.format_unreduced_fraction(numerator, denominator) == \
+            (backend.print_str(term), backend.print_latex(term))
+
+@pytest.mark.parametrize('coefficient, n', [(1, 2), (1, 8), (4, 12), (-1, 3),
+    (-6, 50)])
+def test_format_radical(coefficient, n):
+    term = radical(coefficient, n)
+    assert render.format_radical(coefficient, n) == \
+            (backend.print_str(term), backend.print_latex(term))
+
+@pytest.mark.parametrize('value', [Fraction(3), Fraction(-4), Fraction(0),
+    Fraction(5, 6), Fraction(-7, 9)])
+def test_format_rational(value):
+    term = Rational(value.numerator, value.denominator)
+    assert render.format_rational(value) == \
+            (backend.print_str(term), backend.print_latex(term))
+
+def test_join_culls_signs():
+    assert render.join(['', '+', '-', ''], ['3', '-4', '-x']) == '3-4+x'
+    assert render.join(['', '-', '*', ''], ['-2', '+5', '-1']) == '-2-5*-1'
@@ -0,0 +1,50 @@
+import problemgen.backend as backend
+import problemgen.seeds as seeds
+import os
+import random
+
+def fields(p):
+    return (p.latex_question, p.latex_solution, p.str_question, p.str_solution)
+
+def test_problems_are_regenerated_identically(tmp_path):
+    fn = str(tmp_path / 'linear.seeds')
+    bank = seeds.SeedBank(fn)
+    random.seed(0)
+    bank.fill('linear', 15, num_lhs_terms=3)
+    bank.fill('quadratic', 5)
+    assert bank.count('linear') == 15
+    assert bank.count('linear', num_lhs_terms=3) == 15
+    assert bank.count('quadratic') == 5
+    stored = [fields(bank.get(i)) for i in range(len(bank))]
+    assert len(set(stored)) == 20
+    # Nothing is stored in the data file
+    assert os.path.getsize(fn) == 0
+
+    gen = backend.Generator()
+    for i in range(len(bank)):
+        handle = bank.handle(i)
+        assert handle.kind == ('linear' if i < 15 else 'quadratic')
+        params = bank.tags[handle.params_id][1]
+        random.seed(handle.seed)
+        problem, data = gen.gen_problem(handle.kind, **params)
+        assert fields(problem) == stored[i]
+    bank.close()
+
+    bank = seeds.SeedBank(fn, cache_size=4)
+    random.seed(1)
+    assert [fields(bank.get(i)) for i in range(len(bank))] == stored
+    drawn = [fields(p) for p in bank.draw('linear', 5)]
+    assert len(set(drawn)) == 5
+    assert set(drawn) <= set(stored[:15])
+    bank.close()
+
+def test_regenerating_keeps_the_state_of_random(tmp_path):
+    bank = seeds.SeedBank(str(tmp_path / 'linear.seeds'))
+    random.seed(0)
+    bank.fill('linear', 5)
+    random.seed(2)
+    state = random.getstate()
+    first = [fields(bank.regenerate(0, bank.handle(i).seed)) for i in range(5)]
+    assert random.getstate() == state
+    assert [fields(bank.get(i)) for i in range(5)] == first
+    bank.close()
@@ -0,0 +1,114 @@
+import problemgen.backend as backend
+import problemgen.container as container
+import problemgen.store as store
+import random
+
+import pytest
+
+from sympy import Integer, Symbol
+
+x = Symbol('x')
+y = Symbol('y')
+
+def sum_of(terms):
+    terms = [backend.Term(t) for t in terms]
+    return backend.Expression(terms, terms, [''] + ['+'] * (len(terms) - 1) + [''])
+
+def equation(lhs, rhs, middle_sign='=', variable='x'):
+    return backend.Equation(sum_of(lhs), sum_of(rhs), variable=variable,
+            middle_sign=middle_sign)
+
+def problem(str_solution):
+    return backend.Problem(('', '', '', str_solution))
+
+def generate(kind, n, **params):
+    random.seed(0)
+    c = container.ProblemContainer()
+    for i in range(n):
+        getattr(c, 'add_' + kind)(**params)
+    return c.problems
+
+def test_queries_see_default_params():
+    s = store.ProblemStore(':memory:')
+    random.seed(0)
+    s.fill('linear', 10)
+    s.fill('linear', 5, max_lowest_term=20)
+    assert s.query('linear', max_lowest_term=10).count() == 10
+    assert s.query('linear', max_lowest_term=('<=', 20)).count() == 15
+    assert s.query('linear', num_lhs_terms=2, middle_sign='=').count() == 15
+    assert s.query('linear', max_lowest_term=('<', 10)).count() == 0
+    assert store.effective_params('linear', {})['symbols'] == 'x'
+    assert store.effective_params('custom', {'a': 1}) == {'a': 1}
+    with pytest.raises(TypeError):
+        store.effective_params('linear', {'no_such_param': 1})
+    s.close()
+
+@pytest.mark.parametrize('data, attributes', [
+    # 3x + 2 = 5
+    (equation([3 * x, Integer(2)], [Integer(5)]), (1, 1)),
+    # 2x = 1
+    (equation([2 * x], [Integer(1)]), (1, 0)),
+    # x^2 + 1 = 0 has complex roots
+    (equation([x ** 2, Integer(1)], [Integer(0)]), (0, 0)),
+    # 3x + 2 < 5 is solved by an interval
+    (equation([3 * x, Integer(2)], [Integer(5)], middle_sign='<'), (0, 0)),
+    # x + y = 3, x - y = 1
+    (backend.System([equation([x, y], [Integer(3)]),
+        equation([x, -y], [Integer(1)], variable='y')]), (1, 1)),
+    # x + y = 1, x + y = 2
+    (backend.System([equation([x, y], [Integer(1)]),
+        equation([x, y], [Integer(2)], variable='y')]), (0, 0)),
+    # x + y = 1, 2x + 2y = 2
+    (backend.System([equation([x, y], [Integer(1)]),
+        equation([2 * x, 2 * y], [Integer(2)], variable='y')]), (0, 0)),
+])
+def test_attributes_from_solutions(data, attributes):
+    assert store.derive_attributes(None, data) == attributes
+
+@pytest.mark.parametrize('str_solution, attributes', [
+    ('x= 3', (1, 1)),
+    ('x = 1/2, y = 3,\n', (1, 0)),
+    ('No solution', (0, 0)),
+])
+def test_attributes_from_str_solution(str_solution, attributes):
+    assert store.derive_attributes(problem(str_solution)) == attributes
+
+def test_fill_stores_attributes():
+    s = store.ProblemStore(':memory:')
+    random.seed(0)
+    s.fill('linear', 5, middle_sign='<')
+    s.fill('quadratic', 5)
+    assert s.query('linear', has_solution=1).count() == 0
+    assert s.query('quadratic', has_solution=1, integer_solutions=1).count() == 5
+    s.close()
+
+def test_add_from_store_marks_added_problems_used(tmp_path, capsys):
+    s = store.ProblemStore(str(tmp_path / 'problems.db'))
+    problems = generate('linear', 10)
+    # Every problem is stored twice
+    s.extend(problems, 'linear')
+    s.extend(problems, 'linear')
+
+    c = container.ProblemContainer()
+    c.add_problem(problems[0])
+    c.add_from_store(s.query('linear', unused=True), 5)
+    assert len(c.problems) == 6
+    assert s.query('linear', uses=1).count() == 5
+    assert 'GeneratorError' not in capsys.readouterr().out
+
+    c.add_from_store(s.query('linear', unused=True), 5)
+    assert len(c.problems) == 10
+    assert s.query('linear', uses=1).count() == 9
+    assert 'GeneratorError: Only 4 of the 5 problems' in capsys.readouterr().out
+    s.close()
+
+def test_fetch_marks_problems_used():
+    s = store.ProblemStore(':memory:')
+    s.extend(generate('linear', 5), 'linear')
+    query = s.query('linear', unused=True)
+    assert len(query.fetch(3)) == 3
+    assert query.count() == 2
+    with pytest.raises(backend.GeneratorError):
+        query.fetch(3)
+    assert query.count() == 2
+    s.close()
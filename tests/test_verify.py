@@ -0,0 +1,18 @@
+import problemgen.container as container
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+def test_numerical_expressions_are_checked():
+    random.seed(0)
+    c = container.ProblemContainer()
+    c.enable_verification()
+    for i in range(20):
+        c.add_numerical_expression(num_terms=3, types='if', op='+-*/')
+    c.verify()
+    assert len(c.problems) == 20
+    assert c.verifier.checked == 20
+    assert c.verifier.skipped == 0
+    assert c.verifier.failures == []